@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+log = logging.getLogger(__name__)
+
+AI_STREAM            = os.environ.get("AI_STREAM", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_MIN_DELTA     = int(os.environ.get("STREAM_MIN_DELTA", "40"))
+MSG_LIMIT            = 4000
+
+
+async def iter_sse_deltas(resp):
+    # OpenAI-mos `stream=true` javobi: "data: {...}" qatorlari, oxiri "data: [DONE]"
+    async for raw in resp.content:
+        line = raw.decode("utf-8", "ignore").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        for choice in chunk.get("choices", ()):
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+
+# Chat bo'yicha tahrirlash chastotasi (Telegram limitlari chat uchun umumiy)
+_next_edit = {}
+
+
+def _edit_allowed(chat_id, now):
+    return _next_edit.get(chat_id, 0.0) <= now
+
+
+def _edit_done(chat_id, now, interval):
+    _next_edit[chat_id] = now + interval
+    if len(_next_edit) > 10000:
+        for k, t in list(_next_edit.items()):
+            if t < now:
+                del _next_edit[k]
+
+
+def _split_at(text, limit):
+    cut = text.rfind("\n", limit // 2, limit)
+    if cut < 0:
+        cut = text.rfind(" ", limit // 2, limit)
+    return cut if cut > 0 else limit
+
+
+# Placeholder xabarni tokenlar kelgan sari tahrirlaydi; limitdan oshsa yangi xabarga o'tadi
+class StreamEditor:
+    def __init__(self, bot, message, interval=STREAM_EDIT_INTERVAL, limit=MSG_LIMIT):
+        self.bot = bot
+        self.chat_id = message.chat.id
+        self.message_id = message.message_id
+        self.interval = interval
+        self.limit = limit
+        self.parts = []           # yakunlangan xabarlar matni
+        self.text = ""            # joriy xabar matni
+        self.shown = ""
+        self.edits = 0
+        self.messages = 1
+
+    @property
+    def full_text(self):
+        return "".join(self.parts) + self.text
+
+    async def feed(self, delta):
+        self.text += delta
+        while len(self.text) > self.limit:
+            cut = _split_at(self.text, self.limit)
+            head, self.text = self.text[:cut], self.text[cut:]
+            await self._edit(head, force=True)
+            self.parts.append(head)
+            self.text = self.text.lstrip("\n")
+            sent = await self.bot.send_message(self.chat_id, self.text or "…")
+            self.message_id = sent.message_id
+            self.shown = self.text or "…"
+            self.messages += 1
+        if len(self.text) - len(self.shown) >= STREAM_MIN_DELTA:
+            await self._edit(self.text)
+
+    async def finish(self, suffix=""):
+        await self._edit(self.text + suffix, force=True)
+        return self.full_text
+
+    async def _edit(self, text, force=False):
+        text = text.strip()
+        if not text or text == self.shown:
+            return
+        now = time.monotonic()
+        if not force and not _edit_allowed(self.chat_id, now):
+            return
+        if force:
+            wait = _next_edit.get(self.chat_id, 0.0) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+            self.shown = text
+            self.edits += 1
+            _edit_done(self.chat_id, time.monotonic(), self.interval)
+        except TelegramRetryAfter as e:
+            _edit_done(self.chat_id, time.monotonic(), e.retry_after)
+            if force:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, force=True)
+        except TelegramBadRequest as e:
+            # "message is not modified" va shunga o'xshashlar
+            log.debug(f"Stream edit: {e}")
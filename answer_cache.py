@@ -0,0 +1,179 @@
+import os
+import re
+import sys
+import time
+import zlib
+import hashlib
+import random
+from functools import lru_cache
+from collections import OrderedDict
+
+ANSWER_CACHE_TTL   = float(os.environ.get("ANSWER_CACHE_TTL", "21600"))
+ANSWER_CACHE_ITEMS = int(os.environ.get("ANSWER_CACHE_ITEMS", "20000"))
+ANSWER_CACHE_BYTES = int(os.environ.get("ANSWER_CACHE_BYTES", str(64 * 1024 * 1024)))
+ANSWER_NEAR_MIN    = float(os.environ.get("ANSWER_NEAR_MIN", "0.85"))
+ANSWER_NEAR_CHARS  = int(os.environ.get("ANSWER_NEAR_CHARS", "300"))    # uzunroq savollar faqat aniq moslik
+
+# MinHash: 64 ta hash, LSH uchun 16 band x 4 qator
+NUM_PERM = 64
+BANDS    = 16
+ROWS     = NUM_PERM // BANDS
+_PRIME   = (1 << 61) - 1
+_rng     = random.Random(0x6A61766F)
+_PERMS   = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WORD_RE  = re.compile(r"\w+", re.UNICODE)
+_DIGIT_RE = re.compile(r"\d+")
+
+
+def normalize_prompt(text):
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def shingles(norm, k=3):
+    s = f" {norm} "
+    if len(s) <= k:
+        return {zlib.crc32(s.encode())}
+    return {zlib.crc32(s[i:i + k].encode()) for i in range(len(s) - k + 1)}
+
+
+def minhash(sh):
+    return tuple(min((a * x + b) % _PRIME for x in sh) for a, b in _PERMS)
+
+
+@lru_cache(maxsize=256)
+def signature(norm):
+    # Event loop da ishlaydi (~25 mks/belgi) — shuning uchun faqat qisqa savollar uchun;
+    # get va undan keyingi put bitta hisobdan foydalanadi
+    return minhash(shingles(norm))
+
+
+def similarity(sig1, sig2):
+    return sum(1 for a, b in zip(sig1, sig2) if a == b) / NUM_PERM
+
+
+class _Entry:
+    __slots__ = ("ns", "norm", "answer", "sig", "bands", "expires", "latency", "size")
+
+    def __init__(self, ns, norm, answer, sig, bands, expires, latency):
+        self.ns = ns
+        self.norm = norm
+        self.answer = answer
+        self.sig = sig
+        self.bands = bands
+        self.expires = expires
+        self.latency = latency
+        self.size = sys.getsizeof(norm) + sys.getsizeof(answer) + 8 * (NUM_PERM + BANDS) + 200
+
+
+# Bir martalik (tarixsiz) AI so'rovlar uchun javob keshi: aniq va yaqin-dublikat moslik.
+# Kalit: til + system prompt; yaqinlik — belgi 3-gramlari ustida MinHash/LSH (tashqi xizmatsiz),
+# faqat near_chars dan qisqa savollar uchun.
+class AnswerCache:
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_items=ANSWER_CACHE_ITEMS,
+                 max_bytes=ANSWER_CACHE_BYTES, near_min=ANSWER_NEAR_MIN, near_chars=ANSWER_NEAR_CHARS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.near_min = near_min
+        self.near_chars = near_chars
+        self._items = OrderedDict()     # (ns, norm) -> _Entry
+        self._lsh = {}                  # (ns, band, hash) -> set of (ns, norm)
+        self.bytes = 0
+        self.hits_exact = 0
+        self.hits_near = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def namespace(lang, system):
+        return f"{lang}:{hashlib.sha1(system.encode()).hexdigest()[:12]}"
+
+    def _key(self, lang, system, prompt):
+        ns = self.namespace(lang, system)
+        norm = normalize_prompt(prompt)
+        # Raqamlar boshqacha bo'lsa ("2+2" va "2+3") yaqin-dublikat hisoblanmaydi
+        ns = f"{ns}:{','.join(_DIGIT_RE.findall(norm))}"
+        return ns, norm
+
+    def get(self, lang, system, prompt):
+        ns, norm = self._key(lang, system, prompt)
+        if not norm:
+            return None
+        now = time.monotonic()
+        e = self._items.get((ns, norm))
+        if e is not None and e.expires > now:
+            self._items.move_to_end((ns, norm))
+            self.hits_exact += 1
+            self.latency_saved += e.latency
+            return e.answer
+        if e is not None:
+            self._remove((ns, norm))
+        e = self._near(ns, norm, now) if len(norm) <= self.near_chars else None
+        if e is not None:
+            self._items.move_to_end((e.ns, e.norm))
+            self.hits_near += 1
+            self.latency_saved += e.latency
+            return e.answer
+        self.misses += 1
+        return None
+
+    def _near(self, ns, norm, now):
+        sig = signature(norm)
+        seen = set()
+        best, best_sim = None, self.near_min
+        for b in range(BANDS):
+            for key in self._lsh.get((ns, b, hash(sig[b * ROWS:(b + 1) * ROWS])), ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                e = self._items.get(key)
+                if e is None or e.expires <= now:
+                    continue
+                sim = similarity(sig, e.sig)
+                if sim >= best_sim:
+                    best, best_sim = e, sim
+        return best
+
+    def put(self, lang, system, prompt, answer, latency=0.0):
+        ns, norm = self._key(lang, system, prompt)
+        if not norm or not answer:
+            return
+        key = (ns, norm)
+        if key in self._items:
+            self._remove(key)
+        if len(norm) <= self.near_chars:
+            sig = signature(norm)
+            bands = [(ns, b, hash(sig[b * ROWS:(b + 1) * ROWS])) for b in range(BANDS)]
+        else:
+            sig, bands = (), []
+        e = _Entry(ns, norm, answer, sig, bands, time.monotonic() + self.ttl, latency)
+        self._items[key] = e
+        self.bytes += e.size
+        for band in bands:
+            self._lsh.setdefault(band, set()).add(key)
+        while self._items and (len(self._items) > self.max_items or self.bytes > self.max_bytes):
+            self._remove(next(iter(self._items)))
+
+    def _remove(self, key):
+        e = self._items.pop(key, None)
+        if e is None:
+            return
+        self.bytes -= e.size
+        for band in e.bands:
+            bucket = self._lsh.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._lsh[band]
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        hits = self.hits_exact + self.hits_near
+        total = hits + self.misses
+        return {"size": len(self._items), "bytes": self.bytes, "hits_exact": self.hits_exact,
+                "hits_near": self.hits_near, "misses": self.misses,
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+                "latency_saved": round(self.latency_saved, 1)}
@@ -0,0 +1,118 @@
+# Tarqatma yuklama testi: soxta Bot API server global flood limitini (429 + retry_after),
+# bloklagan foydalanuvchilarni (403) va tarmoq kechikishini taqlid qiladi.
+# Yarmida "jarayon" to'xtatiladi, yangisi checkpointdan davom ettiradi.
+#   python -m benchmarks.bench_broadcast [--users 5000] [--rps 250] [--server-rps 300] [--blocked 0.03]
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import broadcast
+from broadcast import Broadcaster
+from user_store import UserStore
+
+PORT = 18091
+
+
+def fake_api(args, delivered, counters):
+    blocked = set(random.sample(range(1, args.users + 1), int(args.users * args.blocked)))
+    bucket = {"tokens": float(args.server_rps), "stamp": time.monotonic()}
+
+    async def method(request):
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        now = time.monotonic()
+        bucket["tokens"] = min(args.server_rps, bucket["tokens"] + (now - bucket["stamp"]) * args.server_rps)
+        bucket["stamp"] = now
+        if bucket["tokens"] < 1:
+            counters["429"] += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        bucket["tokens"] -= 1
+        await asyncio.sleep(random.uniform(0.02, 0.08))
+        if chat_id in blocked:
+            counters["403"] += 1
+            return web.json_response({"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}, status=403)
+        delivered[chat_id] += 1
+        return web.json_response({"ok": True, "result": {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "x"}})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", method)
+    return app, blocked
+
+
+async def wait_job(b, stop_at=None):
+    while True:
+        job = await b.current()
+        if job.status != "running" or (stop_at and job.done >= stop_at):
+            return job
+        await asyncio.sleep(0.2)
+
+
+async def run(args):
+    random.seed(1)
+    broadcast.BROADCAST_CHECKPOINT = 0.5
+    broadcast.BROADCAST_LEASE = 2
+    tmp = tempfile.mkdtemp()
+    users = UserStore(os.path.join(tmp, "users.sqlite3"))
+    users.open()
+    for uid in range(1, args.users + 1):
+        await users.touch(uid, f"u{uid}", "-")
+    # Ataylab flush qilinmaydi: hali yozilmagan foydalanuvchilar ham tarqatmaga tushishi kerak
+
+    delivered, counters = Counter(), Counter()
+    app, blocked = fake_api(args, delivered, counters)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    bot = Bot("1:bench", session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}")))
+    db = os.path.join(tmp, "broadcasts.sqlite3")
+    try:
+        t = time.perf_counter()
+        first = Broadcaster(bot, users, db, rps=args.rps, concurrency=args.concurrency)
+        first.open()
+        job = await first.create(admin_chat=0, text="Yangilik!")
+        job = await wait_job(first, stop_at=int(args.users * args.crash_at))
+        print(f"process 1 stopped at {job.done}/{job.total} (cursor uid {job.cursor})")
+        await first.close()
+
+        second = Broadcaster(bot, users, db, rps=args.rps, concurrency=args.concurrency)
+        second.open()
+        await second.start()
+        await asyncio.sleep(0.1)
+        job = await wait_job(second)
+        elapsed = time.perf_counter() - t
+        await second.close()
+        await users.flush()
+
+        dup = sum(1 for n in delivered.values() if n > 1)
+        missing = sum(1 for uid in range(1, args.users + 1) if uid not in blocked and not delivered[uid])
+        print(f"process 2 finished: {job.status}")
+        print(f"{'users':>7} {'sent':>7} {'blocked':>8} {'429':>6} {'dup':>5} {'missing':>8} {'secs':>7} {'msg/s':>7}")
+        print(f"{args.users:>7} {sum(delivered.values()):>7} {counters['403']:>8} {counters['429']:>6} "
+              f"{dup:>5} {missing:>8} {elapsed:>7.1f} {sum(delivered.values()) / elapsed:>7.1f}")
+        # Bazadan: nofaollar boshqa jarayon xotirasida bo'lmasa ham belgilanadi
+        print(f"inactive after run: {args.users - users.recipient_count()} (blocked {len(blocked)})")
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+        await users.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=5000)
+    ap.add_argument("--rps", type=float, default=250)
+    ap.add_argument("--server-rps", type=float, default=300)
+    ap.add_argument("--concurrency", type=int, default=30)
+    ap.add_argument("--blocked", type=float, default=0.03)
+    ap.add_argument("--crash-at", type=float, default=0.4)
+    asyncio.run(run(ap.parse_args()))
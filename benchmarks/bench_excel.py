@@ -0,0 +1,119 @@
+# Excel generatori: qatorlar/s va RSS cho'qqisi. Har holat alohida jarayonda (ru_maxrss toza bo'lishi
+# uchun). Sodda yo'l — butun jadval ro'yxatga, varaq XML i bitta satrga yig'iladi; oqimli yo'l —
+# excel_engine.convert (spool fayldan satrma-satr, XML zip ga bo'laklab). Natija XLSX qayta ochilib
+# tekshiriladi (zip + XML tahlili, qatorlar soni).
+#   python -m benchmarks.bench_excel [--rows 1000 10000 50000 200000] [--modes naive xlsx csv]
+import os
+import sys
+import time
+import random
+import zipfile
+import argparse
+import resource
+import tempfile
+import subprocess
+from xml.etree import ElementTree
+
+import excel_engine
+from excel_engine import convert, read_rows, parse_cell, col_name, CONTENT_TYPES, ROOT_RELS, WORKBOOK, WORKBOOK_RELS, STYLES
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+CITIES = ["Toshkent", "Samarqand", "Buxoro", "Namangan", "Andijon", "Farg'ona", "Qarshi", "Nukus"]
+NAMES = ["Ali", "Vali", "Dilnoza", "Sardor", "Madina", "Jasur", "Nodira", "Bekzod"]
+
+
+def make_csv(path, n, seed=1):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Ism;Yosh;Shahar;Telefon;Sana;Summa;Ulush;Izoh\n")
+        for i in range(n):
+            f.write(f"{rng.choice(NAMES)};{rng.randint(18, 80)};{rng.choice(CITIES)};0{rng.randint(900000000, 999999999)};"
+                    f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2000, 2026)};"
+                    f"{rng.randint(1, 9)} {rng.randint(0, 999):03d},{rng.randint(0, 99):02d};{rng.randint(0, 100)}%;"
+                    f"\"izoh; {i}\"\n")
+
+
+def naive(src, out):
+    # Odatiy yondashuv: hammasi xotirada, keyin bitta writestr
+    with open(src, encoding="utf-8") as f:
+        rows = list(read_rows(f.read().splitlines()))
+    xml = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>']
+    for r, row in enumerate(rows, 1):
+        cells = []
+        for i, c in enumerate(row):
+            kind, value, style = parse_cell(c)
+            ref = f"{col_name(i)}{r}"
+            s = f' s="{style}"' if style else ""
+            if kind == "s":
+                cells.append(f'<c r="{ref}" t="inlineStr"{s}><is><t>{excel_engine.escape(value)}</t></is></c>')
+            else:
+                cells.append(f'<c r="{ref}"{s}><v>{value}</v></c>')
+        xml.append(f'<row r="{r}">{"".join(cells)}</row>')
+    xml.append("</sheetData></worksheet>")
+    sheet = "".join(xml)
+    path = out + ".xlsx"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, body in (("[Content_Types].xml", CONTENT_TYPES), ("_rels/.rels", ROOT_RELS),
+                           ("xl/workbook.xml", WORKBOOK.format(names="")), ("xl/_rels/workbook.xml.rels", WORKBOOK_RELS),
+                           ("xl/styles.xml", STYLES), ("xl/worksheets/sheet1.xml", sheet)):
+            z.writestr(name, body)
+    return path, "xlsx", len(rows)
+
+
+def check_xlsx(path):
+    # Varaqni oqim bilan tahlil qilib qatorlarni sanaydi (XML buzilgan bo'lsa xato beradi)
+    n = 0
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        ElementTree.fromstring(z.read("xl/workbook.xml"))
+        ElementTree.fromstring(z.read("xl/styles.xml"))
+        with z.open("xl/worksheets/sheet1.xml") as f:
+            for _, el in ElementTree.iterparse(f):
+                if el.tag == NS + "row":
+                    n += 1
+                    el.clear()
+    return n
+
+
+def child(mode, src, out):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    if mode == "naive":
+        path, fmt, rows = naive(src, out)
+    else:
+        path, fmt, rows, _, _ = convert(src, True, out, mode)
+    elapsed = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    size = os.path.getsize(path)
+    checked = check_xlsx(path) if fmt == "xlsx" else rows
+    os.remove(path)
+    print(f"{rows} {elapsed} {base} {peak} {size} {checked} {fmt}")
+
+
+def run(args):
+    tmp = tempfile.mkdtemp(prefix="bench_excel_")
+    print(f"{'rows':>7} {'mode':<6} | {'secs':>6} {'rows/s':>8} | {'RSS base':>9} {'RSS peak':>9} {'growth':>8} | {'out KB':>7} {'check':>6}")
+    for n in args.rows:
+        src = os.path.join(tmp, f"in_{n}.csv")
+        make_csv(src, n)
+        for mode in args.modes:
+            out = subprocess.run([sys.executable, "-m", "benchmarks.bench_excel", "--child", mode, src,
+                                  os.path.join(tmp, f"out_{n}_{mode}")], capture_output=True, text=True, check=True)
+            rows, elapsed, base, peak, size, checked, fmt = out.stdout.split()[-7:]
+            rows, elapsed, base, peak = int(rows), float(elapsed), int(base), int(peak)
+            ok = "ok" if int(checked) == rows else "FAIL"
+            print(f"{n:>7} {mode:<6} | {elapsed:>6.2f} {rows / elapsed:>8.0f} | {base // 1024:>6} MB {peak // 1024:>6} MB "
+                  f"{(peak - base) // 1024:>5} MB | {int(size) // 1024:>7} {ok:>6}")
+        os.remove(src)
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+        sys.exit()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000, 200000])
+    ap.add_argument("--modes", nargs="+", default=["naive", "xlsx", "csv"])
+    run(ap.parse_args())
@@ -0,0 +1,324 @@
+# Oflayn yuklama sinovi: bot.py o'zgarishsiz (polling) lokal soxta Telegram, Groq va Gemini serverlariga
+# ulanadi (benchmarks/fakes.py). Yopiq tsikldagi sintetik foydalanuvchilar /start -> til -> aralash
+# funksiyalar (AI matn/ovoz/rasm, QR, PDF, TTS, inline) yuboradi. Natija: yangilanishlar/s, handler
+# bo'yicha p50/p95/p99 (navbatga qo'yilgandan handler tugaguncha), event loop kechikishi, upstream
+# chaqiruvlari. --save bilan JSON baza, --compare bilan unga nisbatan farq (regressiya tekshiruvi).
+#   python -m benchmarks.bench_load [--users 100] [--duration 60] [--profile normal|slow|flaky|outage]
+#                                   [--mix ai=40,qr=20,pdf=10,tts=10,inline=20] [--save base.json] [--compare base.json]
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+
+from benchmarks.fakes import Profile, FakeTelegram, FakeGroq, FakeGemini, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TG_PORT, GROQ_PORT, GEMINI_PORT = 18095, 18096, 18097
+TOKEN = "123:load"
+LANG_BTN = "\U0001f1fa\U0001f1ff O'zbek"
+# Kechikish profillari (s): Telegram, Groq chat (birinchi tokengacha), Whisper, Gemini
+PROFILES = {
+    "normal": dict(tg=Profile(0.02, 0.01), groq=Profile(0.25, 0.05), whisper=Profile(0.4, 0.1),
+                   gemini=Profile(0.6, 0.2)),
+    "slow":   dict(tg=Profile(0.08, 0.04, slow=0.02, slow_latency=1.0), groq=Profile(1.0, 0.5, slow=0.1, slow_latency=6),
+                   whisper=Profile(1.5, 0.5), gemini=Profile(2.0, 1.0)),
+    "flaky":  dict(tg=Profile(0.03, 0.02, error=0.01, flood=0.01), groq=Profile(0.3, 0.1, error=0.1, flood=0.05),
+                   whisper=Profile(0.4, 0.1, error=0.1), gemini=Profile(0.6, 0.2, error=0.05, flood=0.05)),
+    # Groq butunlay ishlamaydi — matn Gemini ga o'tishi kerak
+    "outage": dict(tg=Profile(0.02, 0.01), groq=Profile(0.1, error=1.0), whisper=Profile(0.1, error=1.0),
+                   gemini=Profile(0.8, 0.3)),
+}
+QUESTIONS = ["Toshkent qayerda joylashgan?", "Python nima?", "Eng baland tog' qaysi?", "Menga qisqa she'r yoz",
+             "Kitob tavsiya qil", "Ingliz tilini qanday o'rganay?", "Quyosh nima uchun issiq?", "Salom!"]
+INLINE = ["O'zbekiston poytaxti", "Python dasturlash", "Eng katta okean", "Yer yoshi"]
+PARAGRAPH = ("Bu sinov matni. Bot PDF hujjatni bir nechta qismdan yig'adi, har bir qism alohida xabar "
+             "sifatida keladi va satrlarga bo'linadi. ")
+
+
+def pct(xs, q):
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else 0.0
+
+
+def make_photo(width=1280, height=960):
+    from PIL import Image
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class Load:
+    def __init__(self, bot_module, tg, args):
+        self.bot = bot_module
+        self.tg = tg
+        self.args = args
+        self.t = bot_module.T["uz"]
+        self.waiters = {}                   # update_id -> Future (handler tugashi)
+        self.names = {}                     # update_id -> handler nomi
+        self.latency = defaultdict(list)
+        self.errors = Counter()
+        self.timeouts = 0
+        self.done = 0
+        self.lag = []
+        self.voice_ids = []
+        self.photo_id = None
+
+    def instrument(self):
+        dp = self.bot.dp
+        feed = dp.feed_update
+
+        # Eng ichki middleware: qaysi handler tanlanganini yozib qo'yadi
+        async def tag(handler, event, data):
+            self.names[data["event_update"].update_id] = data["handler"].callback.__name__
+            return await handler(event, data)
+        for observer in (dp.message, dp.callback_query, dp.inline_query):
+            observer.middleware(tag)
+
+        async def feed_update(bot, update, **kwargs):
+            failed = False
+            try:
+                return await feed(bot, update, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.finish(update.update_id, failed)
+        dp.feed_update = feed_update
+
+    def finish(self, update_id, failed):
+        # Handlerga yetmagan (band/tashlangan yoki mos handler yo'q) yangilanishlar alohida
+        name = self.names.pop(update_id, "(not handled)")
+        self.latency[name].append(time.perf_counter() - self.tg.pushed.pop(update_id))
+        self.done += 1
+        if failed:
+            self.errors[name] += 1
+        fut = self.waiters.pop(update_id, None)
+        if fut is not None and not fut.done():
+            fut.set_result(None)
+
+    async def wait(self, update_id):
+        fut = self.waiters[update_id] = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(fut, 120)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+
+    async def say(self, uid, text):
+        await self.wait(self.tg.push_message(uid, text))
+
+    async def voice(self, uid, rng):
+        # Bir nechta xil ovoz: file_unique_id keshi faqat qisman tushadi
+        await self.wait(self.tg.push_message(uid, voice=self.tg.voice(rng.choice(self.voice_ids), 8)))
+
+    async def photo(self, uid, rng):
+        await self.wait(self.tg.push_message(uid, photo=self.tg.photo(self.photo_id, 1280, 960),
+                                             caption=rng.choice(["", "Bu nima?"])))
+
+    async def think(self, rng):
+        await asyncio.sleep(rng.expovariate(1 / self.args.think))
+
+    # ─── foydalanuvchi ssenariylari ─────────────────────────────────────────
+    async def ai(self, uid, rng):
+        await self.say(uid, self.t["ai_btn"])
+        for _ in range(rng.randint(1, 3)):
+            await self.think(rng)
+            r = rng.random()
+            if r < 0.1:
+                await self.voice(uid, rng)
+            elif r < 0.2:
+                await self.photo(uid, rng)
+            else:
+                await self.say(uid, rng.choice(QUESTIONS))
+        await self.say(uid, self.t["back_btn"])
+
+    async def qr(self, uid, rng):
+        await self.say(uid, self.t["qr_btn"])
+        for _ in range(rng.randint(1, 3)):
+            await self.think(rng)
+            if rng.random() < 0.1:
+                await self.say(uid, "\n".join(f"https://example.com/{rng.randint(0, 500)}" for _ in range(3)))
+            else:
+                await self.say(uid, f"https://example.com/{rng.randint(0, 200)}")
+        await self.say(uid, self.t["back_btn"])
+
+    async def pdf(self, uid, rng):
+        await self.say(uid, self.t["pdf_btn"])
+        for _ in range(rng.randint(1, 3)):
+            await self.think(rng)
+            await self.say(uid, PARAGRAPH * rng.randint(1, 20))
+        await self.wait(self.tg.push_callback(uid, "pdf_create"))
+        await self.say(uid, self.t["back_btn"])
+
+    async def tts(self, uid, rng):
+        await self.say(uid, self.t["tts_btn"])
+        await self.think(rng)
+        await self.say(uid, PARAGRAPH * rng.randint(1, 5))
+        await self.say(uid, self.t["back_btn"])
+
+    async def inline(self, uid, rng):
+        # Yozish jarayoni: har bir prefiks alohida inline_query, faqat oxirgisi kutiladi
+        query = rng.choice(INLINE)
+        cuts = sorted(rng.sample(range(3, len(query)), 2)) + [len(query)]
+        for cut in cuts[:-1]:
+            self.tg.push_inline(uid, query[:cut])
+            await asyncio.sleep(rng.uniform(0.1, 0.3))
+        await self.wait(self.tg.push_inline(uid, query))
+
+    async def user(self, uid, flows, weights, deadline):
+        rng = random.Random(uid)
+        await asyncio.sleep(rng.uniform(0, self.args.ramp))
+        await self.say(uid, "/start")
+        await self.say(uid, LANG_BTN)
+        while time.perf_counter() < deadline:
+            await rng.choices(flows, weights)[0](uid, rng)
+            await self.think(rng)
+
+    async def probe(self, stop):
+        # Event loop kechikishi: 50 ms uyqu qancha kechikib uyg'onadi
+        while not stop.is_set():
+            t = time.perf_counter()
+            await asyncio.sleep(0.05)
+            self.lag.append(time.perf_counter() - t - 0.05)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def configure(args):
+    prof = PROFILES[args.profile]
+    for key, attr, value in (("tg", "latency", args.tg_latency), ("tg", "error", args.tg_error),
+                             ("groq", "latency", args.groq_latency), ("groq", "error", args.groq_error),
+                             ("gemini", "latency", args.gemini_latency), ("gemini", "error", args.gemini_error)):
+        if value is not None:
+            setattr(prof[key], attr, value)
+    return prof
+
+
+def summary(load, elapsed):
+    lag = sorted(load.lag)
+    handlers = {}
+    for name, xs in sorted(load.latency.items(), key=lambda kv: -len(kv[1])):
+        xs.sort()
+        handlers[name] = {"count": len(xs), "p50": pct(xs, 0.5), "p95": pct(xs, 0.95), "p99": pct(xs, 0.99),
+                          "errors": load.errors[name]}
+    return {"throughput": load.done / elapsed, "updates": load.done, "timeouts": load.timeouts,
+            "lag": {"p50": pct(lag, 0.5), "p99": pct(lag, 0.99), "max": lag[-1] if lag else 0.0},
+            "handlers": handlers}
+
+
+def report(res, base=None):
+    def delta(cur, old, sign=1):
+        # sign=-1: kamayish yomon (o'tkazuvchanlik)
+        if not old:
+            return ""
+        d = (cur - old) / old * 100
+        return f" {d:+5.0f}%" + (" !" if d * sign > 20 else "  ")
+    bh = base["handlers"] if base else {}
+    print(f"updates {res['updates']} ({res['throughput']:.1f}/s{delta(res['throughput'], base and base['throughput'], -1)}) "
+          f"timeouts {res['timeouts']}")
+    print(f"{'handler':<22} {'count':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'errors':>6}" + ("  p95 vs base" if base else ""))
+    for name, h in res["handlers"].items():
+        old = bh.get(name, {}).get("p95")
+        print(f"{name:<22} {h['count']:>6} {h['p50'] * 1000:>7.0f} {h['p95'] * 1000:>7.0f} {h['p99'] * 1000:>7.0f} "
+              f"{h['errors']:>6}" + (f"  {delta(h['p95'], old)}" if base else ""))
+    lag = res["lag"]
+    print(f"loop lag ms: p50 {lag['p50'] * 1000:.1f}  p99 {lag['p99'] * 1000:.1f}  max {lag['max'] * 1000:.1f}"
+          + (f"  (p99{delta(lag['p99'], base['lag']['p99'])})" if base else ""))
+
+
+async def run(args):
+    prof = configure(args)
+    mix = parse_mix(args.mix)
+    tg = FakeTelegram(prof["tg"])
+    groq = FakeGroq(prof["groq"], prof["whisper"])
+    gemini = FakeGemini(prof["gemini"])
+    runners = [await serve(tg.app(), TG_PORT), await serve(groq.app(), GROQ_PORT),
+               await serve(gemini.app(), GEMINI_PORT)]
+    from benchmarks.bench_voice import make_voice
+    import bot
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.CRITICAL)
+    load = Load(bot, tg, args)
+    load.instrument()
+    load.voice_ids = [tg.add_file(make_voice(8, seed), "ogg") for seed in range(20)]
+    load.photo_id = tg.add_file(make_photo(), "jpg")
+    flows = [getattr(load, name) for name in mix]
+    stop = asyncio.Event()
+    polling = asyncio.create_task(bot.main())
+    probe = asyncio.create_task(load.probe(stop))
+    print(f"profile {args.profile}: {args.users} users, {args.duration:.0f} s, think {args.think} s, mix {args.mix}")
+    t0 = time.perf_counter()
+    users = [asyncio.create_task(load.user(uid, flows, list(mix.values()), t0 + args.duration))
+             for uid in range(1000, 1000 + args.users)]
+    try:
+        # Muddat tugagach yangi ssenariy boshlanmaydi; boshlanganlari tugashi kutiladi
+        done, pending = await asyncio.wait(users, timeout=args.duration + 120)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+        elapsed = time.perf_counter() - t0
+    finally:
+        stop.set()
+        await probe
+        await bot.dp.stop_polling()
+        await polling
+        for runner in runners:
+            await runner.cleanup()
+    res = summary(load, elapsed)
+    res.update(profile=args.profile, users=args.users, mix=args.mix)
+    base = None
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+    report(res, base)
+    print("telegram: " + " ".join(f"{k}={v}" for k, v in tg.calls.most_common()) +
+          (f" | faults {dict(tg.faults)}" if tg.faults else ""))
+    print(f"groq: {dict(groq.calls)} faults {dict(groq.faults)} | gemini: {dict(gemini.calls)} faults {dict(gemini.faults)}")
+    st = bot.sched.stats()
+    print(f"scheduler: busy={st['busy']} shed={st['shed']} dropped={st['chat_dropped']} heavy wait avg={st['wait_avg']}s "
+          f"max={st['wait_max']}s | router {bot.text_router.stats()['failovers']} failovers")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(res, f, indent=1)
+        print(f"baseline saved: {args.save}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--duration", type=float, default=60, help="yangi ssenariylar boshlanadigan vaqt (s)")
+    ap.add_argument("--think", type=float, default=2.0, help="o'rtacha o'ylash vaqti (s, eksponensial)")
+    ap.add_argument("--ramp", type=float, default=5.0, help="foydalanuvchilar shu oraliqda qo'shiladi (s)")
+    ap.add_argument("--profile", choices=list(PROFILES), default="normal")
+    ap.add_argument("--mix", default="ai=40,qr=20,pdf=10,tts=10,inline=20")
+    for name in ("tg", "groq", "gemini"):
+        ap.add_argument(f"--{name}-latency", type=float)
+        ap.add_argument(f"--{name}-error", type=float)
+    ap.add_argument("--save", help="natijani JSON baza sifatida saqlash")
+    ap.add_argument("--compare", help="JSON bazaga nisbatan farq (p95 +20% dan oshsa '!')")
+    ap.add_argument("--verbose", action="store_true", help="bot loglari")
+    args = ap.parse_args()
+    # Bot import qilinishidan oldin: soxta serverlar, stub TTS, isitishsiz, vaqtinchalik ish katalogi
+    os.environ.update(BOT_TOKEN=TOKEN, BOT_MODE="polling", TELEGRAM_API_URL=f"http://127.0.0.1:{TG_PORT}",
+                      GROQ_BASE_URL=f"http://127.0.0.1:{GROQ_PORT}", GEMINI_BASE_URL=f"http://127.0.0.1:{GEMINI_PORT}",
+                      GROQ_API_KEY="x", GEMINI_API_KEY="x", TTS_BACKEND="stub", WARMUP_DELAY="0")
+    sys.path.insert(0, ROOT)
+    for key in ("save", "compare"):
+        if getattr(args, key):
+            setattr(args, key, os.path.abspath(getattr(args, key)))
+    with tempfile.TemporaryDirectory() as cwd:
+        os.chdir(cwd)
+        asyncio.run(run(args))
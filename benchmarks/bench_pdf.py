@@ -0,0 +1,91 @@
+# PDF renderlash: 1, 10, 100 sahifa — vaqt va eng yuqori xotira.
+#   python -m benchmarks.bench_pdf [--pages 1 10 100] [--pool process]
+import time
+import asyncio
+import argparse
+import resource
+import tracemalloc
+
+import pdf_engine
+from pdf_engine import PDFEngine, render_pdf, layout_part, emit_pdf, spool_path, spool_discard
+
+LINES_PER_PAGE = 36
+LINE = "Salom dunyo! Привет мир! Hello world — bu sinov matni, PDF benchmark uchun. "
+
+
+def make_text(pages):
+    return "\n".join(f"{i:05d} {LINE}" for i in range(pages * LINES_PER_PAGE))
+
+
+def bench_inline(pages_list):
+    print(f"{'pages':>6} {'first ms':>9} {'warm ms':>9} {'peak MB':>8} {'pdf KB':>7}")
+    pdf_engine.load_font()
+    for pages in pages_list:
+        text = make_text(pages)
+        t = time.perf_counter()
+        render_pdf(text, "01.01.2026 00:00")
+        first = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        doc = render_pdf(text, "01.01.2026 00:00")
+        warm = (time.perf_counter() - t) * 1000
+        # Xotira alohida o'lchanadi — tracemalloc vaqtni sekinlashtiradi
+        tracemalloc.start()
+        render_pdf(text, "01.01.2026 00:00")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{pages:>6} {first:>9.1f} {warm:>9.1f} {peak / 2**20:>8.1f} {len(doc) / 1024:>7.1f}")
+    print(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+def bench_incremental(pages_list):
+    # pdf_collect rejimi: har bir sahifa alohida qism, "Create PDF" faqat emit qiladi
+    print(f"\n{'pages':>6} {'per part ms':>12} {'finalize ms':>12}")
+    for pages in pages_list:
+        spool_discard("bench")
+        part = make_text(1)
+        t = time.perf_counter()
+        for i in range(pages):
+            layout_part(spool_path("bench", i), part)
+        per_part = (time.perf_counter() - t) * 1000 / pages
+        t = time.perf_counter()
+        emit_pdf([spool_path("bench", i) for i in range(pages)], "01.01.2026 00:00")
+        print(f"{pages:>6} {per_part:>12.1f} {(time.perf_counter() - t) * 1000:>12.1f}")
+    spool_discard("bench")
+
+
+async def bench_pool(pages_list, pool):
+    engine = PDFEngine(kind=pool)
+    try:
+        await engine.render(0, "warmup", "-")
+        print(f"\n{'pages':>6} {'pool ms':>9} {'loop lag ms':>12}   ({pool} pool)")
+        for pages in pages_list:
+            text = make_text(pages)
+            lag = 0.0
+            stop = False
+
+            async def ticker():
+                nonlocal lag
+                while not stop:
+                    t = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lag = max(lag, (time.perf_counter() - t - 0.01) * 1000)
+
+            tick = asyncio.create_task(ticker())
+            t = time.perf_counter()
+            await engine.render(1, text, "01.01.2026 00:00")
+            ms = (time.perf_counter() - t) * 1000
+            stop = True
+            await tick
+            print(f"{pages:>6} {ms:>9.1f} {lag:>12.1f}")
+    finally:
+        await engine.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--pool", default="process", choices=["thread", "process"])
+    args = ap.parse_args()
+    bench_inline(args.pages)
+    bench_incremental(args.pages)
+    asyncio.run(bench_pool(args.pages, args.pool))
@@ -0,0 +1,58 @@
+# QR chizish vaqti payload uzunligiga nisbatan.
+#   python -m benchmarks.bench_qr [--repeat 5] [--pool thread|process]
+import time
+import asyncio
+import argparse
+import statistics
+
+from qr_engine import QREngine, render_qr
+
+LENGTHS = [10, 50, 100, 250, 500, 1000, 2000]
+
+
+def payload(n):
+    base = "https://example.com/?q="
+    return (base + "x" * n)[:max(n, 1)]
+
+
+def bench_direct(repeat):
+    print(f"{'len':>6} {'direct ms':>10} {'png bytes':>10}")
+    for n in LENGTHS:
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            png = render_qr(payload(n))
+            times.append((time.perf_counter() - t) * 1000)
+        print(f"{n:>6} {statistics.median(times):>10.2f} {len(png):>10}")
+
+
+async def bench_engine(repeat, pool):
+    engine = QREngine(kind=pool)
+    try:
+        print(f"\n{'len':>6} {'cold ms':>10} {'cached ms':>10}   ({pool} pool)")
+        for n in LENGTHS:
+            cold, warm = [], []
+            for i in range(repeat):
+                p = payload(n) + str(i)
+                t = time.perf_counter()
+                await engine.render(p)
+                cold.append((time.perf_counter() - t) * 1000)
+                t = time.perf_counter()
+                await engine.render(p)
+                warm.append((time.perf_counter() - t) * 1000)
+            print(f"{n:>6} {statistics.median(cold):>10.2f} {statistics.median(warm):>10.3f}")
+        batch = [payload(200) + str(i) for i in range(50)]
+        t = time.perf_counter()
+        await engine.render_batch(batch)
+        print(f"\nbatch 50 x 200 chars: {(time.perf_counter() - t) * 1000:.1f} ms")
+    finally:
+        await engine.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--pool", default="thread", choices=["thread", "process"])
+    args = ap.parse_args()
+    bench_direct(args.repeat)
+    asyncio.run(bench_engine(args.repeat, args.pool))
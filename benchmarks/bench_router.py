@@ -0,0 +1,149 @@
+# Groq/Gemini matn routeri: mahalliy stub serverlar kechikish va xato kiritadi.
+# Groq ning bir qismi sekin (--slow-rate) yoki xato (--error-rate) javob beradi;
+# hedge/failover bilan va ularsiz (faqat Groq) kechikish persentillari solishtiriladi;
+# oqimli javob uchun birinchi bo'lakgacha vaqt (faqat Groq oqimi / router.stream).
+#   python -m benchmarks.bench_router [--requests 200] [--slow-rate 0.1] [--error-rate 0.05]
+import os
+import time
+import json
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+GROQ_PORT, GEMINI_PORT = 18081, 18082
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{GROQ_PORT}"
+os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{GEMINI_PORT}"
+os.environ.setdefault("GROQ_CHAT_RPS", "0")
+os.environ.setdefault("GEMINI_RPS", "0")
+os.environ.setdefault("GROQ_CHAT_CONCURRENCY", "64")
+os.environ.setdefault("GEMINI_CONCURRENCY", "64")
+
+import bot  # noqa: E402
+import http_pool  # noqa: E402
+from text_router import TextRouter, Provider  # noqa: E402
+
+
+def groq_app(args):
+    async def chat(request):
+        body = await request.json()
+        r = random.random()
+        if r < args.error_rate:
+            return web.json_response({"error": "boom"}, status=500)
+        delay = args.slow if r < args.error_rate + args.slow_rate else random.uniform(0.05, 0.25)
+        await asyncio.sleep(delay)
+        if not body.get("stream"):
+            return web.json_response({"choices": [{"message": {"content": "groq"}}]})
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        try:
+            await resp.prepare(request)
+            for w in ("gr", "oq"):
+                await resp.write(f"data: {json.dumps({'choices': [{'delta': {'content': w}}]})}\n\n".encode())
+                await asyncio.sleep(0.01)
+            await resp.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            pass            # mijoz uzdi (birinchi bo'lakdan keyin yoki hedge yutqazdi)
+        return resp
+    app = web.Application()
+    app.router.add_post("/openai/v1/chat/completions", chat)
+    return app
+
+
+def gemini_app(args):
+    async def generate(request):
+        await request.read()
+        await asyncio.sleep(random.uniform(0.3, 0.6))
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": "gemini"}]}}]})
+    app = web.Application()
+    app.router.add_post("/v1beta/models/{model}", generate)
+    return app
+
+
+async def serve(app, port):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def pct(data, p):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(p * len(data)))]
+
+
+async def measure(label, complete, args):
+    lat, fails = [], 0
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        nonlocal fails
+        async with sem:
+            t = time.perf_counter()
+            try:
+                await complete([{"role": "user", "content": f"savol {i}"}], "uz", 0)
+            except Exception:
+                fails += 1
+                return
+            lat.append(time.perf_counter() - t)
+
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    if lat:
+        print(f"{label:<14} {pct(lat, 0.5):>7.3f} {pct(lat, 0.95):>7.3f} {pct(lat, 0.99):>7.3f} {max(lat):>7.3f} {fails:>6}")
+    else:
+        print(f"{label:<14} {'-':>7} {'-':>7} {'-':>7} {'-':>7} {fails:>6}")
+
+
+def first_chunk(stream):
+    # Oqimning birinchi bo'lagigacha (foydalanuvchi javobni ko'ra boshlaguncha) kutiladi
+    async def complete(messages, lang, priority):
+        gen = stream(messages, lang, priority)
+        try:
+            return await gen.__anext__()
+        finally:
+            await gen.aclose()
+    return complete
+
+
+async def run(args):
+    random.seed(args.seed)
+    runners = [await serve(groq_app(args), GROQ_PORT), await serve(gemini_app(args), GEMINI_PORT)]
+    try:
+        print(f"{'mode':<14} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'fails':>6}")
+        groq_only = Provider("groq", bot.groq_text_req)
+        await measure("groq only", groq_only.run, args)
+        router = TextRouter(Provider("groq", bot.groq_text_req), Provider("gemini", bot.gemini_text_req))
+        await measure("hedged", router.complete, args)
+        st = router.stats()
+        print(f"hedges={st['hedges']} hedge_wins={st['hedge_wins']} failovers={st['failovers']} "
+              f"hedge_delay={st['hedge_delay']}s groq breaker={st['groq']['breaker']}")
+        print(f"{'stream':<14} first chunk")
+        await measure("groq stream", first_chunk(bot.ai_text_stream), args)
+        router = TextRouter(Provider("groq", bot.groq_text_req, bot.ai_text_stream),
+                            Provider("gemini", bot.gemini_text_req))
+        await measure("routed stream", first_chunk(router.stream), args)
+        st = router.stats()
+        print(f"hedges={st['hedges']} hedge_wins={st['hedge_wins']} failovers={st['failovers']} "
+              f"first_token={st['groq']['first_token']}s")
+        # Groq butunlay ishlamaydi: breaker ochiladi, keyingi so'rovlar to'g'ridan-to'g'ri Gemini ga
+        args.error_rate, args.slow_rate = 1.0, 0.0
+        await measure("groq down", router.complete, args)
+        st = router.stats()
+        print(f"failovers={st['failovers']} groq calls={st['groq']['calls']} breaker={st['groq']['breaker']} "
+              f"trips={router.primary.breaker.trips}")
+    finally:
+        await http_pool.close_sessions()
+        for r in runners:
+            await r.cleanup()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--slow-rate", type=float, default=0.1)
+    ap.add_argument("--slow", type=float, default=5.0)
+    ap.add_argument("--error-rate", type=float, default=0.05)
+    ap.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
@@ -0,0 +1,124 @@
+# Rejalashtiruvchi sinovi: ko'p foydalanuvchi tez-tez xabar yuboradi (pdf_collect kabi
+# get_data -> await -> update_data), og'ir handlerlar (TTS kabi) va inline so'rovlar aralash.
+# Rejimlar: rejalashtiruvchisiz; chat qulfi og'ir handler oxirigacha ushlanadi ("locked"); handler
+# holatga yozmaydigan qismga o'tgach qulf bo'shatiladi (release_chat). Natija: yo'qolgan qismlar, og'ir handlerlar cho'qqisi,
+# og'ir so'rovdan keyingi "Orqaga" kechikishi, yuklama ostida javob berilgan / tashlangan inline so'rovlar.
+#   python -m benchmarks.bench_scheduler [--users 200] [--messages 8] [--heavy 8] [--inline 4]
+import time
+import random
+import asyncio
+import argparse
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update, Message, InlineQuery
+
+from scheduler import Scheduler, SCHED_SHED_AT
+
+MODES = {"plain": (False, False), "locked": (True, False), "scheduler": (True, True)}
+
+
+def build(args, with_sched, release):
+    dp = Dispatcher(storage=MemoryStorage())
+    st = {"running": 0, "peak": 0, "inline": 0, "order_errors": 0, "back": []}
+    sched = None
+
+    @dp.message(F.text.startswith("part"))
+    async def collect(msg: Message, state: FSMContext):
+        # Naiv o'qish-o'zgartirish-yozish — parallel ishlasa qismlar yo'qoladi
+        data = await state.get_data()
+        await asyncio.sleep(random.uniform(0, 0.005))
+        parts = data.get("parts", [])
+        if parts and parts[-1] > int(msg.text[4:]):
+            st["order_errors"] += 1
+        await state.update_data(parts=parts + [int(msg.text[4:])])
+
+    @dp.message(F.text == "ask", flags={"heavy": True})
+    async def ask(msg: Message, state: FSMContext):
+        st["running"] += 1
+        st["peak"] = max(st["peak"], st["running"])
+        # Holatni o'qish, so'ng holatga yozmaydigan uzoq qism (sintez)
+        await asyncio.sleep(args.heavy_secs / 10)
+        if release:
+            sched.release_chat()
+        await asyncio.sleep(args.heavy_secs)
+        st["running"] -= 1
+
+    @dp.message(F.text == "back")
+    async def back(msg: Message):
+        st["back"].append(time.perf_counter() - st["t0"])
+
+    @dp.inline_query()
+    async def inline(query: InlineQuery):
+        await asyncio.sleep(args.inline_secs)
+        st["inline"] += 1
+
+    if with_sched:
+        sched = Scheduler(heavy=args.heavy, heavy_queue=10 ** 6, shed_at=args.shed_at, inline=args.inline)
+        sched.setup(dp)
+    return dp, sched, st
+
+
+def updates(args):
+    out, inline = [], []
+    for u in range(1, args.users + 1):
+        chat = {"id": u, "type": "private"}
+        user = {"id": u, "is_bot": False, "first_name": "u"}
+        out.append({"message": {"message_id": 0, "date": 0, "chat": chat, "from": user, "text": "ask"}})
+        out.append({"message": {"message_id": 1, "date": 0, "chat": chat, "from": user, "text": "back"}})
+        for i in range(args.messages):
+            out.append({"message": {"message_id": i + 2, "date": 0, "chat": chat, "from": user, "text": f"part{i}"}})
+        inline.append({"inline_query": {"id": str(u), "from": user, "query": "salom", "offset": ""}})
+    for i, u in enumerate(out + inline):
+        u["update_id"] = i
+    return out, inline
+
+
+async def run_case(args, mode, raw, inline):
+    random.seed(1)
+    dp, sched, st = build(args, *MODES[mode])
+    bot = Bot("1:bench")
+    t = st["t0"] = time.perf_counter()
+    # Polling kabi: har bir yangilanish kelish tartibida alohida vazifa
+    feed = lambda u: asyncio.create_task(dp.feed_update(bot, Update.model_validate(u, context={"bot": bot})))
+    tasks = [feed(u) for u in raw]
+    # Inline so'rovlar og'ir navbat yig'ilgandan keyin, foydalanuvchilar yozgani kabi oraliq bilan keladi
+    while not st["peak"]:
+        await asyncio.sleep(0.001)
+    for u in inline:
+        tasks.append(feed(u))
+        await asyncio.sleep(args.inline_gap)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t
+    lost = 0
+    for u in range(1, args.users + 1):
+        data = await dp.storage.get_data(key=StorageKey(bot_id=bot.id, chat_id=u, user_id=u))
+        lost += args.messages - len(data.get("parts", []))
+    await bot.session.close()
+    shed = sched.stats()["shed"] if sched else 0
+    back = sorted(st["back"])
+    return lost, st["order_errors"], st["peak"], back[len(back) // 2], st["inline"], shed, elapsed
+
+
+async def run(args):
+    raw, inline = updates(args)
+    print(f"{len(raw) + len(inline)} updates, {args.users} chats x ({args.messages} parts + 1 heavy + back + 1 inline)")
+    print(f"{'mode':<10} {'lost':>6} {'order':>6} {'heavy peak':>11} {'back p50 s':>11} {'inline ok':>10} {'shed':>6} {'secs':>6}")
+    for name in MODES:
+        lost, order, peak, back, answered, shed, secs = await run_case(args, name, raw, inline)
+        print(f"{name:<10} {lost:>6} {order:>6} {peak:>11} {back:>11.2f} {answered:>10} {shed:>6} {secs:>6.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--messages", type=int, default=8)
+    ap.add_argument("--heavy", type=int, default=8)
+    ap.add_argument("--heavy-secs", type=float, default=0.05)
+    ap.add_argument("--shed-at", type=int, default=SCHED_SHED_AT)
+    ap.add_argument("--inline", type=int, default=4, help="yuklama ostida inline uchun ajratilgan joylar")
+    ap.add_argument("--inline-secs", type=float, default=0.02)
+    ap.add_argument("--inline-gap", type=float, default=0.005, help="inline so'rovlar orasidagi vaqt (s)")
+    asyncio.run(run(ap.parse_args()))
@@ -0,0 +1,90 @@
+# Sovuq start: `import bot` vaqti va jarayon boshlanishidan birinchi javobgacha (soxta Telegram serveri
+# bilan polling). So'ng birinchi og'ir funksiya — QR — kechikishi: kutubxonalar eager (oldindan),
+# lazy (birinchi foydalanishda) yoki lazy + fonda isitish (WARMUP_DELAY) bo'lganda.
+#   python -m benchmarks.bench_startup [--runs 5] [--pause 4]
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.fakes import FakeTelegram, serve
+
+PORT = 18094
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123:bench"
+EAGER = "import qrcode, fpdf, gtts, PIL.Image, PIL.ImageDraw, PIL.ImageFont"
+MODES = {
+    # nomi: (bot dan oldin import qilinadigan modullar, WARMUP_DELAY)
+    "eager": (EAGER, "-1"),
+    "lazy": ("", "-1"),
+    "lazy+warm": ("", "0.5"),
+}
+
+
+def import_time(pre):
+    code = f"import time; t = time.perf_counter(); {pre or 'pass'}; import bot; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True,
+                         env=dict(os.environ, BOT_TOKEN=TOKEN))
+    return float(out.stdout.split()[-1])
+
+
+async def reply(fake, want):
+    while True:
+        method, _, t = await asyncio.wait_for(fake.replies.get(), 60)
+        if method == want:
+            return t
+
+
+async def run_bot(pre, warm, pause):
+    fake = FakeTelegram()
+    runner = await serve(fake.app(), PORT)
+    code = f"{pre or 'pass'}; import runpy; runpy.run_path({os.path.join(ROOT, 'bot.py')!r}, run_name='__main__')"
+    env = dict(os.environ, BOT_TOKEN=TOKEN, TELEGRAM_API_URL=f"http://127.0.0.1:{PORT}", WARMUP_DELAY=warm,
+               PYTHONPATH=ROOT, TTS_BACKEND="gtts")
+    with tempfile.TemporaryDirectory() as cwd:
+        t0 = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(sys.executable, "-c", code, cwd=cwd, env=env,
+                                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            fake.push_message(42, "/start")
+            first = await reply(fake, "sendMessage") - t0
+            fake.push_message(42, "\U0001f1fa\U0001f1ff O'zbek")
+            await reply(fake, "sendMessage")
+            fake.push_message(42, "\U0001f4f7 QR Kod")
+            await reply(fake, "sendMessage")
+            # Foydalanuvchi biroz o'ylaydi — shu vaqtda fonda isitish ishlaydi
+            await asyncio.sleep(pause)
+            t = time.perf_counter()
+            fake.push_message(42, "https://example.com/" + json.dumps(t))
+            qr = await reply(fake, "sendPhoto") - t
+        finally:
+            proc.terminate()
+            await proc.wait()
+            await runner.cleanup()
+    return first, qr
+
+
+async def run(args):
+    # Bitta CPU da shovqin katta — min va mediana
+    print(f"{'mode':<10} | {'import s min/med':>16} | {'1st reply s min/med':>19} | {'1st QR ms':>9}")
+    for name, (pre, warm) in MODES.items():
+        imports = [import_time(pre) for _ in range(args.runs)]
+        firsts, qrs = [], []
+        for _ in range(args.runs):
+            first, qr = await run_bot(pre, warm, args.pause)
+            firsts.append(first)
+            qrs.append(qr)
+        print(f"{name:<10} | {min(imports):>7.2f} /{statistics.median(imports):>7.2f} | "
+              f"{min(firsts):>9.2f} /{statistics.median(firsts):>8.2f} | {statistics.median(qrs) * 1000:>9.0f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--pause", type=float, default=4.0, help="menyudan keyin QR matni yuborilgunga qadar (s)")
+    asyncio.run(run(ap.parse_args()))
@@ -0,0 +1,50 @@
+# TTS kechikishi matn uzunligiga nisbatan: ketma-ket (fanout=1) va parallel segmentlar.
+# Standart holatda oflayn stub backend ishlatiladi (~100 belgiga --latency soniya).
+#   python -m benchmarks.bench_tts [--latency 0.15] [--fanout 4] [--backend stub|gtts]
+import time
+import asyncio
+import argparse
+
+from tts_engine import TTSEngine, StubBackend, GTTSBackend
+
+LENGTHS = [100, 500, 1000, 2000, 4000]
+WORDS = "Bugun havo juda yaxshi. Biz bog'da sayr qildik, keyin choy ichdik! Ertaga nima qilamiz?".split()
+
+
+def make_text(n):
+    out, i = [], 0
+    while sum(len(w) + 1 for w in out) < n:
+        out.append(WORDS[i % len(WORDS)])
+        i += 1
+    return " ".join(out)[:n]
+
+
+async def run(args):
+    backend = StubBackend(args.latency) if args.backend == "stub" else GTTSBackend()
+    print(f"{'chars':>6} {'sequential s':>13} {'parallel s':>11} {'cached s':>9} {'bytes':>8}")
+    for n in LENGTHS:
+        text = make_text(n)
+        seq = TTSEngine(backend=backend, fanout=1)
+        par = TTSEngine(backend=backend, fanout=args.fanout)
+        try:
+            t = time.perf_counter()
+            await seq.synthesize(text, "uz")
+            t_seq = time.perf_counter() - t
+            t = time.perf_counter()
+            audio = await par.synthesize(text, "uz")
+            t_par = time.perf_counter() - t
+            t = time.perf_counter()
+            await par.synthesize(text, "uz")
+            t_hot = time.perf_counter() - t
+            print(f"{n:>6} {t_seq:>13.3f} {t_par:>11.3f} {t_hot:>9.4f} {len(audio):>8}")
+        finally:
+            await seq.close()
+            await par.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=0.15)
+    ap.add_argument("--fanout", type=int, default=4)
+    ap.add_argument("--backend", default="stub", choices=["stub", "gtts"])
+    asyncio.run(run(ap.parse_args()))
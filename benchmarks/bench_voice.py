@@ -0,0 +1,150 @@
+# Ovozli xabar transkripsiyasi: eski yo'l (butun faylni BytesIO ga yuklab, getvalue() bilan
+# multipart) va oqimli/bo'laklangan yo'l. Soxta Telegram fayl serveri va Whisper stub ishlatiladi;
+# xotira cho'qqisi tracemalloc bilan o'lchanadi.
+#   python -m benchmarks.bench_voice [--durations 10 60 300 900] [--fanout 4]
+import io
+import time
+import struct
+import random
+import asyncio
+import argparse
+import tracemalloc
+
+import aiohttp
+from aiohttp import web
+
+from voice_engine import VoiceEngine, OggReader, ogg_stream, opus_samples, RATE
+
+PORT = 18092
+TOC_CELT_20MS = 31 << 3
+
+
+def make_voice(seconds, seed=1):
+    # Sintetik Ogg Opus: "nutq" paketlari ~60-100 bayt, har 4-10 s da 0.4-0.8 s jimlik (3 bayt)
+    rng = random.Random(seed)
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, 312, 48000, 0, 0)
+    tags = b"OpusTags" + struct.pack("<I", 5) + b"bench" + struct.pack("<I", 0)
+    packets, t, next_pause = [], 0.0, rng.uniform(4, 10)
+    while t < seconds:
+        if t >= next_pause:
+            for _ in range(int(rng.uniform(0.4, 0.8) / 0.02)):
+                packets.append(bytes([TOC_CELT_20MS, 0, 0]))
+                t += 0.02
+            next_pause = t + rng.uniform(4, 10)
+        packets.append(bytes([TOC_CELT_20MS]) + rng.randbytes(rng.randint(60, 100)))
+        t += 0.02
+    return ogg_stream(head, tags, packets)
+
+
+def fake_servers(files, args, counters):
+    async def tg_file(request):
+        # Telegram fayl serveri: --tg-mbps tezlikda bo'laklab beradi
+        data = files[request.match_info["name"]]
+        resp = web.StreamResponse()
+        resp.content_length = len(data)
+        await resp.prepare(request)
+        step = 32 * 1024
+        for i in range(0, len(data), step):
+            await resp.write(data[i:i + step])
+            await asyncio.sleep(step / (args.tg_mbps * 1024 * 1024))
+        await resp.write_eof()
+        return resp
+
+    async def whisper(request):
+        reader = await request.multipart()
+        seconds = 0.0
+        async for part in reader:
+            if part.name != "file":
+                continue
+            ogg = OggReader()
+            while True:
+                chunk = await part.read_chunk(64 * 1024)
+                if not chunk:
+                    break
+                for p in ogg.feed(chunk):
+                    if not p.startswith((b"OpusHead", b"OpusTags")):
+                        seconds += opus_samples(p) / RATE
+        counters["requests"] += 1
+        counters["audio"] += seconds
+        # Whisper kechikishi: qat'iy qism + audio uzunligiga proporsional
+        await asyncio.sleep(args.base_latency + seconds * args.latency_per_sec)
+        return web.json_response({"text": f"[{seconds:.0f}s]"})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/file/{name}", tg_file)
+    app.router.add_post("/openai/v1/audio/transcriptions", whisper)
+    return app
+
+
+async def whisper_post(session, data):
+    form = aiohttp.FormData()
+    form.add_field("file", data, filename="voice.ogg", content_type="audio/ogg")
+    form.add_field("model", "whisper-large-v3")
+    async with session.post(f"http://127.0.0.1:{PORT}/openai/v1/audio/transcriptions", data=form) as r:
+        return (await r.json())["text"]
+
+
+async def old_path(session, name):
+    buf = io.BytesIO()
+    async with session.get(f"http://127.0.0.1:{PORT}/file/{name}") as r:
+        buf.write(await r.read())
+    return await whisper_post(session, buf.getvalue())
+
+
+def new_engine(session, fanout):
+    async def transcribe(open_stream, priority):
+        return await whisper_post(session, open_stream())
+    return VoiceEngine(transcribe, fanout=fanout)
+
+
+async def file_stream(session, name):
+    async with session.get(f"http://127.0.0.1:{PORT}/file/{name}") as r:
+        async for chunk in r.content.iter_chunked(64 * 1024):
+            yield chunk
+
+
+async def measure(fn):
+    tracemalloc.start()
+    t = time.perf_counter()
+    out = await fn()
+    elapsed = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+async def run(args):
+    files = {f"v{d}": make_voice(d) for d in args.durations}
+    counters = {"requests": 0, "audio": 0.0}
+    runner = web.AppRunner(fake_servers(files, args, counters), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    session = aiohttp.ClientSession()
+    try:
+        print(f"{'secs':>5} {'KB':>6} | {'old s':>6} {'old peak KB':>11} | {'new s':>6} {'new peak KB':>11} {'parts':>5} | {'cached s':>8}")
+        for d in args.durations:
+            name = f"v{d}"
+            _, t_old, p_old = await measure(lambda: old_path(session, name))
+            engine = new_engine(session, args.fanout)
+            before = counters["requests"]
+            text, t_new, p_new = await measure(
+                lambda: engine.text(name, d, lambda: file_stream(session, name)))
+            parts = counters["requests"] - before
+            t = time.perf_counter()
+            await engine.text(name, d, lambda: file_stream(session, name))
+            t_hot = time.perf_counter() - t
+            print(f"{d:>5} {len(files[name]) // 1024:>6} | {t_old:>6.2f} {p_old // 1024:>11} | "
+                  f"{t_new:>6.2f} {p_new // 1024:>11} {parts:>5} | {t_hot:>8.4f}")
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--durations", type=int, nargs="+", default=[10, 60, 300, 900])
+    ap.add_argument("--fanout", type=int, default=4)
+    ap.add_argument("--tg-mbps", type=float, default=2.0)
+    ap.add_argument("--base-latency", type=float, default=0.3)
+    ap.add_argument("--latency-per-sec", type=float, default=0.01)
+    asyncio.run(run(ap.parse_args()))
@@ -0,0 +1,132 @@
+# "Rasmga matn": 1000 ta turli o'lchamdagi rasm. Sodda yo'l (har urinishda TTF diskdan,
+# sig'guncha kichraytirish sikli, RGBA overlay, event loop ichida) va WatermarkEngine (shrift keshi,
+# o'lchangan joylashuv, pul). Event loop kechikishi ham o'lchanadi.
+#   python -m benchmarks.bench_watermark [--images 1000] [--workers 2] [--pool thread|process]
+import io
+import time
+import random
+import asyncio
+import argparse
+
+from PIL import Image, ImageDraw, ImageFont
+
+import watermark
+from watermark import WatermarkEngine, font_path
+
+SIZES = [(320, 240), (640, 480), (800, 1200), (1280, 720), (1080, 1920), (1600, 1200), (2560, 1440)]
+WORDS = "Salom bugun ajoyib kun tug'ilgan kuning muborak bo'lsin do'stim Toshkent 2026".split()
+
+
+def make_sources(seed=1):
+    rng = random.Random(seed)
+    out = []
+    for w, h in SIZES:
+        img = Image.effect_noise((w, h), rng.randint(20, 80)).convert("RGB")
+        img = Image.blend(img, Image.linear_gradient("L").resize((w, h)).convert("RGB"), 0.5)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        out.append(buf.getvalue())
+    return out
+
+
+def naive_render(data, text):
+    # Odatiy yondashuv: shrift har o'lcham sinovida diskdan, matn sig'guncha o'lcham kichraytiriladi
+    img = Image.open(io.BytesIO(data)).convert("RGBA")
+    w, h = img.size
+    size = w // 10
+    while True:
+        font = ImageFont.truetype(font_path(), size)
+        box = ImageDraw.Draw(img).multiline_textbbox((0, 0), text, font=font)
+        if (box[2] - box[0] <= w * 0.9 and box[3] - box[1] <= h * 0.35) or size <= 12:
+            break
+        size -= 2
+    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    d = ImageDraw.Draw(overlay)
+    d.rectangle((0, h - (box[3] - box[1]) - 20, w, h), fill=(0, 0, 0, 115))
+    d.multiline_text((w / 2, h - (box[3] - box[1]) - 10), text, font=font, fill=(255, 255, 255, 255), anchor="ma", align="center")
+    img = Image.alpha_composite(img, overlay).convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=95, optimize=True)
+    return out.getvalue()
+
+
+def jobs(n, sources, seed=2):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 40))]
+        # Sodda yo'l o'zi o'ramaydi — unga oldindan satrlarga bo'lingan matn beriladi
+        text = "\n".join(" ".join(words[j:j + 6]) for j in range(0, len(words), 6))
+        out.append((i, rng.randrange(len(sources)), text))
+    return out
+
+
+async def lag_probe(samples, stop):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - t - 0.01)
+
+
+async def run_case(name, work, todo, concurrency):
+    lags, stop = [], asyncio.Event()
+    probe = asyncio.create_task(lag_probe(lags, stop))
+    lat, out_bytes = [], 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(job):
+        nonlocal out_bytes
+        async with gate:
+            t = time.perf_counter()
+            jpeg = await work(job)
+            lat.append(time.perf_counter() - t)
+            out_bytes += len(jpeg)
+
+    t = time.perf_counter()
+    await asyncio.gather(*(one(j) for j in todo))
+    total = time.perf_counter() - t
+    stop.set()
+    await probe
+    lat.sort()
+    lags.sort()
+    print(f"{name:<18} {total:>7.2f} {len(todo) / total:>7.1f} {lat[len(lat) // 2] * 1000:>8.1f} "
+          f"{lat[int(len(lat) * 0.95)] * 1000:>8.1f} {lags[-1] * 1000 if lags else 0:>9.1f} {out_bytes // len(todo) // 1024:>7}")
+
+
+async def run(args):
+    sources = make_sources()
+    todo = jobs(args.images, sources)
+    print(f"{args.images} images, sizes {', '.join(f'{w}x{h}' for w, h in SIZES)}")
+    print(f"{'mode':<18} {'secs':>7} {'img/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'loop lag':>9} {'avg KB':>7}")
+
+    async def naive(job):
+        _, src, text = job
+        return naive_render(sources[src], text)
+    await run_case("naive (on loop)", naive, todo[:args.naive], args.concurrency)
+
+    for kind in args.pool:
+        engine = WatermarkEngine(kind=kind, workers=args.workers, cache_bytes=0)
+        watermark.get_font.cache_clear()
+
+        async def cached(job, engine=engine):
+            i, src, text = job
+            async def fetch():
+                return sources[src]
+            return await engine.render(i, text, fetch)
+        try:
+            await run_case(f"engine {kind}x{args.workers}", cached, todo, args.concurrency)
+        finally:
+            await engine.close()
+        if kind == "thread":
+            info = watermark.get_font.cache_info()
+            print(f"{'':<18} font cache: {info.currsize} sizes, {info.hits} hits, {info.misses} TTF loads")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=1000)
+    ap.add_argument("--naive", type=int, default=200, help="sodda yo'l uchun rasmlar soni (sekin)")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--pool", nargs="+", default=["thread", "process"])
+    asyncio.run(run(ap.parse_args()))
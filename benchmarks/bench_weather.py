@@ -0,0 +1,165 @@
+# Ob-havo: bir lahzada minglab foydalanuvchi (ko'pchiligi bir nechta shahardan) so'raydi. Lokal soxta
+# OpenWeatherMap (geocode + weather, kechikish va rps chegarasi bilan — oshsa 429). Sodda yo'l — har
+# so'rovga geocode + weather; WeatherService — lokal shahar indeksi, katakcha keshi, birlashtirish.
+#   python -m benchmarks.bench_weather [--users 5000] [--rps 100] [--latency 0.15]
+import time
+import random
+import asyncio
+import argparse
+
+import aiohttp
+from aiohttp import web
+
+from weather import WeatherService, WeatherError, CITIES
+
+PORT = 18093
+# Foydalanuvchilar yozadigan ko'rinishlar: to'g'ri, kirill, apostrofsiz, xato bilan, "shahri" bilan
+SPELLINGS = {
+    "Toshkent": ["Toshkent", "Ташкент", "toshkent shahri", "Tashkent", "Toshkemt"],
+    "Samarqand": ["Samarqand", "Самарканд", "samarkand", "Samarqnd"],
+    "Farg'ona": ["Farg'ona", "Fargʻona", "Фергана", "fargona"],
+    "Namangan": ["Namangan", "Наманган", "namangan"],
+    "Andijon": ["Andijon", "Андижан", "andijan"],
+    "Buxoro": ["Buxoro", "Бухара", "bukhara"],
+}
+
+
+def stub(args, counters):
+    bucket = {"tokens": float(args.rps), "stamp": time.monotonic()}
+
+    def admit():
+        now = time.monotonic()
+        bucket["tokens"] = min(args.rps, bucket["tokens"] + (now - bucket["stamp"]) * args.rps)
+        bucket["stamp"] = now
+        if bucket["tokens"] < 1:
+            counters["429"] += 1
+            return False
+        bucket["tokens"] -= 1
+        return True
+
+    async def geo(request):
+        counters["geo"] += 1
+        if not admit():
+            return web.json_response({"cod": 429}, status=429)
+        await asyncio.sleep(args.latency)
+        q = request.query["q"]
+        return web.json_response([{"name": q, "lat": 41.3, "lon": 69.28}])
+
+    async def current(request):
+        counters["weather"] += 1
+        if not admit():
+            return web.json_response({"cod": 429}, status=429)
+        await asyncio.sleep(args.latency)
+        lat, lon = float(request.query["lat"]), float(request.query["lon"])
+        return web.json_response({"name": f"{lat:.2f},{lon:.2f}", "main": {"temp": 21.4, "feels_like": 20.9, "humidity": 40},
+                                  "wind": {"speed": 3.2}, "weather": [{"description": "ochiq osmon"}]})
+
+    app = web.Application()
+    app.router.add_get("/geo/1.0/direct", geo)
+    app.router.add_get("/data/2.5/weather", current)
+    return app
+
+
+def make_users(n, seed=1):
+    # Zipf ga yaqin: Toshkent eng ko'p; yarmi joylashuv (shahar markazidan ~8 km gacha), yarmi nom
+    rng = random.Random(seed)
+    coords = {name: (lat, lon) for name, lat, lon, _ in CITIES}
+    names = list(SPELLINGS)
+    weights = [1 / (i + 1) for i in range(len(names))]
+    users = []
+    for _ in range(n):
+        city = rng.choices(names, weights)[0]
+        lang = rng.choice(["uz", "uz", "ru", "en"])
+        if rng.random() < 0.5:
+            lat, lon = coords[city]
+            users.append(("loc", (lat + rng.uniform(-0.07, 0.07), lon + rng.uniform(-0.07, 0.07)), lang))
+        else:
+            users.append(("city", rng.choice(SPELLINGS[city]), lang))
+    return users
+
+
+class Upstream:
+    def __init__(self, session):
+        self.session = session
+
+    async def weather(self, lat, lon, lang):
+        async with self.session.get(f"http://127.0.0.1:{PORT}/data/2.5/weather",
+                                    params={"lat": lat, "lon": lon, "lang": lang}) as r:
+            if r.status != 200:
+                raise WeatherError(f"Weather {r.status}")
+            d = await r.json()
+        return {"name": d["name"], "temp": round(d["main"]["temp"])}
+
+    async def geocode(self, name):
+        async with self.session.get(f"http://127.0.0.1:{PORT}/geo/1.0/direct", params={"q": name}) as r:
+            if r.status != 200:
+                raise WeatherError(f"Geocode {r.status}")
+            d = await r.json()
+        return (d[0]["name"], d[0]["lat"], d[0]["lon"]) if d else None
+
+
+async def run_case(name, users, lookup, counters):
+    for k in counters:
+        counters[k] = 0
+    lat, errors, missing = [], 0, 0
+
+    async def one(user):
+        nonlocal errors, missing
+        t = time.perf_counter()
+        try:
+            if await lookup(user) is None:
+                missing += 1
+        except WeatherError:
+            errors += 1
+        lat.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in users))
+    total = time.perf_counter() - t
+    lat.sort()
+    print(f"{name:<10} {total:>6.2f} {lat[len(lat) // 2] * 1000:>7.0f} {lat[int(len(lat) * 0.95)] * 1000:>7.0f} "
+          f"{counters['geo']:>6} {counters['weather']:>8} {counters['429']:>6} {errors:>7} {missing:>8}")
+
+
+async def run(args):
+    counters = {"geo": 0, "weather": 0, "429": 0}
+    runner = web.AppRunner(stub(args, counters), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100))
+    up = Upstream(session)
+    users = make_users(args.users)
+    try:
+        print(f"{args.users} users at once, upstream {args.rps} rps, {args.latency * 1000:.0f} ms")
+        print(f"{'mode':<10} {'secs':>6} {'p50 ms':>7} {'p95 ms':>7} {'geo':>6} {'weather':>8} {'429':>6} {'errors':>7} {'notfound':>8}")
+
+        async def naive(user):
+            kind, q, lang = user
+            if kind == "city":
+                found = await up.geocode(q)
+                q = found[1:]
+            return await up.weather(q[0], q[1], lang)
+        await run_case("naive", users, naive, counters)
+
+        service = WeatherService(up.weather, up.geocode)
+
+        async def cached(user):
+            kind, q, lang = user
+            if kind == "city":
+                return await service.by_city(q, lang)
+            return await service.by_location(q[0], q[1], lang)
+        await asyncio.sleep(1)
+        await run_case("service", users, cached, counters)
+        await run_case("warm", users, cached, counters)
+        print(service.stats())
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=5000)
+    ap.add_argument("--rps", type=float, default=100)
+    ap.add_argument("--latency", type=float, default=0.15)
+    asyncio.run(run(ap.parse_args()))
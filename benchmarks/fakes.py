@@ -0,0 +1,300 @@
+# Yuklama sinovlari uchun lokal soxta serverlar: Telegram Bot API (getUpdates, send*, getFile, fayl
+# yuklash), Groq (chat — oddiy va SSE oqim, Whisper) va Gemini (generateContent). Har biri kechikish
+# va xato profili bilan; chaqiruvlar usul bo'yicha sanaladi.
+import json
+import time
+import random
+import asyncio
+from collections import Counter
+
+from aiohttp import web
+
+
+# Kechikish va xatolar: har chaqiruvda `latency` (+ eksponensial jitter), `slow` ulushida `slow_latency`,
+# `error` ulushida 500, `flood` ulushida 429 (Retry-After bilan)
+class Profile:
+    def __init__(self, latency=0.0, jitter=0.0, slow=0.0, slow_latency=0.0, error=0.0, flood=0.0, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow = slow
+        self.slow_latency = slow_latency
+        self.error = error
+        self.flood = flood
+        self.retry_after = retry_after
+
+    def delay(self, rng):
+        if self.slow and rng.random() < self.slow:
+            return self.slow_latency
+        return self.latency + (rng.expovariate(1 / self.jitter) if self.jitter else 0.0)
+
+    def fault(self, rng):
+        # -> None yoki (status, sarlavhalar)
+        r = rng.random()
+        if r < self.error:
+            return 500, {}
+        if r < self.error + self.flood:
+            return 429, {"Retry-After": str(self.retry_after)}
+        return None
+
+
+async def serve(app, port, host="127.0.0.1"):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+class FakeTelegram:
+    def __init__(self, profile=None, seed=1, poll_timeout=1.0):
+        self.profile = profile or Profile()
+        self.rng = random.Random(seed)
+        self.poll_timeout = poll_timeout
+        self.queue = asyncio.Queue()
+        self.replies = asyncio.Queue()      # (usul, chat_id, vaqt) — javob kutuvchi benchmarklar uchun
+        self.files = {}                     # file_id -> (yo'l, baytlar)
+        self.pushed = {}                    # update_id -> navbatga qo'yilgan vaqt
+        self.served = {}                    # update_id -> bot olgan vaqt
+        self.calls = Counter()
+        self.faults = Counter()
+        self.update_id = 0
+        self.message_id = 0
+        self.file_seq = 0
+
+    # ─── yangilanishlar ─────────────────────────────────────────────────────
+    def push(self, kind, payload):
+        self.update_id += 1
+        self.pushed[self.update_id] = time.perf_counter()
+        self.queue.put_nowait({"update_id": self.update_id, kind: payload})
+        return self.update_id
+
+    def push_message(self, user_id, text=None, **extra):
+        self.message_id += 1
+        msg = {"message_id": self.message_id, "date": int(time.time()), "chat": chat(user_id),
+               "from": user(user_id), **extra}
+        if text is not None:
+            msg["text"] = text
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self.push("message", msg)
+
+    def push_callback(self, user_id, data):
+        self.message_id += 1
+        message = {"message_id": self.message_id, "date": int(time.time()), "chat": chat(user_id), "text": "."}
+        return self.push("callback_query", {"id": str(self.update_id + 1), "from": user(user_id),
+                                            "chat_instance": str(user_id), "message": message, "data": data})
+
+    def push_inline(self, user_id, query):
+        return self.push("inline_query", {"id": str(self.update_id + 1), "from": user(user_id), "query": query,
+                                          "offset": ""})
+
+    def add_file(self, data, ext="bin"):
+        self.file_seq += 1
+        file_id = f"file{self.file_seq}"
+        self.files[file_id] = (f"files/{file_id}.{ext}", data)
+        return file_id
+
+    def photo(self, file_id, width, height):
+        size = len(self.files[file_id][1])
+        return [{"file_id": file_id, "file_unique_id": f"u{file_id}", "width": width, "height": height,
+                 "file_size": size}]
+
+    def voice(self, file_id, duration):
+        return {"file_id": file_id, "file_unique_id": f"u{file_id}", "duration": duration,
+                "mime_type": "audio/ogg", "file_size": len(self.files[file_id][1])}
+
+    # ─── Bot API ────────────────────────────────────────────────────────────
+    def sent(self, chat_id, **extra):
+        self.message_id += 1
+        return {"message_id": self.message_id, "date": int(time.time()), "chat": chat(chat_id), **extra}
+
+    def uploaded(self, kind):
+        self.file_seq += 1
+        fid = f"sent{self.file_seq}"
+        obj = {"file_id": fid, "file_unique_id": f"u{fid}"}
+        if kind == "photo":
+            return [dict(obj, width=290, height=290)]
+        if kind == "audio":
+            return dict(obj, duration=1)
+        return obj
+
+    async def api(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return self.ok(await self.get_updates())
+        if request.content_type.startswith("multipart/"):
+            fields = {}
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    await part.release()
+                else:
+                    fields[part.name] = await part.text()
+        else:
+            fields = dict(await request.post())
+        await asyncio.sleep(self.profile.delay(self.rng))
+        fault = self.profile.fault(self.rng) if method not in ("getMe", "deleteWebhook") else None
+        if fault:
+            status, headers = fault
+            self.faults[status] += 1
+            if status == 429:
+                return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                          "parameters": {"retry_after": self.profile.retry_after}}, status=429)
+            return web.json_response({"ok": False, "error_code": status, "description": "Internal"}, status=status)
+        chat_id = fields.get("chat_id", "0")
+        chat_id = int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id     # "@kanal" ham bo'lishi mumkin
+        if method.startswith("send"):
+            self.replies.put_nowait((method, chat_id, time.perf_counter()))
+        if method == "getMe":
+            return self.ok({"id": 1, "is_bot": True, "first_name": "Javobchi", "username": "javobchi_bot"})
+        if method == "getChatMember":
+            return self.ok({"status": "member", "user": user(int(fields.get("user_id") or 0))})
+        if method == "getFile":
+            path, data = self.files[fields["file_id"]]
+            return self.ok({"file_id": fields["file_id"], "file_unique_id": f"u{fields['file_id']}",
+                            "file_size": len(data), "file_path": path})
+        if method == "sendMessage" or method == "editMessageText":
+            return self.ok(self.sent(chat_id, text=fields.get("text", "")))
+        if method == "sendPhoto":
+            return self.ok(self.sent(chat_id, photo=self.uploaded("photo")))
+        if method in ("sendAudio", "sendVoice"):
+            return self.ok(self.sent(chat_id, audio=self.uploaded("audio")))
+        if method == "sendDocument":
+            return self.ok(self.sent(chat_id, document=self.uploaded("document")))
+        if method == "sendMediaGroup":
+            n = len(json.loads(fields.get("media", "[]")))
+            return self.ok([self.sent(chat_id, photo=self.uploaded("photo")) for _ in range(n)])
+        return self.ok(True)
+
+    async def get_updates(self):
+        try:
+            first = await asyncio.wait_for(self.queue.get(), self.poll_timeout)
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while not self.queue.empty() and len(batch) < 100:
+            batch.append(self.queue.get_nowait())
+        now = time.perf_counter()
+        for upd in batch:
+            self.served[upd["update_id"]] = now
+        return batch
+
+    async def download(self, request):
+        # /file/bot<token>/<yo'l> — bo'laklab (haqiqiy serverdek oqim bilan)
+        self.calls["download"] += 1
+        path = request.match_info["path"]
+        data = next(d for p, d in self.files.values() if p == path)
+        await asyncio.sleep(self.profile.delay(self.rng))
+        resp = web.StreamResponse()
+        resp.content_length = len(data)
+        await resp.prepare(request)
+        for i in range(0, len(data), 64 * 1024):
+            await resp.write(data[i:i + 64 * 1024])
+        await resp.write_eof()
+        return resp
+
+    @staticmethod
+    def ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.api)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+        return app
+
+
+class FakeGroq:
+    # chat: `latency` — birinchi tokengacha; oqimda `tokens` ta bo'lak `token_interval` oralig'ida
+    def __init__(self, profile=None, whisper=None, tokens=40, token_interval=0.02, seed=2):
+        self.profile = profile or Profile()
+        self.whisper = whisper or Profile()
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.faults = Counter()
+
+    def reject(self, profile, name):
+        fault = profile.fault(self.rng)
+        if fault is None:
+            return None
+        status, headers = fault
+        self.faults[f"{name}_{status}"] += 1
+        return web.json_response({"error": {"message": "fake"}}, status=status, headers=headers)
+
+    async def chat(self, request):
+        body = await request.json()
+        stream = body.get("stream", False)
+        self.calls["stream" if stream else "chat"] += 1
+        await asyncio.sleep(self.profile.delay(self.rng))
+        resp = self.reject(self.profile, "chat")
+        if resp is not None:
+            return resp
+        words = [f"so'z{i} " for i in range(self.tokens)]
+        if not stream:
+            await asyncio.sleep(self.tokens * self.token_interval)
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": "".join(words)}}]})
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        for w in words:
+            await resp.write(f"data: {json.dumps({'choices': [{'delta': {'content': w}}]})}\n\n".encode())
+            await asyncio.sleep(self.token_interval)
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    async def transcribe(self, request):
+        self.calls["whisper"] += 1
+        size = 0
+        reader = await request.multipart()
+        async for part in reader:
+            while True:
+                chunk = await part.read_chunk(64 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+        await asyncio.sleep(self.whisper.delay(self.rng))
+        resp = self.reject(self.whisper, "whisper")
+        if resp is not None:
+            return resp
+        return web.json_response({"text": f"ovozli savol ({size // 1024} KB)"})
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/openai/v1/chat/completions", self.chat)
+        app.router.add_post("/openai/v1/audio/transcriptions", self.transcribe)
+        return app
+
+
+class FakeGemini:
+    def __init__(self, profile=None, seed=3):
+        self.profile = profile or Profile()
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.faults = Counter()
+
+    async def generate(self, request):
+        body = await request.json()
+        vision = any("inline_data" in p for c in body.get("contents", ()) for p in c.get("parts", ()))
+        self.calls["vision" if vision else "text"] += 1
+        await asyncio.sleep(self.profile.delay(self.rng))
+        fault = self.profile.fault(self.rng)
+        if fault:
+            status, headers = fault
+            self.faults[status] += 1
+            return web.json_response({"error": {"message": "fake"}}, status=status, headers=headers)
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": "gemini javobi"}]}}]})
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1beta/models/{model}", self.generate)
+        return app
+
+
+def user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "uz"}
+
+
+def chat(chat_id):
+    return {"id": chat_id, "type": "private"}
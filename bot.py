@@ -1,63 +1,82 @@
 import logging
-import json
 import asyncio
 import aiohttp
 import base64
 import os
 import io
-import csv
-import codecs
-import unicodedata
+import time
+import html
 from datetime import datetime
 
-import qrcode
-from gtts import gTTS
-from fpdf import FPDF
-from PIL import Image, ImageDraw, ImageFont
-
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
 from aiogram.types import (
-    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent,
+    Message, CallbackQuery, ChatMemberUpdated, InlineQuery, InlineQueryResultArticle, InputTextMessageContent,
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton,
-    BufferedInputFile
+    BufferedInputFile, FSInputFile, InputMediaPhoto
 )
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
+
+import http_pool
+from user_store import UserStore, NO_LANG
+from fsm_store import SQLiteStorage, update_state_data
+from chat_memory import ChatMemory
+from broadcast import Broadcaster
+from subscription import SubscriptionCache, is_member_status
+from inline_answer import InlineAnswerer
+from ai_stream import AI_STREAM, StreamEditor, iter_sse_deltas
+from answer_cache import AnswerCache
+from qr_engine import QREngine, batch_lines, zip_pngs, QR_BATCH_MAX
+from file_cache import FileIdCache, content_key, sent_file_id
+from tts_engine import TTSEngine
+from pdf_engine import PDFEngine, MissingParts
+from vision_prep import VisionPrep
+from watermark import WatermarkEngine
+from excel_engine import ExcelEngine, TooLarge, EXCEL_MAX_BYTES
+from weather import WeatherService, WeatherError
+from voice_engine import VoiceEngine, VOICE_CHUNK, file_chunks
+from upstream_limits import limits, Overloaded, INTERACTIVE, INLINE, BACKGROUND
+from text_router import TextRouter, Provider, UpstreamError
+from scheduler import Scheduler
+import webhook
 
 BOT_TOKEN      = os.environ.get("BOT_TOKEN", "")
 GROQ_API_KEY   = os.environ.get("GROQ_API_KEY", "")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "")
 ADMIN_ID       = int(os.environ.get("ADMIN_ID", "7189342638"))
 CHANNEL        = "@uzinnotech"
 DB_FILE        = "users_db.json"
 WEATHER_KEY    = os.environ.get("WEATHER_API_KEY", "")
+WARMUP_DELAY   = float(os.environ.get("WARMUP_DELAY", "2"))
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 log = logging.getLogger(__name__)
 
-def db_load():
-    if os.path.exists(DB_FILE):
-        try:
-            with open(DB_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
+users    = UserStore()
+storage  = SQLiteStorage()
+# TELEGRAM_API_URL — o'z Bot API serveri yoki lokal sinov uchun soxta server
+bot      = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None)
+dp       = Dispatcher(storage=storage)
+inflight = webhook.Inflight()
+dp.update.outer_middleware(inflight)
 
-def db_save(data):
-    try:
-        with open(DB_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        log.error(f"DB save error: {e}")
+async def sched_busy(event, data):
+    # Og'ir handlerlar navbati to'lgan — foydalanuvchiga darhol "band" javobi
+    lang = await get_lang(data["state"])
+    if isinstance(event, CallbackQuery):
+        await event.answer(T[lang]["ai_busy"], show_alert=True)
+    else:
+        await event.answer(T[lang]["ai_busy"])
 
-users_db = db_load()
-storage  = MemoryStorage()
-bot      = Bot(token=BOT_TOKEN)
-dp       = Dispatcher(storage=storage)
+# Chat bo'yicha tartib + og'ir handlerlar chegarasi + inline so'rovlarni tashlash
+sched = Scheduler(on_busy=sched_busy)
+sched.setup(dp)
 
 class S(StatesGroup):
     lang      = State()
@@ -66,6 +85,10 @@ class S(StatesGroup):
     qr        = State()
     pdf       = State()
     tts       = State()
+    wm_photo  = State()
+    wm_text   = State()
+    excel     = State()
+    weather   = State()
 
 T = {
     "uz": {
@@ -86,10 +109,12 @@ T = {
         "ai_welcome":   "\U0001f916 <b>AI Suhbat</b> rejimi!\n\n\U0001f4ac Matn, rasm yoki ovoz xabar yuboring.\n\U0001f4cc Orqaga: <b>\U0001f519 Orqaga</b>",
         "ai_thinking":  "\u23f3 Fikrlamoqda...",
         "ai_error":     "\u274c Xatolik yuz berdi. Qayta urinib ko'ring.",
+        "ai_busy":      "\u23f3 Hozir so'rovlar juda ko'p. Bir ozdan so'ng qayta urinib ko'ring.",
         "qr_welcome":   "\U0001f4f7 <b>QR Kod</b> generatori!\n\n\u270f\ufe0f Matn yoki link yuboring.\n\U0001f4cc Orqaga: <b>\U0001f519 Orqaga</b>",
         "qr_success":   "\u2705 QR kod tayyor!",
         "qr_error":     "\u274c QR yaratishda xatolik.",
         "qr_only_text": "\u26a0\ufe0f Faqat <b>matn yoki link</b> yuboring.",
+        "qr_batch_usage": "\U0001f4cb <b>/batch</b> dan keyin har bir qatorga bitta matn yoki link yozing (ko'pi bilan {max} ta).",
         "pdf_welcome":  "\U0001f4c4 <b>PDF Generator</b>!\n\n\u270f\ufe0f Matn yuboring. Bir nechta qism yuborishingiz mumkin.\n\U0001f4cc Orqaga: <b>\U0001f519 Orqaga</b>",
         "pdf_collect":  "\U0001f4dd Qabul qilindi! <b>{parts}</b> qism, <b>{chars}</b> belgi.\n\nDavom etasizmi?",
         "pdf_done_btn": "\u2705 PDF yaratish",
@@ -99,14 +124,17 @@ T = {
         "pdf_process":  "\u23f3 PDF yaratilmoqda...",
         "pdf_success":  "\u2705 PDF tayyor!",
         "pdf_error":    "\u274c PDF yaratishda xatolik.",
+        "pdf_missing":  "\u26a0\ufe0f {n} ta qism serverda topilmadi (bot qayta ishga tushgan). Iltimos, ularni qayta yuboring.",
         "tts_welcome":  "\U0001f399 <b>Matndan Ovoz</b>!\n\n\u270f\ufe0f Matn yuboring.\n\U0001f4cc Orqaga: <b>\U0001f519 Orqaga</b>",
         "tts_process":  "\u23f3 Ovoz yaratilmoqda...",
         "tts_success":  "\u2705 Ovoz tayyor!",
         "tts_error":    "\u274c Ovoz yaratishda xatolik.",
-        "excel_welcome":"\U0001f4ca <b>Excel Generator</b>!\n\nFormat:\n<code>Ism, Yosh, Shahar\nAli, 25, Toshkent</code>\n\n\U0001f4cc Orqaga: <b>\U0001f519 Orqaga</b>",
+        "excel_welcome":"\U0001f4ca <b>Excel Generator</b>!\n\nFormat:\n<code>Ism, Yosh, Shahar\nAli, 25, Toshkent</code>\n\n\U0001f4ce .csv/.txt fayl ham yuborishingiz mumkin.\n\U0001f4cc Orqaga: <b>\U0001f519 Orqaga</b>",
         "excel_process":"\u23f3 Excel yaratilmoqda...",
         "excel_success":"\u2705 Excel tayyor!",
         "excel_error":  "\u274c Excel yaratishda xatolik.",
+        "excel_csv":    "\u2705 Jadval juda katta \u2014 CSV formatida tayyorlandi (Excel ochadi).",
+        "excel_big":    "\u274c Fayl juda katta (maks. {mb} MB).",
         "wm_welcome":   "\U0001f5bc <b>Rasmga Matn</b>!\n\n\U0001f4f8 Avval rasm yuboring:",
         "wm_got_photo": "\u2705 Rasm qabul qilindi!\n\n\u270f\ufe0f Endi <b>matnni</b> yuboring:",
         "wm_process":   "\u23f3 Rasm tayyorlanmoqda...",
@@ -119,6 +147,8 @@ T = {
         "weather_loading":"\u23f3 Ob-havo ma'lumoti olinmoqda...",
         "weather_error": "\u274c Shahar topilmadi. To'g'ri nom yozing.",
         "weather_api_err":"\u274c Ob-havo xizmati ishlamayapti. Keyinroq urinib ko'ring.",
+        "weather_loc_btn":"\U0001f4cd Joylashuvni yuborish",
+        "weather_fmt":   "\U0001f324 <b>{name}</b>\n\n\U0001f321 {temp}\u00b0C (his qilinishi {feels}\u00b0C)\n\u2601\ufe0f {desc}\n\U0001f4a7 Namlik: {humidity}%\n\U0001f4a8 Shamol: {wind} m/s",
     },
     "ru": {
         "sub_msg":      "\u26a0\ufe0f \u0414\u043b\u044f \u0438\u0441\u043f\u043e\u043b\u044c\u0437\u043e\u0432\u0430\u043d\u0438\u044f \u043f\u043e\u0434\u043f\u0438\u0448\u0438\u0442\u0435\u0441\u044c \u043d\u0430 \u043a\u0430\u043d\u0430\u043b!",
@@ -138,10 +168,12 @@ T = {
         "ai_welcome":   "\U0001f916 <b>AI \u0427\u0430\u0442</b>!\n\n\U0001f4ac \u041e\u0442\u043f\u0440\u0430\u0432\u044c\u0442\u0435 \u0442\u0435\u043a\u0441\u0442, \u0444\u043e\u0442\u043e \u0438\u043b\u0438 \u0433\u043e\u043b\u043e\u0441.",
         "ai_thinking":  "\u23f3 \u0414\u0443\u043c\u0430\u044e...",
         "ai_error":     "\u274c \u041e\u0448\u0438\u0431\u043a\u0430. \u041f\u043e\u043f\u0440\u043e\u0431\u0443\u0439\u0442\u0435 \u0441\u043d\u043e\u0432\u0430.",
+        "ai_busy":      "\u23f3 \u0421\u0435\u0439\u0447\u0430\u0441 \u0441\u043b\u0438\u0448\u043a\u043e\u043c \u043c\u043d\u043e\u0433\u043e \u0437\u0430\u043f\u0440\u043e\u0441\u043e\u0432. \u041f\u043e\u043f\u0440\u043e\u0431\u0443\u0439\u0442\u0435 \u0447\u0443\u0442\u044c \u043f\u043e\u0437\u0436\u0435.",
         "qr_welcome":   "\U0001f4f7 <b>QR \u041a\u043e\u0434</b>!\n\n\u270f\ufe0f \u041e\u0442\u043f\u0440\u0430\u0432\u044c\u0442\u0435 \u0442\u0435\u043a\u0441\u0442 \u0438\u043b\u0438 \u0441\u0441\u044b\u043b\u043a\u0443.",
         "qr_success":   "\u2705 QR \u043a\u043e\u0434 \u0433\u043e\u0442\u043e\u0432!",
         "qr_error":     "\u274c \u041e\u0448\u0438\u0431\u043a\u0430 \u043f\u0440\u0438 \u0441\u043e\u0437\u0434\u0430\u043d\u0438\u0438 QR.",
         "qr_only_text": "\u26a0\ufe0f \u041e\u0442\u043f\u0440\u0430\u0432\u044c\u0442\u0435 \u0442\u043e\u043b\u044c\u043a\u043e <b>\u0442\u0435\u043a\u0441\u0442 \u0438\u043b\u0438 \u0441\u0441\u044b\u043b\u043a\u0443</b>.",
+        "qr_batch_usage": "\U0001f4cb \u041f\u043e\u0441\u043b\u0435 <b>/batch</b> \u043d\u0430\u043f\u0438\u0448\u0438\u0442\u0435 \u043f\u043e \u043e\u0434\u043d\u043e\u043c\u0443 \u0442\u0435\u043a\u0441\u0442\u0443 \u0438\u043b\u0438 \u0441\u0441\u044b\u043b\u043a\u0435 \u043d\u0430 \u0441\u0442\u0440\u043e\u043a\u0443 (\u043d\u0435 \u0431\u043e\u043b\u0435\u0435 {max}).",
         "pdf_welcome":  "\U0001f4c4 <b>PDF \u0413\u0435\u043d\u0435\u0440\u0430\u0442\u043e\u0440</b>!\n\n\u270f\ufe0f \u041e\u0442\u043f\u0440\u0430\u0432\u043b\u044f\u0439\u0442\u0435 \u0442\u0435\u043a\u0441\u0442 \u043f\u043e \u0447\u0430\u0441\u0442\u044f\u043c.",
         "pdf_collect":  "\U0001f4dd \u041f\u043e\u043b\u0443\u0447\u0435\u043d\u043e! <b>{parts}</b> \u0447\u0430\u0441\u0442\u0435\u0439, <b>{chars}</b> \u0441\u0438\u043c\u0432\u043e\u043b\u043e\u0432.\n\n\u041f\u0440\u043e\u0434\u043e\u043b\u0436\u0430\u0435\u0442\u0435?",
         "pdf_done_btn": "\u2705 \u0421\u043e\u0437\u0434\u0430\u0442\u044c PDF",
@@ -151,14 +183,17 @@ T = {
         "pdf_process":  "\u23f3 \u0421\u043e\u0437\u0434\u0430\u044e PDF...",
         "pdf_success":  "\u2705 PDF \u0433\u043e\u0442\u043e\u0432!",
         "pdf_error":    "\u274c \u041e\u0448\u0438\u0431\u043a\u0430 \u043f\u0440\u0438 \u0441\u043e\u0437\u0434\u0430\u043d\u0438\u0438 PDF.",
+        "pdf_missing":  "\u26a0\ufe0f {n} \u0447\u0430\u0441\u0442(\u0438) \u043d\u0435 \u043d\u0430\u0439\u0434\u0435\u043d\u044b \u043d\u0430 \u0441\u0435\u0440\u0432\u0435\u0440\u0435 (\u0431\u043e\u0442 \u043f\u0435\u0440\u0435\u0437\u0430\u043f\u0443\u0441\u043a\u0430\u043b\u0441\u044f). \u041f\u043e\u0436\u0430\u043b\u0443\u0439\u0441\u0442\u0430, \u043e\u0442\u043f\u0440\u0430\u0432\u044c\u0442\u0435 \u0438\u0445 \u0441\u043d\u043e\u0432\u0430.",
         "tts_welcome":  "\U0001f399 <b>\u0422\u0435\u043a\u0441\u0442 \u0432 \u0413\u043e\u043b\u043e\u0441</b>!\n\n\u270f\ufe0f \u041e\u0442\u043f\u0440\u0430\u0432\u044c\u0442\u0435 \u0442\u0435\u043a\u0441\u0442.",
         "tts_process":  "\u23f3 \u0421\u043e\u0437\u0434\u0430\u044e \u0430\u0443\u0434\u0438\u043e...",
         "tts_success":  "\u2705 \u0410\u0443\u0434\u0438\u043e \u0433\u043e\u0442\u043e\u0432\u043e!",
         "tts_error":    "\u274c \u041e\u0448\u0438\u0431\u043a\u0430 \u043f\u0440\u0438 \u0441\u043e\u0437\u0434\u0430\u043d\u0438\u0438 \u0430\u0443\u0434\u0438\u043e.",
-        "excel_welcome":"\U0001f4ca <b>Excel \u0413\u0435\u043d\u0435\u0440\u0430\u0442\u043e\u0440</b>!\n\n\u0424\u043e\u0440\u043c\u0430\u0442:\n<code>\u0418\u043c\u044f, \u0412\u043e\u0437\u0440\u0430\u0441\u0442, \u0413\u043e\u0440\u043e\u0434\n\u0410\u043b\u0438, 25, \u0422\u0430\u0448\u043a\u0435\u043d\u0442</code>",
+        "excel_welcome":"\U0001f4ca <b>Excel \u0413\u0435\u043d\u0435\u0440\u0430\u0442\u043e\u0440</b>!\n\n\u0424\u043e\u0440\u043c\u0430\u0442:\n<code>\u0418\u043c\u044f, \u0412\u043e\u0437\u0440\u0430\u0441\u0442, \u0413\u043e\u0440\u043e\u0434\n\u0410\u043b\u0438, 25, \u0422\u0430\u0448\u043a\u0435\u043d\u0442</code>\n\n\U0001f4ce \u041c\u043e\u0436\u043d\u043e \u043e\u0442\u043f\u0440\u0430\u0432\u0438\u0442\u044c .csv/.txt \u0444\u0430\u0439\u043b.",
         "excel_process":"\u23f3 \u0421\u043e\u0437\u0434\u0430\u044e Excel...",
         "excel_success":"\u2705 Excel \u0433\u043e\u0442\u043e\u0432!",
         "excel_error":  "\u274c \u041e\u0448\u0438\u0431\u043a\u0430 \u043f\u0440\u0438 \u0441\u043e\u0437\u0434\u0430\u043d\u0438\u0438 Excel.",
+        "excel_csv":    "\u2705 \u0422\u0430\u0431\u043b\u0438\u0446\u0430 \u0441\u043b\u0438\u0448\u043a\u043e\u043c \u0431\u043e\u043b\u044c\u0448\u0430\u044f \u2014 \u0433\u043e\u0442\u043e\u0432\u043e \u0432 CSV (\u043e\u0442\u043a\u0440\u043e\u0435\u0442\u0441\u044f \u0432 Excel).",
+        "excel_big":    "\u274c \u0424\u0430\u0439\u043b \u0441\u043b\u0438\u0448\u043a\u043e\u043c \u0431\u043e\u043b\u044c\u0448\u043e\u0439 (\u043c\u0430\u043a\u0441. {mb} MB).",
         "wm_welcome":   "\U0001f5bc <b>\u0422\u0435\u043a\u0441\u0442 \u043d\u0430 \u0424\u043e\u0442\u043e</b>!\n\n\U0001f4f8 \u0421\u043d\u0430\u0447\u0430\u043b\u0430 \u043e\u0442\u043f\u0440\u0430\u0432\u044c\u0442\u0435 \u0444\u043e\u0442\u043e:",
         "wm_got_photo": "\u2705 \u0424\u043e\u0442\u043e \u043f\u043e\u043b\u0443\u0447\u0435\u043d\u043e!\n\n\u270f\ufe0f \u041e\u0442\u043f\u0440\u0430\u0432\u044c\u0442\u0435 <b>\u0442\u0435\u043a\u0441\u0442</b>:",
         "wm_process":   "\u23f3 \u041e\u0431\u0440\u0430\u0431\u0430\u0442\u044b\u0432\u0430\u044e...",
@@ -171,6 +206,8 @@ T = {
         "weather_loading":"\u23f3 \u041f\u043e\u043b\u0443\u0447\u0430\u044e \u0434\u0430\u043d\u043d\u044b\u0435...",
         "weather_error": "\u274c \u0413\u043e\u0440\u043e\u0434 \u043d\u0435 \u043d\u0430\u0439\u0434\u0435\u043d.",
         "weather_api_err":"\u274c \u0421\u0435\u0440\u0432\u0438\u0441 \u043d\u0435\u0434\u043e\u0441\u0442\u0443\u043f\u0435\u043d.",
+        "weather_loc_btn":"\U0001f4cd \u041e\u0442\u043f\u0440\u0430\u0432\u0438\u0442\u044c \u0433\u0435\u043e\u043b\u043e\u043a\u0430\u0446\u0438\u044e",
+        "weather_fmt":   "\U0001f324 <b>{name}</b>\n\n\U0001f321 {temp}\u00b0C (\u043e\u0449\u0443\u0449\u0430\u0435\u0442\u0441\u044f \u043a\u0430\u043a {feels}\u00b0C)\n\u2601\ufe0f {desc}\n\U0001f4a7 \u0412\u043b\u0430\u0436\u043d\u043e\u0441\u0442\u044c: {humidity}%\n\U0001f4a8 \u0412\u0435\u0442\u0435\u0440: {wind} \u043c/\u0441",
     },
     "en": {
         "sub_msg":      "\u26a0\ufe0f Subscribe to our channel to use the bot!",
@@ -190,10 +227,12 @@ T = {
         "ai_welcome":   "\U0001f916 <b>AI Chat</b> activated!\n\n\U0001f4ac Send text, image or voice.",
         "ai_thinking":  "\u23f3 Thinking...",
         "ai_error":     "\u274c An error occurred. Please try again.",
+        "ai_busy":      "\u23f3 Too many requests right now. Please try again in a moment.",
         "qr_welcome":   "\U0001f4f7 <b>QR Code</b> Generator!\n\n\u270f\ufe0f Send text or a link.",
         "qr_success":   "\u2705 QR code ready!",
         "qr_error":     "\u274c Error creating QR code.",
         "qr_only_text": "\u26a0\ufe0f Please send only <b>text or a link</b>.",
+        "qr_batch_usage": "\U0001f4cb After <b>/batch</b> put one text or link per line (up to {max}).",
         "pdf_welcome":  "\U0001f4c4 <b>PDF Generator</b>!\n\n\u270f\ufe0f Send text in parts then create PDF.",
         "pdf_collect":  "\U0001f4dd Received! <b>{parts}</b> parts, <b>{chars}</b> chars.\n\nContinue?",
         "pdf_done_btn": "\u2705 Create PDF",
@@ -203,14 +242,17 @@ T = {
         "pdf_process":  "\u23f3 Creating PDF...",
         "pdf_success":  "\u2705 PDF ready!",
         "pdf_error":    "\u274c Error creating PDF.",
+        "pdf_missing":  "\u26a0\ufe0f {n} part(s) were lost on the server (the bot restarted). Please send them again.",
         "tts_welcome":  "\U0001f399 <b>Text to Speech</b>!\n\n\u270f\ufe0f Send text.",
         "tts_process":  "\u23f3 Creating audio...",
         "tts_success":  "\u2705 Audio ready!",
         "tts_error":    "\u274c Error creating audio.",
-        "excel_welcome":"\U0001f4ca <b>Excel Generator</b>!\n\nFormat:\n<code>Name, Age, City\nAli, 25, Tashkent</code>",
+        "excel_welcome":"\U0001f4ca <b>Excel Generator</b>!\n\nFormat:\n<code>Name, Age, City\nAli, 25, Tashkent</code>\n\n\U0001f4ce You can also send a .csv/.txt file.",
         "excel_process":"\u23f3 Creating Excel...",
         "excel_success":"\u2705 Excel ready!",
         "excel_error":  "\u274c Error creating Excel.",
+        "excel_csv":    "\u2705 Table is too large \u2014 made as CSV (opens in Excel).",
+        "excel_big":    "\u274c File is too large (max {mb} MB).",
         "wm_welcome":   "\U0001f5bc <b>Image Text</b>!\n\n\U0001f4f8 First send a photo:",
         "wm_got_photo": "\u2705 Photo received!\n\n\u270f\ufe0f Now send the <b>text</b>:",
         "wm_process":   "\u23f3 Processing image...",
@@ -223,45 +265,81 @@ T = {
         "weather_loading":"\u23f3 Getting weather data...",
         "weather_error": "\u274c City not found. Try again.",
         "weather_api_err":"\u274c Weather service unavailable.",
+        "weather_loc_btn":"\U0001f4cd Send location",
+        "weather_fmt":   "\U0001f324 <b>{name}</b>\n\n\U0001f321 {temp}\u00b0C (feels like {feels}\u00b0C)\n\u2601\ufe0f {desc}\n\U0001f4a7 Humidity: {humidity}%\n\U0001f4a8 Wind: {wind} m/s",
     }
 }
 
 BACK_TEXTS = ["\U0001f519 Orqaga", "\U0001f519 \u041d\u0430\u0437\u0430\u0434", "\U0001f519 Back"]
 
+# Klaviaturalar faqat tilga bog'liq — ishga tushishda bir marta quriladi va qayta ishlatiladi
+KB_LANG = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text="\U0001f1fa\U0001f1ff O'zbek"), KeyboardButton(text="\U0001f1f7\U0001f1fa \u0420\u0443\u0441\u0441\u043a\u0438\u0439")],
+    [KeyboardButton(text="\U0001f1ec\U0001f1e7 English")]
+], resize_keyboard=True)
+
+def build_keyboards(lang):
+    t = T[lang]
+    return {
+        "main": ReplyKeyboardMarkup(keyboard=[
+            [KeyboardButton(text=t["ai_btn"])],
+            [KeyboardButton(text=t["qr_btn"]), KeyboardButton(text=t["pdf_btn"])],
+            [KeyboardButton(text=t["tts_btn"]), KeyboardButton(text=t["wm_btn"])],
+            [KeyboardButton(text=t["excel_btn"]), KeyboardButton(text=t["weather_btn"])]
+        ], resize_keyboard=True),
+        "back": ReplyKeyboardMarkup(keyboard=[
+            [KeyboardButton(text=t["back_btn"])]
+        ], resize_keyboard=True),
+        "weather": ReplyKeyboardMarkup(keyboard=[
+            [KeyboardButton(text=t["weather_loc_btn"], request_location=True)],
+            [KeyboardButton(text=t["back_btn"])]
+        ], resize_keyboard=True),
+        "subscribe": InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=t["sub_btn"], url="https://t.me/uzinnotech")],
+            [InlineKeyboardButton(text=t["sub_check"], callback_data=f"sub_{lang}")]
+        ]),
+        "pdf": InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=t["pdf_done_btn"], callback_data="pdf_create"),
+             InlineKeyboardButton(text=t["pdf_undo_btn"], callback_data="pdf_undo")]
+        ]),
+    }
+
+KB = {lang: build_keyboards(lang) for lang in T}
+
 def kb_lang():
-    return ReplyKeyboardMarkup(keyboard=[
-        [KeyboardButton(text="\U0001f1fa\U0001f1ff O'zbek"), KeyboardButton(text="\U0001f1f7\U0001f1fa \u0420\u0443\u0441\u0441\u043a\u0438\u0439")],
-        [KeyboardButton(text="\U0001f1ec\U0001f1e7 English")]
-    ], resize_keyboard=True)
+    return KB_LANG
 
 def kb_main(lang):
-    return ReplyKeyboardMarkup(keyboard=[
-        [KeyboardButton(text=T[lang]["ai_btn"])],
-        [KeyboardButton(text=T[lang]["qr_btn"]), KeyboardButton(text=T[lang]["pdf_btn"])],
-        [KeyboardButton(text=T[lang]["tts_btn"])]
-    ], resize_keyboard=True)
+    return KB[lang]["main"]
 
 def kb_back(lang):
-    return ReplyKeyboardMarkup(keyboard=[
-        [KeyboardButton(text=T[lang]["back_btn"])]
-    ], resize_keyboard=True)
+    return KB[lang]["back"]
+
+def kb_weather(lang):
+    return KB[lang]["weather"]
 
 def kb_subscribe(lang):
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=T[lang]["sub_btn"], url="https://t.me/uzinnotech")],
-        [InlineKeyboardButton(text=T[lang]["sub_check"], callback_data=f"sub_{lang}")]
-    ])
+    return KB[lang]["subscribe"]
+
+def kb_pdf(lang):
+    return KB[lang]["pdf"]
 
 async def get_lang(state):
     d = await state.get_data()
-    return d.get("language", "uz")
+    if "language" in d:
+        return d["language"]
+    # Holat muddati o'tgan bo'lsa — foydalanuvchilar bazasidagi til
+    u = users.get(state.key.user_id)
+    return u.lang if u and u.lang != NO_LANG else "uz"
+
+async def fetch_subscribed(user_id):
+    m = await bot.get_chat_member(chat_id=CHANNEL, user_id=user_id)
+    return is_member_status(m.status)
+
+subs = SubscriptionCache(fetch_subscribed)
 
 async def is_subscribed(user_id):
-    try:
-        m = await bot.get_chat_member(chat_id=CHANNEL, user_id=user_id)
-        return m.status not in ["left", "kicked", "banned"]
-    except Exception:
-        return True
+    return await subs.check(user_id)
 
 async def check_sub(message, state):
     if not await is_subscribed(message.from_user.id):
@@ -274,65 +352,151 @@ async def send_chunks(message, text):
     for i in range(0, len(text), 4000):
         await message.answer(text[i:i+4000])
 
-def get_font(size):
-    paths = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-        "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
-        "/usr/share/fonts/truetype/freefont/FreeSansBold.ttf",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-    ]
-    for p in paths:
-        if os.path.exists(p):
-            try:
-                return ImageFont.truetype(p, size)
-            except Exception:
-                pass
-    return ImageFont.load_default()
-
-def setup_pdf_font(pdf, size):
-    paths = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
-    ]
-    for p in paths:
-        if os.path.exists(p):
-            try:
-                pdf.add_font("UniFont", "", p, uni=True)
-                pdf.set_font("UniFont", size=size)
-                return True
-            except Exception:
-                pass
-    pdf.set_font("Helvetica", size=size)
-    return False
-
-async def ai_text_req(messages, lang):
-    system = {
-        "uz": "Sen aqlli AI assistantsan. O'zbek tilida aniq va foydali javob ber.",
-        "ru": "\u0422\u044b \u0443\u043c\u043d\u044b\u0439 AI \u0430\u0441\u0441\u0438\u0441\u0442\u0435\u043d\u0442. \u041e\u0442\u0432\u0435\u0447\u0430\u0439 \u043f\u043e-\u0440\u0443\u0441\u0441\u043a\u0438.",
-        "en": "You are a smart AI assistant. Answer clearly in English."
-    }.get(lang, "You are a helpful AI assistant.")
-    try:
-        async with aiohttp.ClientSession() as sess:
-            r = await sess.post(
-                "https://api.groq.com/openai/v1/chat/completions",
+AI_SYSTEM = {
+    "uz": "Sen aqlli AI assistantsan. O'zbek tilida aniq va foydali javob ber.",
+    "ru": "\u0422\u044b \u0443\u043c\u043d\u044b\u0439 AI \u0430\u0441\u0441\u0438\u0441\u0442\u0435\u043d\u0442. \u041e\u0442\u0432\u0435\u0447\u0430\u0439 \u043f\u043e-\u0440\u0443\u0441\u0441\u043a\u0438.",
+    "en": "You are a smart AI assistant. Answer clearly in English."
+}
+
+answers = AnswerCache()
+
+def ai_system(lang):
+    return AI_SYSTEM.get(lang, "You are a helpful AI assistant.")
+
+def single_prompt(messages):
+    # Tarixsiz (bitta savol) so'rovlar keshlanadi
+    if len(messages) == 1 and messages[0].get("role") == "user":
+        return messages[0]["content"]
+    return None
+
+def groq_chat_payload(messages, lang, stream=False):
+    system = ai_system(lang)
+    payload = {
+        "model": "llama-3.3-70b-versatile",
+        "messages": [{"role": "system", "content": system}, *messages],
+        "temperature": 0.7,
+        "max_tokens": 2000
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+async def groq_text_req(messages, lang, priority=INTERACTIVE):
+    for attempt in range(2):
+        async with limits["groq_chat"].slot(priority):
+            async with http_pool.session("groq").post(
+                "/openai/v1/chat/completions",
                 headers={"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"},
-                json={
-                    "model": "llama-3.3-70b-versatile",
-                    "messages": [{"role": "system", "content": system}, *messages],
-                    "temperature": 0.7,
-                    "max_tokens": 2000
-                },
-                timeout=aiohttp.ClientTimeout(total=30)
-            )
-            if r.status == 200:
+                json=groq_chat_payload(messages, lang)
+            ) as r:
+                if r.status == 429 and limits["groq_chat"].throttled(r.headers) and attempt == 0:
+                    continue
+                if r.status != 200:
+                    raise UpstreamError(f"Groq {r.status}")
                 d = await r.json()
                 return d["choices"][0]["message"]["content"]
+
+async def gemini_text_req(messages, lang, priority=INTERACTIVE):
+    # OpenAI formatidagi tarix -> Gemini contents (assistant -> model, system -> systemInstruction)
+    system = "\n\n".join([ai_system(lang)] + [m["content"] for m in messages if m["role"] == "system"])
+    contents = [
+        {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+        for m in messages if m["role"] != "system"
+    ]
+    for attempt in range(2):
+        async with limits["gemini"].slot(priority):
+            async with http_pool.session("gemini").post(
+                f"/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}",
+                json={
+                    "systemInstruction": {"parts": [{"text": system}]},
+                    "contents": contents,
+                    "generationConfig": {"temperature": 0.7, "maxOutputTokens": 2000}
+                }
+            ) as r:
+                if r.status == 429 and limits["gemini"].throttled(r.headers) and attempt == 0:
+                    continue
+                if r.status != 200:
+                    raise UpstreamError(f"Gemini {r.status}")
+                d = await r.json()
+                return d["candidates"][0]["content"]["parts"][0]["text"]
+
+async def ai_text_stream(messages, lang, priority=INTERACTIVE):
+    for attempt in range(2):
+        async with limits["groq_chat"].slot(priority):
+            async with http_pool.session("groq").post(
+                "/openai/v1/chat/completions",
+                headers={"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"},
+                json=groq_chat_payload(messages, lang, stream=True)
+            ) as r:
+                if r.status == 429 and limits["groq_chat"].throttled(r.headers) and attempt == 0:
+                    continue
+                if r.status != 200:
+                    raise UpstreamError(f"Groq stream {r.status}")
+                async for delta in iter_sse_deltas(r):
+                    yield delta
+                return
+
+text_router = TextRouter(Provider("groq", groq_text_req, ai_text_stream), Provider("gemini", gemini_text_req))
+
+async def summarize_req(prompt, lang):
+    # Eski navbatlar xulosasi — fon ustuvorligida, javob keshisiz
+    return await text_router.complete([{"role": "user", "content": prompt}], lang, BACKGROUND)
+
+memory = ChatMemory(summarize_req)
+
+async def ai_text_req(messages, lang, priority=INTERACTIVE, lookup=True):
+    # lookup=False — chaqiruvchi keshni allaqachon tekshirgan (ikkinchi MinHash va miss hisoblanmaydi)
+    prompt = single_prompt(messages)
+    if prompt is not None and lookup:
+        cached = answers.get(lang, ai_system(lang), prompt)
+        if cached:
+            return cached
+    t0 = time.monotonic()
+    try:
+        reply = await text_router.complete(messages, lang, priority)
+    except Overloaded:
+        raise
     except Exception as e:
-        log.error(f"Groq error: {e}")
-    return None
+        log.error(f"AI text error: {e}")
+        return None
+    if prompt is not None:
+        answers.put(lang, ai_system(lang), prompt, reply, time.monotonic() - t0)
+    return reply
 
-async def ai_vision_req(image_bytes, prompt, lang):
+async def ai_reply(placeholder, history, lang):
+    # Javobni placeholder xabarga oqim bilan yozadi; oqim o'chiq bo'lsa eski usul
+    prompt = single_prompt(history)
+    cached = answers.get(lang, ai_system(lang), prompt) if prompt is not None else None
+    if cached or not AI_STREAM:
+        reply = cached or await ai_text_req(history, lang, lookup=False)
+        await placeholder.delete()
+        if reply:
+            await send_chunks(placeholder, reply)
+        return reply
+    editor = StreamEditor(bot, placeholder)
+    t0 = time.monotonic()
+    try:
+        # Router orqali: Groq birinchi bo'lagi kechiksa yoki xato bo'lsa Gemini javobi
+        async for delta in text_router.stream(history, lang, INTERACTIVE):
+            await editor.feed(delta)
+    except Overloaded:
+        raise
+    except Exception as e:
+        log.error(f"AI stream error: {e}")
+        if editor.full_text.strip():
+            await editor.finish(" \u2026")
+            return None
+        await placeholder.delete()
+        return None
+    reply = await editor.finish()
+    if not reply.strip():
+        await placeholder.delete()
+        return None
+    if prompt is not None:
+        answers.put(lang, ai_system(lang), prompt, reply, time.monotonic() - t0)
+    return reply
+
+async def ai_vision_req(image_bytes, prompt, lang, priority=INTERACTIVE):
     sys_p = {
         "uz": "Rasmni batafsil tahlil qil. O'zbek tilida javob ber.",
         "ru": "\u041f\u043e\u0434\u0440\u043e\u0431\u043d\u043e \u043f\u0440\u043e\u0430\u043d\u0430\u043b\u0438\u0437\u0438\u0440\u0443\u0439 \u0438\u0437\u043e\u0431\u0440\u0430\u0436\u0435\u043d\u0438\u0435. \u041e\u0442\u0432\u0435\u0447\u0430\u0439 \u043f\u043e-\u0440\u0443\u0441\u0441\u043a\u0438.",
@@ -340,60 +504,137 @@ async def ai_vision_req(image_bytes, prompt, lang):
     }.get(lang, "Analyze the image.")
     try:
         img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-        async with aiohttp.ClientSession() as sess:
-            r = await sess.post(
-                f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}",
-                json={
-                    "contents": [{
-                        "parts": [
-                            {"text": sys_p + "\n\n" + (prompt or "Bu rasmda nima bor? Batafsil tushuntir.")},
-                            {"inline_data": {"mime_type": "image/jpeg", "data": img_b64}}
-                        ]
-                    }],
-                    "generationConfig": {"temperature": 0.7, "maxOutputTokens": 2000}
-                },
-                timeout=aiohttp.ClientTimeout(total=30)
-            )
-            if r.status == 200:
-                d = await r.json()
-                return d["candidates"][0]["content"]["parts"][0]["text"]
-            else:
-                err = await r.text()
-                log.error(f"Gemini {r.status}: {err}")
+        for attempt in range(2):
+            async with limits["gemini"].slot(priority):
+                async with http_pool.session("gemini").post(
+                    f"/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}",
+                    json={
+                        "contents": [{
+                            "parts": [
+                                {"text": sys_p + "\n\n" + (prompt or "Bu rasmda nima bor? Batafsil tushuntir.")},
+                                {"inline_data": {"mime_type": "image/jpeg", "data": img_b64}}
+                            ]
+                        }],
+                        "generationConfig": {"temperature": 0.7, "maxOutputTokens": 2000}
+                    }
+                ) as r:
+                    if r.status == 429 and limits["gemini"].throttled(r.headers) and attempt == 0:
+                        continue
+                    if r.status == 200:
+                        d = await r.json()
+                        return d["candidates"][0]["content"]["parts"][0]["text"]
+                    err = await r.text()
+                    log.error(f"Gemini {r.status}: {err}")
+                    return None
+    except Overloaded:
+        raise
     except Exception as e:
         log.error(f"Gemini error: {e}")
     return None
 
-async def ai_voice_req(audio_bytes):
+async def ai_voice_req(open_stream, priority=INTERACTIVE):
     try:
-        async with aiohttp.ClientSession() as sess:
+        for attempt in range(2):
+            # Fayl oqim bilan (chunked) yuboriladi; qayta urinishda oqim yangidan ochiladi
             form = aiohttp.FormData()
-            form.add_field("file", audio_bytes, filename="voice.ogg", content_type="audio/ogg")
+            form.add_field("file", open_stream(), filename="voice.ogg", content_type="audio/ogg")
             form.add_field("model", "whisper-large-v3")
-            r = await sess.post(
-                "https://api.groq.com/openai/v1/audio/transcriptions",
-                headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
-                data=form,
-                timeout=aiohttp.ClientTimeout(total=30)
-            )
-            if r.status == 200:
-                d = await r.json()
-                return d.get("text", "")
+            async with limits["groq_whisper"].slot(priority):
+                async with http_pool.session("groq").post(
+                    "/openai/v1/audio/transcriptions",
+                    headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
+                    data=form
+                ) as r:
+                    if r.status == 429 and limits["groq_whisper"].throttled(r.headers) and attempt == 0:
+                        continue
+                    if r.status == 200:
+                        d = await r.json()
+                        return d.get("text", "")
+                    log.error(f"Whisper {r.status}")
+                    return None
+    except Overloaded:
+        raise
     except Exception as e:
         log.error(f"Whisper error: {e}")
     return None
 
+async def tg_file_stream(file_id):
+    # Telegram faylini bo'laklab o'qish — butun fayl xotiraga yig'ilmaydi
+    file = await bot.get_file(file_id)
+    if bot.session.api.is_local:
+        chunks = file_chunks(file.file_path)
+    else:
+        chunks = bot.session.stream_content(bot.session.api.file_url(bot.token, file.file_path), chunk_size=VOICE_CHUNK)
+    async for chunk in chunks:
+        yield chunk
+
+voice = VoiceEngine(ai_voice_req)
+
+async def weather_req(lat, lon, lang):
+    # OpenWeatherMap joriy ob-havo; WeatherService katakcha markazi bilan chaqiradi
+    if not WEATHER_KEY:
+        raise WeatherError("WEATHER_API_KEY is not set")
+    try:
+        async with limits["weather"].slot(INTERACTIVE):
+            async with http_pool.session("weather").get(
+                "/data/2.5/weather",
+                params={"lat": lat, "lon": lon, "appid": WEATHER_KEY, "units": "metric", "lang": lang}
+            ) as r:
+                if r.status == 429:
+                    limits["weather"].throttled(r.headers)
+                if r.status != 200:
+                    raise WeatherError(f"Weather {r.status}")
+                d = await r.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError, Overloaded) as e:
+        raise WeatherError(str(e) or type(e).__name__)
+    return {
+        "name": d.get("name") or f"{lat:.1f}, {lon:.1f}",
+        "temp": round(d["main"]["temp"]),
+        "feels": round(d["main"]["feels_like"]),
+        "humidity": d["main"]["humidity"],
+        "wind": round(d.get("wind", {}).get("speed", 0), 1),
+        "desc": (d.get("weather") or [{}])[0].get("description", "").capitalize(),
+    }
+
+async def geocode_req(name):
+    # Faqat lokal indeksda topilmagan nomlar uchun (natija WeatherService da keshlanadi)
+    if not WEATHER_KEY:
+        return None
+    try:
+        async with limits["weather"].slot(INTERACTIVE):
+            async with http_pool.session("weather").get(
+                "/geo/1.0/direct", params={"q": name, "limit": 1, "appid": WEATHER_KEY}
+            ) as r:
+                if r.status != 200:
+                    raise WeatherError(f"Geocode {r.status}")
+                d = await r.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError, Overloaded) as e:
+        raise WeatherError(str(e) or type(e).__name__)
+    if not d:
+        return None
+    return d[0]["name"], d[0]["lat"], d[0]["lon"]
+
+weather = WeatherService(weather_req, geocode_req)
+
+async def inline_fetch(text):
+    return await ai_text_req([{"role": "user", "content": text}], "uz", priority=INLINE)
+
+inline_ai = InlineAnswerer(inline_fetch)
+qr_engine = QREngine()
+file_ids  = FileIdCache()
+tts       = TTSEngine()
+pdfs      = PDFEngine()
+vision    = VisionPrep()
+wm        = WatermarkEngine()
+excel     = ExcelEngine()
+
 @dp.message(Command("start"))
 async def cmd_start(msg: Message, state: FSMContext):
-    uid = str(msg.from_user.id)
-    users_db[uid] = {
-        "name": msg.from_user.full_name,
-        "username": f"@{msg.from_user.username}" if msg.from_user.username else "\u2014",
-        "lang": users_db.get(uid, {}).get("lang", "\u2014"),
-        "date": datetime.now().strftime("%d.%m.%Y %H:%M"),
-        "count": users_db.get(uid, {}).get("count", 0) + 1
-    }
-    db_save(users_db)
+    await users.touch(
+        msg.from_user.id,
+        msg.from_user.full_name,
+        f"@{msg.from_user.username}" if msg.from_user.username else "\u2014"
+    )
     await state.set_state(S.lang)
     await msg.answer(
         "\U0001f44b Assalomu alaykum! / \u0417\u0434\u0440\u0430\u0432\u0441\u0442\u0432\u0443\u0439\u0442\u0435! / Hello!\n\n\U0001f310 Tilni tanlang / \u0412\u044b\u0431\u0435\u0440\u0438\u0442\u0435 \u044f\u0437\u044b\u043a / Choose language:",
@@ -411,10 +652,7 @@ async def choose_lang(msg: Message, state: FSMContext):
         await msg.answer("Iltimos, til tugmasini bosing:", reply_markup=kb_lang())
         return
     await state.update_data(language=lang)
-    uid = str(msg.from_user.id)
-    if uid in users_db:
-        users_db[uid]["lang"] = lang
-        db_save(users_db)
+    users.set_lang(msg.from_user.id, lang)
     if not await is_subscribed(msg.from_user.id):
         await msg.answer(T[lang]["sub_msg"], reply_markup=kb_subscribe(lang))
         return
@@ -424,6 +662,8 @@ async def choose_lang(msg: Message, state: FSMContext):
 @dp.callback_query(F.data.startswith("sub_"))
 async def cb_sub(cb: CallbackQuery, state: FSMContext):
     lang = cb.data.split("_")[1]
+    # "Obuna bo'ldim" — keshdagi eski salbiy javobni e'tiborsiz qoldiramiz
+    subs.invalidate(cb.from_user.id)
     if await is_subscribed(cb.from_user.id):
         await state.update_data(language=lang)
         await state.set_state(S.menu)
@@ -432,13 +672,20 @@ async def cb_sub(cb: CallbackQuery, state: FSMContext):
     else:
         await cb.answer(T[lang]["sub_error"], show_alert=True)
 
+@dp.chat_member()
+async def on_channel_member(event: ChatMemberUpdated):
+    # Bot kanalda admin bo'lsa, obuna o'zgarishi darhol keshga tushadi
+    if event.chat.username and f"@{event.chat.username}".lower() == CHANNEL.lower():
+        subs.update(event.new_chat_member.user.id, event.new_chat_member.status)
+
 @dp.message(F.text.in_(["\U0001f519 Orqaga", "\U0001f519 \u041d\u0430\u0437\u0430\u0434", "\U0001f519 Back"]))
 async def go_back(msg: Message, state: FSMContext):
     cur = await state.get_state()
     if cur == S.lang:
         return
     lang = await get_lang(state)
-    await state.update_data(chat_history=[], pdf_parts=[], pdf_msg_ids=[], pdf_prompt_ids=[], wm_photo_id=None, weather=None)
+    await state.update_data(chat_history=[], chat_summary="", pdf_layout=[], pdf_chars=0, pdf_prompt_ids=[], wm_photo_id=None, weather=None)
+    await pdfs.discard(msg.from_user.id)
     await state.set_state(S.menu)
     await msg.answer(T[lang]["welcome"].format(name=msg.from_user.first_name), reply_markup=kb_main(lang), parse_mode="HTML")
 
@@ -446,15 +693,10 @@ async def go_back(msg: Message, state: FSMContext):
 async def cmd_stats(msg: Message):
     if msg.from_user.id != ADMIN_ID:
         return
-    total = len(users_db)
-    langs = {"uz": 0, "ru": 0, "en": 0}
-    for u in users_db.values():
-        l = u.get("lang", "\u2014")
-        langs[l] = langs.get(l, 0) + 1
-    last = list(users_db.items())[-10:]
+    total, langs, last = await users.summary(10)
     last_txt = ""
-    for uid, u in reversed(last):
-        last_txt += f"\n\u2022 {u['name']} {u['username']} [{u['lang']}] \u2014 {u['date']}"
+    for u in last:
+        last_txt += f"\n\u2022 {u.name} {u.username} [{u.lang}] \u2014 {u.date}"
     await msg.answer(
         f"\U0001f4ca <b>Bot Statistikasi</b>\n\n"
         f"\U0001f465 Jami: <b>{total}</b>\n\n"
@@ -466,89 +708,202 @@ async def cmd_stats(msg: Message):
         parse_mode="HTML"
     )
 
+# BROADCAST (admin): /broadcast — javob qilingan xabar (yoki buyruqdan keyingi matn) hammaga
+def broadcast_text(job, final):
+    p = job.progress()
+    head = {"running": "\U0001f4e4 Tarqatma", "done": "\u2705 Tarqatma tugadi", "cancelled": "\u23f9 Tarqatma to'xtatildi"}.get(job.status, job.status)
+    eta = f", ~{p['eta']} s qoldi" if p["eta"] is not None and not final else ""
+    return (f"{head} #{p['id']}\n\n"
+            f"{p['done']}/{p['total']} \u2014 yuborildi {p['sent']}, bloklagan {p['blocked']}, xato {p['failed']}\n"
+            f"Tezlik: {p['rate']} msg/s{eta}")
+
+async def broadcast_report(job, final):
+    if job.report_msg:
+        try:
+            await bot.edit_message_text(broadcast_text(job, final), chat_id=job.admin_chat, message_id=job.report_msg)
+        except TelegramBadRequest:
+            pass
+
+broadcaster = Broadcaster(bot, users, report=broadcast_report)
+
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(msg: Message):
+    if msg.from_user.id != ADMIN_ID:
+        return
+    text = (msg.text or "").partition(" ")[2].strip()
+    src = msg.reply_to_message
+    if src is None and not text:
+        await msg.answer("Xabarga javob sifatida /broadcast yozing yoki: /broadcast matn")
+        return
+    status = await msg.answer("\U0001f4e4 Tarqatma boshlanmoqda...")
+    job = await broadcaster.create(msg.chat.id, from_chat=src and msg.chat.id, message_id=src and src.message_id,
+                                   text=None if src else text, report_msg=status.message_id)
+    if job is None:
+        await status.edit_text("Boshqa tarqatma ishlayapti: /broadcast_status yoki /broadcast_stop")
+
+@dp.message(Command("broadcast_status"))
+async def cmd_broadcast_status(msg: Message):
+    if msg.from_user.id != ADMIN_ID:
+        return
+    job = await broadcaster.current()
+    await msg.answer(broadcast_text(job, job.status != "running") if job else "Tarqatmalar yo'q")
+
+@dp.message(Command("broadcast_stop"))
+async def cmd_broadcast_stop(msg: Message):
+    if msg.from_user.id != ADMIN_ID:
+        return
+    await msg.answer("\u23f9 To'xtatilmoqda" if await broadcaster.cancel() else "Ishlayotgan tarqatma yo'q")
+
+@dp.message(Command("metrics"))
+async def cmd_metrics(msg: Message):
+    if msg.from_user.id != ADMIN_ID:
+        return
+    st = inflight.stats()
+    lines = ["\U0001f4c8 <b>Metrics</b>", "", f"<b>Updates</b> ({webhook.BOT_MODE}, pid {os.getpid()})",
+             f"  inflight={st['inflight']} peak={st['peak']} handled={st['handled']}"]
+    st = sched.stats()
+    lines += [f"  chats={st['chats']} queued={st['queued']} max_chat_queue={st['max_chat_queue']} dropped={st['chat_dropped']} shed={st['shed']} inline={st['inline_running']} released={st['released']}",
+              f"  heavy: running={st['heavy_running']}/{st['heavy_limit']} waiting={st['heavy_waiting']} busy={st['busy']} wait avg={st['wait_avg']}s max={st['wait_max']}s"]
+    if st["top"]:
+        lines.append("  queues: " + ", ".join(f"{c}={n}" for c, n in st["top"]))
+    lines += ["", "<b>HTTP pools</b>"]
+    for name, st in http_pool.pool_stats().items():
+        lines.append(f"  {name}: open={st['open']} idle={st['idle']} in_use={st['in_use']} waiting={st['waiting']} (limit {st['limit_per_host']}/{st['limit']})")
+    st = users.stats()
+    lines += ["", "<b>User store</b>", f"  users={st['users']} active={st['active']} dirty={st['dirty']} flushes={st['flushes']} rows={st['rows_written']}"]
+    st = broadcaster.stats()
+    lim = st["limiter"]
+    lines += ["", "<b>Broadcast</b>", f"  limiter: granted={lim['granted']} 429={lim['429']} wait avg={lim['wait_avg']}s"]
+    if "job" in st:
+        j = st["job"]
+        lines.append(f"  #{j['id']}: {j['done']}/{j['total']} sent={j['sent']} blocked={j['blocked']} failed={j['failed']} rate={j['rate']}/s")
+    st = memory.stats()
+    lines += ["", "<b>Chat prompts</b> (~tokens)", f"  requests={st['requests']} avg={st['avg']} p95={st['p95']} max={st['max']} budget={st['budget']}",
+              f"  summaries={st['summaries']} folded={st['folded']} errors={st['summary_errors']} pending={st['pending']} dropped={st['dropped']}"]
+    st = storage.stats()
+    lines += ["", "<b>FSM storage</b>", f"  cached={st['cached']} hits={st['hits']} misses={st['misses']} revalidated={st['revalidated']} writes={st['writes']} conflicts={st['conflicts']} expired={st['expired']}"]
+    st = subs.stats()
+    lines += ["", "<b>Subscription cache</b>", f"  size={st['size']} hits={st['hits']} misses={st['misses']} rate={st['hit_rate']} coalesced={st['coalesced']} errors={st['errors']}"]
+    st = answers.stats()
+    lines += ["", "<b>Answer cache</b>", f"  size={st['size']} bytes={st['bytes']} exact={st['hits_exact']} near={st['hits_near']} misses={st['misses']} rate={st['hit_rate']} saved={st['latency_saved']}s"]
+    st = qr_engine.stats()
+    lines += ["", "<b>QR</b>", f"  rendered={st['rendered']} cache={st['size']} ({st['bytes']} B) hits={st['hits']} rate={st['hit_rate']} pool={st['pool']}x{st['workers']}"]
+    st = file_ids.stats()
+    lines += ["", "<b>File id cache</b>", f"  size={st['size']} hits={st['hits']} uploads={st['uploads']} stale={st['stale']} saved={st['bytes_saved']} B uploaded={st['bytes_uploaded']} B"]
+    st = tts.stats()
+    lines += ["", "<b>TTS</b>", f"  backend={st['backend']} segments={st['segments']} synthesized={st['synthesized']} cache={st['size']} ({st['bytes']} B) rate={st['hit_rate']}"]
+    st = pdfs.stats()
+    lines += ["", "<b>PDF</b>", f"  rendered={st['rendered']} parts={st['parts']} waited={st['waited']} active={st['active_users']} pool={st['pool']}x{st['workers']}"]
+    st = voice.stats()
+    lines += ["", "<b>Voice</b>", f"  streamed={st['streamed']} split={st['split']} segments={st['segments']} audio={st['seconds']}s cache={st['cached']} hits={st['hits']} rate={st['hit_rate']} coalesced={st['coalesced']} fallbacks={st['fallbacks']}"]
+    st = wm.stats()
+    lines += ["", "<b>Image text</b>", f"  rendered={st['rendered']} cache={st['size']} ({st['bytes']} B) hits={st['hits']} in={st['bytes_in']} B out={st['bytes_out']} B pool={st['pool']}x{st['workers']}"]
+    st = excel.stats()
+    lines += ["", "<b>Excel</b>", f"  tables={st['tables']} rows={st['rows']} cells={st['cells']} rows/s={st['rows_per_sec']} csv_fallbacks={st['csv_fallbacks']} in={st['bytes_in']} B out={st['bytes_out']} B"]
+    st = weather.stats()
+    lines += ["", "<b>Weather</b>", f"  lookups={st['lookups']} upstream={st['upstream']} cache={st['cached']} hits={st['hits']} coalesced={st['coalesced']} stale={st['stale']} geocoded={st['geocoded']} not_found={st['not_found']}"]
+    st = vision.stats()
+    lines += ["", "<b>Vision</b>", f"  requests={st['requests']} reencoded={st['reencoded']} downloaded={st['downloaded']} B uploaded={st['uploaded']} B saved={st['saved']} B"]
+    lines += ["", "<b>Upstream limits</b>"]
+    for name, lim in limits.items():
+        st = lim.stats()
+        lines.append(f"  {name}: inflight={st['inflight']} depth={st['depth']} granted={st['granted']} shed={st['shed']} 429={st['429']} wait avg={st['wait_avg']}s max={st['wait_max']}s")
+    st = text_router.stats()
+    lines += ["", "<b>Text router</b>", f"  hedges={st['hedges']} hedge_wins={st['hedge_wins']} failovers={st['failovers']} hedge_delay={st['hedge_delay']}s"]
+    for name in ("groq", "gemini"):
+        p = st[name]
+        lines.append(f"  {name}: calls={p['calls']} errors={p['errors']} wins={p['wins']} breaker={p['breaker']} p95={p['p95']}s first_token={p['first_token']}s")
+    st = inline_ai.stats()
+    lines += ["", "<b>Inline</b>", f"  queries={st['queries']} upstream={st['upstream']} saved={st['saved']} (debounced={st['debounced']} cache={st['cache_hits']} coalesced={st['coalesced']}) cancelled={st['cancelled_upstream']}"]
+    await msg.answer("\n".join(lines), parse_mode="HTML")
+
 # AI CHAT
 @dp.message(F.text.in_(["\U0001f916 AI Suhbat", "\U0001f916 AI \u0427\u0430\u0442", "\U0001f916 AI Chat"]))
 async def ai_start(msg: Message, state: FSMContext):
     if not await check_sub(msg, state): return
     lang = await get_lang(state)
     await state.set_state(S.ai_chat)
-    await state.update_data(chat_history=[])
+    await state.update_data(chat_history=[], chat_summary="")
     await msg.answer(T[lang]["ai_welcome"], reply_markup=kb_back(lang), parse_mode="HTML")
 
-@dp.message(S.ai_chat, F.text)
+@dp.message(S.ai_chat, F.text, flags={"heavy": True})
 async def ai_text_handler(msg: Message, state: FSMContext):
     if not await check_sub(msg, state): return
     if msg.text in ["\U0001f519 Orqaga", "\U0001f519 \u041d\u0430\u0437\u0430\u0434", "\U0001f519 Back"]: return
     lang = await get_lang(state)
     data = await state.get_data()
-    history = data.get("chat_history", [])
+    history = memory.build(data, msg.text, ai_system(lang))
     wait = await msg.answer(T[lang]["ai_thinking"])
-    history.append({"role": "user", "content": msg.text})
-    if len(history) > 20: history = history[-20:]
-    reply = await ai_text_req(history, lang)
-    await wait.delete()
+    try:
+        reply = await ai_reply(wait, history, lang)
+    except Overloaded:
+        await wait.delete()
+        await msg.answer(T[lang]["ai_busy"])
+        return
     if reply:
-        history.append({"role": "assistant", "content": reply})
-        await state.update_data(chat_history=history)
-        await send_chunks(msg, reply)
+        await memory.push(state, msg.text, reply, lang)
     else:
         await msg.answer(T[lang]["ai_error"])
 
-@dp.message(S.ai_chat, F.photo)
+@dp.message(S.ai_chat, F.photo, flags={"heavy": True})
 async def ai_photo_handler(msg: Message, state: FSMContext):
     if not await check_sub(msg, state): return
     lang = await get_lang(state)
     wait = await msg.answer(T[lang]["ai_thinking"])
     try:
-        file = await bot.get_file(msg.photo[-1].file_id)
+        # Target o'lchamga yetadigan eng kichik PhotoSize yuklanadi
+        photo = vision.pick(msg.photo)
+        file = await bot.get_file(photo.file_id)
         buf = io.BytesIO()
         await bot.download_file(file.file_path, buf)
-        buf.seek(0)
-        img = Image.open(buf).convert("RGB")
-        out = io.BytesIO()
-        img.save(out, format="JPEG", quality=85)
-        out.seek(0)
-        reply = await ai_vision_req(out.read(), msg.caption or "", lang)
+        raw = buf.getvalue()
+        jpeg = await vision.prepare(raw)
+        vision.record(len(raw), (len(jpeg) + 2) // 3 * 4, msg.photo[-1].file_size)
+        reply = await ai_vision_req(jpeg, msg.caption or "", lang)
         await wait.delete()
         if reply:
             await send_chunks(msg, reply)
         else:
             await msg.answer(T[lang]["ai_error"])
+    except Overloaded:
+        await wait.delete()
+        await msg.answer(T[lang]["ai_busy"])
     except Exception as e:
         log.error(f"AI photo: {e}")
         await wait.delete()
         await msg.answer(T[lang]["ai_error"])
 
-@dp.message(S.ai_chat, F.voice)
+@dp.message(S.ai_chat, F.voice, flags={"heavy": True})
 async def ai_voice_handler(msg: Message, state: FSMContext):
     if not await check_sub(msg, state): return
     lang = await get_lang(state)
     wait = await msg.answer(T[lang]["ai_thinking"])
     try:
-        file = await bot.get_file(msg.voice.file_id)
-        buf = io.BytesIO()
-        await bot.download_file(file.file_path, buf)
-        text = await ai_voice_req(buf.getvalue())
+        # file_unique_id bo'yicha kesh: forward qilingan yoki qayta yuborilgan xabar qayta o'girilmaydi
+        text = await voice.text(msg.voice.file_unique_id, msg.voice.duration or 0,
+                                lambda: tg_file_stream(msg.voice.file_id))
         if not text:
             await wait.delete()
             await msg.answer(T[lang]["ai_error"])
             return
         data = await state.get_data()
-        history = data.get("chat_history", [])
-        history.append({"role": "user", "content": text})
-        if len(history) > 20: history = history[-20:]
-        reply = await ai_text_req(history, lang)
-        await wait.delete()
+        history = memory.build(data, text, ai_system(lang))
+        # Placeholder transkripsiyaga aylanadi, javob yangi xabarga oqim bilan yoziladi
+        await wait.edit_text(f"\U0001f3a4 <i>{html.escape(text)}</i>", parse_mode="HTML")
+        wait = await msg.answer(T[lang]["ai_thinking"])
+        reply = await ai_reply(wait, history, lang)
         if reply:
-            history.append({"role": "assistant", "content": reply})
-            await state.update_data(chat_history=history)
-            await msg.answer(f"\U0001f3a4 <i>{text}</i>", parse_mode="HTML")
-            await send_chunks(msg, reply)
+            await memory.push(state, text, reply, lang)
         else:
             await msg.answer(T[lang]["ai_error"])
+    except Overloaded:
+        try: await wait.delete()
+        except: pass
+        await msg.answer(T[lang]["ai_busy"])
     except Exception as e:
         log.error(f"AI voice: {e}")
-        await wait.delete()
+        try: await wait.delete()
+        except: pass
         await msg.answer(T[lang]["ai_error"])
 
 # QR
@@ -565,18 +920,53 @@ async def qr_create(msg: Message, state: FSMContext):
     if msg.text in ["\U0001f519 Orqaga", "\U0001f519 \u041d\u0430\u0437\u0430\u0434", "\U0001f519 Back"]: return
     lang = await get_lang(state)
     try:
-        qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=10, border=4)
-        qr.add_data(msg.text)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        await msg.answer_photo(BufferedInputFile(buf.read(), "qr.png"), caption=T[lang]["qr_success"])
+        batch = batch_lines(msg.text)
+        if batch is not None:
+            if not batch:
+                # Yolg'iz "/batch" — QR emas, qo'llanma
+                await msg.answer(T[lang]["qr_batch_usage"].format(max=QR_BATCH_MAX), parse_mode="HTML")
+                return
+            await qr_send_batch(msg, batch, lang)
+            return
+        await qr_send_one(msg, await qr_engine.render(msg.text), lang)
     except Exception as e:
         log.error(f"QR: {e}")
         await msg.answer(T[lang]["qr_error"])
 
+async def qr_send_one(msg, png, lang):
+    await file_ids.send(
+        "qr", png, lambda: BufferedInputFile(png, "qr.png"),
+        lambda media: msg.answer_photo(media, caption=T[lang]["qr_success"])
+    )
+
+async def qr_send_batch(msg, payloads, lang):
+    pngs = await qr_engine.render_batch(payloads)
+    if len(pngs) == 1:
+        # sendMediaGroup 2-10 ta element talab qiladi
+        await qr_send_one(msg, pngs[0], lang)
+    elif len(pngs) <= 10:
+        keys = [content_key("qr", png) for png in pngs]
+        def album(use_cache):
+            media = []
+            for i, (key, png) in enumerate(zip(keys, pngs), 1):
+                fid = file_ids.get(key) if use_cache else None
+                media.append(InputMediaPhoto(media=fid or BufferedInputFile(png, f"qr_{i}.png")))
+            media[0].caption = T[lang]["qr_success"]
+            return media
+        try:
+            sent = await msg.answer_media_group(album(True))
+        except TelegramBadRequest:
+            for key in keys:
+                await file_ids.drop(key)
+            sent = await msg.answer_media_group(album(False))
+        for key, png, m in zip(keys, pngs, sent):
+            if file_ids.get(key) is None and sent_file_id(m):
+                await file_ids.put(key, "qr", sent_file_id(m), len(png))
+        await file_ids.touch()
+    else:
+        zipped = await asyncio.to_thread(zip_pngs, pngs)
+        await msg.answer_document(BufferedInputFile(zipped, "qr_codes.zip"), caption=T[lang]["qr_success"])
+
 @dp.message(S.qr, ~F.text)
 async def qr_wrong(msg: Message, state: FSMContext):
     lang = await get_lang(state)
@@ -588,7 +978,8 @@ async def pdf_start(msg: Message, state: FSMContext):
     if not await check_sub(msg, state): return
     lang = await get_lang(state)
     await state.set_state(S.pdf)
-    await state.update_data(pdf_parts=[], pdf_msg_ids=[], pdf_prompt_ids=[])
+    await state.update_data(pdf_layout=[], pdf_chars=0, pdf_prompt_ids=[])
+    await pdfs.discard(msg.from_user.id)
     await msg.answer(T[lang]["pdf_welcome"], reply_markup=kb_back(lang), parse_mode="HTML")
 
 @dp.message(S.pdf, F.text)
@@ -596,60 +987,67 @@ async def pdf_collect(msg: Message, state: FSMContext):
     if not await check_sub(msg, state): return
     if msg.text in ["\U0001f519 Orqaga", "\U0001f519 \u041d\u0430\u0437\u0430\u0434", "\U0001f519 Back"]: return
     lang = await get_lang(state)
-    data = await state.get_data()
-    parts = data.get("pdf_parts", [])
-    msg_ids = data.get("pdf_msg_ids", [])
-    prompt_ids = data.get("pdf_prompt_ids", [])
-    parts.append(msg.text)
-    msg_ids.append(msg.message_id)
-    for pid in prompt_ids:
+    # Har bir qism kelishi bilan satrlarga bo'linib o'z spool fayliga yoziladi;
+    # holatda faqat [message_id, bayt, satr, belgi] saqlanadi
+    try:
+        size, lines = await pdfs.add_part(msg.from_user.id, msg.message_id, msg.text)
+    except Exception as e:
+        log.error(f"PDF layout: {e}")
+        await msg.answer(T[lang]["pdf_error"])
+        return
+    old_prompts = []
+    def add_part(d):
+        # CAS: parallel qo'shish/bekor qilish bir-birini ustidan yozmaydi
+        old_prompts[:] = d.get("pdf_prompt_ids", [])
+        d["pdf_layout"] = d.get("pdf_layout", []) + [[msg.message_id, size, lines, len(msg.text)]]
+        d["pdf_chars"] = d.get("pdf_chars", 0) + len(msg.text)
+        d["pdf_prompt_ids"] = []
+    data = await update_state_data(state, add_part)
+    for pid in old_prompts:
         try: await bot.delete_message(msg.chat.id, pid)
         except: pass
-    total_chars = sum(len(p) for p in parts)
-    caption = T[lang]["pdf_collect"].format(parts=len(parts), chars=total_chars)
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=T[lang]["pdf_done_btn"], callback_data="pdf_create"),
-         InlineKeyboardButton(text=T[lang]["pdf_undo_btn"], callback_data="pdf_undo")]
-    ])
-    prompt = await msg.answer(caption, reply_markup=markup, parse_mode="HTML")
-    await state.update_data(pdf_parts=parts, pdf_msg_ids=msg_ids, pdf_prompt_ids=[prompt.message_id])
+    prompt = await msg.answer(T[lang]["pdf_collect"].format(parts=len(data["pdf_layout"]), chars=data["pdf_chars"]),
+                              reply_markup=kb_pdf(lang), parse_mode="HTML")
+    await update_state_data(state, lambda d: {**d, "pdf_prompt_ids": d.get("pdf_prompt_ids", []) + [prompt.message_id]})
 
 @dp.callback_query(F.data == "pdf_undo")
 async def pdf_undo(cb: CallbackQuery, state: FSMContext):
     lang = await get_lang(state)
-    data = await state.get_data()
-    parts = data.get("pdf_parts", [])
-    msg_ids = data.get("pdf_msg_ids", [])
-    if not parts:
+    removed = []
+    def pop_part(d):
+        # Faqat oxirgi qism bekor qilinadi
+        layout = d.get("pdf_layout", [])
+        removed[:] = layout[-1:]
+        if layout:
+            d["pdf_layout"] = layout[:-1]
+            d["pdf_chars"] = max(0, d.get("pdf_chars", 0) - layout[-1][3])
+            d["pdf_prompt_ids"] = [p for p in d.get("pdf_prompt_ids", []) if p != cb.message.message_id]
+    data = await update_state_data(state, pop_part)
+    if not removed:
         await cb.answer(T[lang]["pdf_empty"])
         return
-    parts.pop()
-    if msg_ids:
-        try: await bot.delete_message(cb.message.chat.id, msg_ids.pop())
-        except: pass
+    part = removed[0][0]
+    await pdfs.drop_parts(cb.from_user.id, [part])
+    try: await bot.delete_message(cb.message.chat.id, part)
+    except: pass
     try: await cb.message.delete()
     except: pass
-    await state.update_data(pdf_parts=parts, pdf_msg_ids=msg_ids, pdf_prompt_ids=[])
     await cb.answer()
-    if parts:
-        total_chars = sum(len(p) for p in parts)
-        caption = T[lang]["pdf_collect"].format(parts=len(parts), chars=total_chars)
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=T[lang]["pdf_done_btn"], callback_data="pdf_create"),
-             InlineKeyboardButton(text=T[lang]["pdf_undo_btn"], callback_data="pdf_undo")]
-        ])
-        p = await cb.message.answer(caption, reply_markup=markup, parse_mode="HTML")
-        await state.update_data(pdf_prompt_ids=[p.message_id])
+    layout = data["pdf_layout"]
+    if layout:
+        p = await cb.message.answer(T[lang]["pdf_collect"].format(parts=len(layout), chars=data["pdf_chars"]),
+                                    reply_markup=kb_pdf(lang), parse_mode="HTML")
+        await update_state_data(state, lambda d: {**d, "pdf_prompt_ids": d.get("pdf_prompt_ids", []) + [p.message_id]})
     else:
         await cb.message.answer(T[lang]["pdf_cleared"])
 
-@dp.callback_query(F.data == "pdf_create")
+@dp.callback_query(F.data == "pdf_create", flags={"heavy": True})
 async def pdf_create(cb: CallbackQuery, state: FSMContext):
     lang = await get_lang(state)
     data = await state.get_data()
-    parts = data.get("pdf_parts", [])
+    layout = data.get("pdf_layout", [])
     prompt_ids = data.get("pdf_prompt_ids", [])
-    if not parts:
+    if not layout:
         await cb.answer(T[lang]["pdf_empty"])
         return
     for pid in prompt_ids:
@@ -658,43 +1056,41 @@ async def pdf_create(cb: CallbackQuery, state: FSMContext):
     try: await cb.message.delete()
     except: pass
     await cb.answer()
-    full_text = "\n".join(parts)
+    parts = [entry[0] for entry in layout]
     wait = await cb.message.answer(T[lang]["pdf_process"])
     try:
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=20)
-        pdf.add_page()
-        pdf.set_margins(20, 20, 20)
-        uni = setup_pdf_font(pdf, 12)
-        if not uni:
-            full_text = unicodedata.normalize("NFKD", full_text).encode("ascii", "ignore").decode("ascii")
-        pdf.set_font_size(20)
-        pdf.set_text_color(30, 30, 30)
-        pdf.cell(0, 12, "Document", ln=True, align="C")
-        pdf.ln(2)
-        pdf.set_draw_color(80, 80, 80)
-        pdf.set_line_width(0.4)
-        pdf.line(20, pdf.get_y(), 190, pdf.get_y())
-        pdf.ln(4)
-        pdf.set_font_size(9)
-        pdf.set_text_color(130, 130, 130)
-        pdf.cell(0, 6, datetime.now().strftime("%d.%m.%Y %H:%M"), ln=True, align="R")
-        pdf.ln(4)
-        pdf.set_font_size(11)
-        pdf.set_text_color(30, 30, 30)
-        for line in full_text.split("\n"):
-            pdf.multi_cell(0, 7, line if line else " ")
-        pdf.set_y(-15)
-        pdf.set_font_size(9)
-        pdf.set_text_color(160, 160, 160)
-        pdf.cell(0, 10, f"Page {pdf.page_no()}", align="C")
-        buf = io.BytesIO()
-        pdf.output(buf)
-        buf.seek(0)
+        doc = await pdfs.finalize(cb.from_user.id, parts, datetime.now().strftime("%d.%m.%Y %H:%M"))
         await wait.delete()
-        await cb.message.answer_document(BufferedInputFile(buf.read(), "document.pdf"), caption=T[lang]["pdf_success"])
-        await state.update_data(pdf_parts=[], pdf_msg_ids=[], pdf_prompt_ids=[])
+        # Hujjatda yaratilgan vaqt bor — har safar yangi baytlar, file_id keshiga yozilmaydi
+        await cb.message.answer_document(BufferedInputFile(doc, "document.pdf"), caption=T[lang]["pdf_success"])
+        # Faqat hujjatga kirgan qismlar olib tashlanadi — shu orada kelganlari qoladi
+        done = set(parts)
+        def take_parts(d):
+            rest = [e for e in d.get("pdf_layout", []) if e[0] not in done]
+            d["pdf_layout"] = rest
+            d["pdf_chars"] = sum(e[3] for e in rest)
+            d["pdf_prompt_ids"] = [p for p in d.get("pdf_prompt_ids", []) if p not in prompt_ids]
+        await update_state_data(state, take_parts)
+        await pdfs.drop_parts(cb.from_user.id, parts)
         await cb.message.answer(T[lang]["pdf_welcome"], reply_markup=kb_back(lang), parse_mode="HTML")
+    except MissingParts as e:
+        # Holat saqlangan, spool fayllari yo'qolgan — yo'qolgan qismlar holatdan olinib, qayta so'raladi
+        log.warning(f"PDF: {e}")
+        try: await wait.delete()
+        except: pass
+        lost = set(e.parts)
+        def drop_lost(d):
+            rest = [entry for entry in d.get("pdf_layout", []) if entry[0] not in lost]
+            d["pdf_layout"] = rest
+            d["pdf_chars"] = sum(entry[3] for entry in rest)
+            d["pdf_prompt_ids"] = [pid for pid in d.get("pdf_prompt_ids", []) if pid not in prompt_ids]
+        data = await update_state_data(state, drop_lost)
+        await cb.message.answer(T[lang]["pdf_missing"].format(n=len(lost)))
+        layout = data["pdf_layout"]
+        if layout:
+            p = await cb.message.answer(T[lang]["pdf_collect"].format(parts=len(layout), chars=data["pdf_chars"]),
+                                        reply_markup=kb_pdf(lang), parse_mode="HTML")
+            await update_state_data(state, lambda d: {**d, "pdf_prompt_ids": d.get("pdf_prompt_ids", []) + [p.message_id]})
     except Exception as e:
         log.error(f"PDF: {e}")
         try: await wait.delete()
@@ -709,31 +1105,173 @@ async def tts_start(msg: Message, state: FSMContext):
     await state.set_state(S.tts)
     await msg.answer(T[lang]["tts_welcome"], reply_markup=kb_back(lang), parse_mode="HTML")
 
-@dp.message(S.tts, F.text)
+@dp.message(S.tts, F.text, flags={"heavy": True})
 async def tts_create(msg: Message, state: FSMContext):
     if not await check_sub(msg, state): return
     if msg.text in ["\U0001f519 Orqaga", "\U0001f519 \u041d\u0430\u0437\u0430\u0434", "\U0001f519 Back"]: return
     lang = await get_lang(state)
+    # Bundan keyin holatga yozilmaydi — chatning keyingi xabarlari sintez tugashini kutmaydi
+    sched.release_chat()
     wait = await msg.answer(T[lang]["tts_process"])
     try:
-        lang_map = {"uz": "tr", "ru": "ru", "en": "en"}
-        def _make():
-            tts = gTTS(text=msg.text, lang=lang_map.get(lang, "en"))
-            b = io.BytesIO()
-            tts.write_to_fp(b)
-            b.seek(0)
-            return b.read()
-        audio = await asyncio.get_running_loop().run_in_executor(None, _make)
+        audio = await tts.synthesize(msg.text, lang)
         await wait.delete()
-        await msg.answer_audio(BufferedInputFile(audio, "voice.mp3"), caption=T[lang]["tts_success"])
+        await file_ids.send(
+            "tts", audio, lambda: BufferedInputFile(audio, "voice.mp3"),
+            lambda media: msg.answer_audio(media, caption=T[lang]["tts_success"])
+        )
     except Exception as e:
         log.error(f"TTS: {e}")
         try: await wait.delete()
         except: pass
         await msg.answer(T[lang]["tts_error"])
 
+# RASMGA MATN
+@dp.message(F.text.in_(["\U0001f5bc Rasmga Matn", "\U0001f5bc \u0422\u0435\u043a\u0441\u0442 \u043d\u0430 \u0424\u043e\u0442\u043e", "\U0001f5bc Image Text"]))
+async def wm_start(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    lang = await get_lang(state)
+    await state.set_state(S.wm_photo)
+    await state.update_data(wm_photo_id=None)
+    await msg.answer(T[lang]["wm_welcome"], reply_markup=kb_back(lang), parse_mode="HTML")
+
+@dp.message(S.wm_photo, F.photo)
+@dp.message(S.wm_text, F.photo)
+async def wm_photo(msg: Message, state: FSMContext):
+    # Faqat identifikatorlar saqlanadi; rasm matn kelganda (keshda bo'lmasa) yuklanadi
+    lang = await get_lang(state)
+    photo = msg.photo[-1]
+    await state.update_data(wm_photo_id=[photo.file_id, photo.file_unique_id])
+    await state.set_state(S.wm_text)
+    await msg.answer(T[lang]["wm_got_photo"], parse_mode="HTML")
+
+@dp.message(S.wm_photo)
+async def wm_wrong(msg: Message, state: FSMContext):
+    lang = await get_lang(state)
+    await msg.answer(T[lang]["wm_only_photo"])
+
+@dp.message(S.wm_text, F.text, flags={"heavy": True})
+async def wm_create(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    if msg.text in BACK_TEXTS: return
+    lang = await get_lang(state)
+    data = await state.get_data()
+    if not data.get("wm_photo_id"):
+        await state.set_state(S.wm_photo)
+        await msg.answer(T[lang]["wm_no_photo"])
+        return
+    file_id, unique_id = data["wm_photo_id"]
+    wait = await msg.answer(T[lang]["wm_process"])
+
+    async def fetch():
+        buf = io.BytesIO()
+        await bot.download(file_id, buf)
+        return buf.getvalue()
+    try:
+        jpeg = await wm.render(unique_id, msg.text[:500], fetch)
+        await wait.delete()
+        await file_ids.send(
+            "wm", jpeg, lambda: BufferedInputFile(jpeg, "image.jpg"),
+            lambda media: msg.answer_photo(media, caption=T[lang]["wm_success"])
+        )
+    except Exception as e:
+        log.error(f"Watermark: {e}")
+        try: await wait.delete()
+        except: pass
+        await msg.answer(T[lang]["wm_error"])
+
 # EXCEL
 @dp.message(F.text.in_(["\U0001f4ca Excel"]))
+async def excel_start(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    lang = await get_lang(state)
+    await state.set_state(S.excel)
+    await msg.answer(T[lang]["excel_welcome"], reply_markup=kb_back(lang), parse_mode="HTML")
+
+async def excel_send(msg, lang, make):
+    # Jadval pulda diskka oqim bilan yoziladi va fayldan yuboriladi, keyin o'chiriladi
+    wait = await msg.answer(T[lang]["excel_process"])
+    path = None
+    try:
+        path, fmt, rows, cols = await make()
+        await wait.delete()
+        caption = T[lang]["excel_success"] if fmt == "xlsx" else T[lang]["excel_csv"]
+        await msg.answer_document(FSInputFile(path, filename=f"table.{fmt}"), caption=f"{caption}\n{rows} \u00d7 {cols}")
+    except TooLarge:
+        try: await wait.delete()
+        except: pass
+        await msg.answer(T[lang]["excel_big"].format(mb=EXCEL_MAX_BYTES // (1024 * 1024)))
+    except Exception as e:
+        log.error(f"Excel: {e}")
+        try: await wait.delete()
+        except: pass
+        await msg.answer(T[lang]["excel_error"])
+    finally:
+        if path:
+            excel.remove(path)
+
+@dp.message(S.excel, F.text, flags={"heavy": True})
+async def excel_create(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    if msg.text in BACK_TEXTS: return
+    lang = await get_lang(state)
+    await excel_send(msg, lang, lambda: excel.from_text(msg.from_user.id, msg.text))
+
+@dp.message(S.excel, F.document, flags={"heavy": True})
+async def excel_file(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    lang = await get_lang(state)
+    doc = msg.document
+    if doc.file_size and doc.file_size > EXCEL_MAX_BYTES:
+        await msg.answer(T[lang]["excel_big"].format(mb=EXCEL_MAX_BYTES // (1024 * 1024)))
+        return
+    await excel_send(msg, lang, lambda: excel.from_stream(msg.from_user.id, tg_file_stream(doc.file_id)))
+
+# OB-HAVO
+@dp.message(F.text.in_(["\U0001f324 Ob-havo", "\U0001f324 \u041f\u043e\u0433\u043e\u0434\u0430", "\U0001f324 Weather"]))
+async def weather_start(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    lang = await get_lang(state)
+    await state.set_state(S.weather)
+    await msg.answer(T[lang]["weather_welcome"], reply_markup=kb_weather(lang), parse_mode="HTML")
+
+async def weather_send(msg, lang, lookup):
+    # lookup() -> ma'lumot (dict) yoki None (shahar topilmadi)
+    wait = await msg.answer(T[lang]["weather_loading"])
+    try:
+        d = await lookup()
+        if d is None:
+            text = T[lang]["weather_error"]
+        else:
+            text = T[lang]["weather_fmt"].format(**dict(d, name=html.escape(d["name"]), desc=html.escape(d["desc"])))
+    except WeatherError as e:
+        log.error(f"Weather: {e}")
+        text = T[lang]["weather_api_err"]
+    try: await wait.delete()
+    except: pass
+    await msg.answer(text, parse_mode="HTML")
+
+@dp.message(S.weather, F.location)
+async def weather_location(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    lang = await get_lang(state)
+    loc = msg.location
+    await weather_send(msg, lang, lambda: weather.by_location(loc.latitude, loc.longitude, lang))
+
+@dp.message(S.weather, F.text)
+async def weather_city(msg: Message, state: FSMContext):
+    if not await check_sub(msg, state): return
+    if msg.text in BACK_TEXTS: return
+    lang = await get_lang(state)
+
+    async def lookup():
+        found = await weather.by_city(msg.text[:100], lang)
+        if found is None:
+            return None
+        name, d = found
+        return dict(d, name=name)
+    await weather_send(msg, lang, lookup)
+
 # ─── INLINE MODE ─────────────────────────────────────────────────────────────
 @dp.inline_query()
 async def inline_handler(query: InlineQuery):
@@ -747,11 +1285,15 @@ async def inline_handler(query: InlineQuery):
         )
         return
 
-    # Groq dan javob olish
+    # Groq dan javob olish (debounce + kesh; eski so'rov yangisi kelganda bekor qilinadi)
     try:
-        reply = await ai_text_req([{"role": "user", "content": text}], "uz")
+        reply = await inline_ai.answer(query.from_user.id, text)
+        if reply is None:
+            return
         if not reply:
             reply = "Xatolik yuz berdi. Qayta urinib ko'ring."
+    except Overloaded:
+        reply = T["uz"]["ai_busy"]
     except Exception as e:
         log.error(f"Inline AI error: {e}")
         reply = "Xatolik yuz berdi."
@@ -776,9 +1318,61 @@ async def inline_handler(query: InlineQuery):
         is_personal=True
     )
 
+warm_task = None
+
+async def warm_up():
+    # Og'ir kutubxonalar (qrcode, fpdf, PIL, gTTS) birinchi foydalanishda yuklanadi; bu yerda esa
+    # bot yangilanishlarni qabul qila boshlagach fonda, bittadan — jonli so'rovlarga xalaqit bermasdan
+    await asyncio.sleep(WARMUP_DELAY)
+    t = time.perf_counter()
+    for name, engine in (("qr", qr_engine), ("pdf", pdfs), ("tts", tts), ("wm", wm), ("weather", weather)):
+        try:
+            await engine.warm()
+        except Exception as e:
+            log.warning(f"Warm-up {name}: {e}")
+    log.info(f"Warm-up done in {time.perf_counter() - t:.2f}s")
+
+async def on_startup():
+    global warm_task
+    users.open(json_path=DB_FILE)
+    file_ids.open()
+    storage.open()
+    broadcaster.open()
+    await users.start()
+    await storage.start()
+    await broadcaster.start()
+    await http_pool.open_sessions()
+    if WARMUP_DELAY >= 0:
+        warm_task = asyncio.create_task(warm_up())
+
+async def on_shutdown():
+    # Boshlangan handlerlar tugashini kutib, keyin resurslarni yopamiz
+    if warm_task:
+        warm_task.cancel()
+    await inflight.drain()
+    await broadcaster.close()
+    await http_pool.close_sessions()
+    await users.close()
+    memory.close()
+    await storage.shutdown()
+    file_ids.close()
+    # Pullar to'liq to'xtatiladi (jarayon pullari chiqishda xato bermasligi uchun)
+    await asyncio.gather(qr_engine.close(), tts.close(), pdfs.close(), wm.close(), excel.close())
+
+def run_worker(port):
+    # Webhook worker jarayoni (spawn): front unga foydalanuvchi bo'yicha yangilanish uzatadi
+    asyncio.run(webhook.serve_worker(dp, bot, inflight, "127.0.0.1", port, on_startup, on_shutdown))
+
 async def main():
     log.info("Bot ishga tushdi!")
-    await dp.start_polling(bot, drop_pending_updates=True)
+    if webhook.BOT_MODE == "webhook":
+        await webhook.run(dp, bot, inflight, on_startup, on_shutdown, run_worker)
+        return
+    # Polling (lokal): webhook o'rnatilgan bo'lsa o'chiriladi, kutayotgan yangilanishlar saqlanadi
+    await bot.delete_webhook(drop_pending_updates=False)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
 if __name__ == "__main__":
     asyncio.run(main())
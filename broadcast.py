@@ -0,0 +1,321 @@
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError
+
+from upstream_limits import Limiter, BACKGROUND
+
+log = logging.getLogger(__name__)
+
+BROADCAST_DB          = os.environ.get("BROADCAST_DB", "broadcasts.sqlite3")
+BROADCAST_RPS         = float(os.environ.get("BROADCAST_RPS", "25"))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_PAGE        = int(os.environ.get("BROADCAST_PAGE", "1000"))
+BROADCAST_RETRIES     = int(os.environ.get("BROADCAST_RETRIES", "5"))
+BROADCAST_CHECKPOINT  = float(os.environ.get("BROADCAST_CHECKPOINT_SEC", "2"))
+BROADCAST_REPORT      = float(os.environ.get("BROADCAST_REPORT_SEC", "5"))
+BROADCAST_LEASE       = float(os.environ.get("BROADCAST_LEASE_SEC", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_chat INTEGER NOT NULL,
+    from_chat  INTEGER,
+    message_id INTEGER,
+    text       TEXT,
+    status     TEXT NOT NULL,
+    cursor     INTEGER NOT NULL DEFAULT 0,
+    sent       INTEGER NOT NULL DEFAULT 0,
+    failed     INTEGER NOT NULL DEFAULT 0,
+    blocked    INTEGER NOT NULL DEFAULT 0,
+    retried    INTEGER NOT NULL DEFAULT 0,
+    report_msg INTEGER,
+    created    INTEGER NOT NULL,
+    finished   INTEGER,
+    owner      TEXT,
+    heartbeat  INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+COLUMNS = ("id", "admin_chat", "from_chat", "message_id", "text", "status", "cursor",
+           "sent", "failed", "blocked", "retried", "report_msg", "created", "finished")
+
+# Yetib bormaydigan chat — foydalanuvchi nofaol deb belgilanadi
+GONE = ("chat not found", "user is deactivated", "bot was blocked", "peer_id_invalid")
+
+
+class Job:
+    __slots__ = COLUMNS + ("total", "started", "samples", "stop")
+
+    def __init__(self, row):
+        for k, v in zip(COLUMNS, row):
+            setattr(self, k, v)
+        self.total = 0
+        self.started = time.monotonic()
+        self.samples = deque(maxlen=12)     # (vaqt, yuborilgan) — jonli tezlik uchun
+        self.stop = False
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.blocked
+
+    def rate(self):
+        if len(self.samples) < 2:
+            return 0.0
+        (t0, n0), (t1, n1) = self.samples[0], self.samples[-1]
+        return (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+
+    def progress(self):
+        rate = self.rate()
+        left = max(0, self.total - self.done)
+        return {"id": self.id, "status": self.status, "sent": self.sent, "failed": self.failed,
+                "blocked": self.blocked, "retried": self.retried, "done": self.done, "total": self.total,
+                "rate": round(rate, 1), "eta": round(left / rate) if rate else None,
+                "elapsed": round(time.monotonic() - self.started)}
+
+
+# Admin tarqatmasi: qabul qiluvchilar bazadan sahifalab o'qiladi, global token bucket
+# (RetryAfter da hammasi to'xtaydi) va cheklangan parallellik bilan yuboriladi.
+# Progress (uid bo'yicha kursor) muntazam saqlanadi — jarayon yiqilsa shu joydan davom etadi.
+# Kafolat "kamida bir marta": qayta tiklashda oxirgi parallel oyna qayta yuborilishi mumkin.
+class Broadcaster:
+    def __init__(self, bot, users, path=BROADCAST_DB, rps=BROADCAST_RPS, concurrency=BROADCAST_CONCURRENCY,
+                 report=None):
+        self.bot = bot
+        self.users = users
+        self.path = path
+        self.concurrency = concurrency
+        self.report = report                # async (job, final) — admin xabarini yangilash
+        self.limiter = Limiter("broadcast", concurrency, rps, max(1, int(rps)), max_queue=10 ** 9)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._db = None
+        self._lock = threading.Lock()
+        self._jobs = {}                     # id -> (Job, Task)
+        self._watcher = None
+
+    # ─── lifecycle ───────────────────────────────────────────────────────────
+    def open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    async def start(self):
+        # Egasiz (yiqilgan jarayondan qolgan) ishlarni vaqti-vaqti bilan tekshiradi
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def close(self):
+        if self._watcher:
+            self._watcher.cancel()
+            try: await self._watcher
+            except asyncio.CancelledError: pass
+            self._watcher = None
+        for job, task in list(self._jobs.values()):
+            task.cancel()
+            try: await task
+            except asyncio.CancelledError: pass
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def _exec(self, sql, args=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, args)
+
+    # ─── boshqaruv ───────────────────────────────────────────────────────────
+    async def create(self, admin_chat, from_chat=None, message_id=None, text=None, report_msg=None):
+        # Bir vaqtda bitta tarqatma; band bo'lsa None
+        def insert():
+            with self._lock, self._db:
+                if self._db.execute("SELECT 1 FROM broadcasts WHERE status='running'").fetchone():
+                    return None
+                cur = self._db.execute(
+                    "INSERT INTO broadcasts (admin_chat, from_chat, message_id, text, status, report_msg, created, owner, heartbeat) "
+                    "VALUES (?, ?, ?, ?, 'running', ?, ?, ?, ?)",
+                    (admin_chat, from_chat, message_id, text, report_msg, int(time.time()), self.owner, int(time.time())))
+                return cur.lastrowid
+        job_id = await asyncio.to_thread(insert)
+        if job_id is None:
+            return None
+        return await self._launch(job_id)
+
+    async def cancel(self):
+        # Boshqa jarayondagi egasi keyingi checkpointda to'xtaydi
+        cur = await asyncio.to_thread(self._exec, "UPDATE broadcasts SET status='cancelled' WHERE status='running'")
+        for job, _ in self._jobs.values():
+            job.stop = True
+        return cur.rowcount > 0
+
+    async def current(self):
+        for job, _ in self._jobs.values():
+            return job
+        row = await asyncio.to_thread(lambda: self._exec(
+            f"SELECT {', '.join(COLUMNS)} FROM broadcasts ORDER BY id DESC LIMIT 1").fetchone())
+        return Job(row) if row else None
+
+    async def _launch(self, job_id):
+        row = await asyncio.to_thread(lambda: self._exec(
+            f"SELECT {', '.join(COLUMNS)} FROM broadcasts WHERE id=?", (job_id,)).fetchone())
+        job = Job(row)
+        # Yangi/qayta faollashgan, hali write-behind yozmagan foydalanuvchilar ham ro'yxatga tushsin
+        await self.users.flush()
+        job.total = job.done + await asyncio.to_thread(self.users.recipient_count, job.cursor)
+        task = asyncio.create_task(self._run(job))
+        self._jobs[job.id] = (job, task)
+        task.add_done_callback(lambda _: self._jobs.pop(job.id, None))
+        log.info(f"Broadcast #{job.id}: {'resumed at uid ' + str(job.cursor) if job.cursor else 'started'}, {job.total} recipients")
+        return job
+
+    def _claim(self, job_id):
+        now = int(time.time())
+        cur = self._exec(
+            "UPDATE broadcasts SET owner=?, heartbeat=? WHERE id=? AND status='running' "
+            "AND (owner IS NULL OR owner=? OR heartbeat<?)",
+            (self.owner, now, job_id, self.owner, now - BROADCAST_LEASE))
+        return cur.rowcount == 1
+
+    async def _watch(self):
+        while True:
+            try:
+                rows = await asyncio.to_thread(lambda: self._exec(
+                    "SELECT id FROM broadcasts WHERE status='running'").fetchall())
+                for (job_id,) in rows:
+                    if job_id not in self._jobs and await asyncio.to_thread(self._claim, job_id):
+                        await self._launch(job_id)
+            except Exception as e:
+                log.error(f"Broadcast watch: {e}")
+            await asyncio.sleep(BROADCAST_LEASE / 2)
+
+    # ─── yuborish ────────────────────────────────────────────────────────────
+    async def _run(self, job):
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        order = deque()                     # yuborish tartibi: [uid, tugadimi]
+
+        async def produce():
+            after = job.cursor
+            while not job.stop:
+                page = await asyncio.to_thread(self.users.recipients, after, BROADCAST_PAGE)
+                if not page:
+                    break
+                for uid in page:
+                    if job.stop:
+                        break
+                    entry = [uid, False]
+                    order.append(entry)
+                    await queue.put(entry)
+                after = page[-1]
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while (entry := await queue.get()) is not None:
+                if not job.stop:
+                    await self._deliver(job, entry[0])
+                entry[1] = True
+                # Kursor faqat oldidagilarning hammasi tugaganda siljiydi
+                while order and order[0][1] and not job.stop:
+                    job.cursor = order.popleft()[0]
+
+        async def checkpoint():
+            while True:
+                await asyncio.sleep(BROADCAST_CHECKPOINT)
+                job.samples.append((time.monotonic(), job.done))
+                status = await asyncio.to_thread(self._save, job)
+                if status != "running":
+                    job.stop = True
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(BROADCAST_REPORT)
+                await self._report(job, False)
+
+        job.samples.append((time.monotonic(), job.done))
+        side = [asyncio.create_task(checkpoint()), asyncio.create_task(reporter())]
+        finished = False
+        try:
+            await asyncio.gather(produce(), *(work() for _ in range(self.concurrency)))
+            finished = not job.stop
+        finally:
+            for t in side:
+                t.cancel()
+            if finished:
+                job.status = "done"
+            elif job.stop:
+                job.status = "cancelled"
+            # Yiqilish/to'xtatishda egalik bo'shatiladi — keyingi jarayon darhol davom ettiradi
+            await asyncio.to_thread(self._save, job, True)
+            if job.status != "running":
+                log.info(f"Broadcast #{job.id} {job.status}: {job.progress()}")
+                await self._report(job, True)
+
+    async def _deliver(self, job, uid):
+        for _ in range(BROADCAST_RETRIES):
+            async with self.limiter.slot(BACKGROUND):
+                try:
+                    if job.message_id:
+                        await self.bot.copy_message(uid, job.from_chat, job.message_id)
+                    else:
+                        await self.bot.send_message(uid, job.text)
+                    job.sent += 1
+                    return
+                except TelegramRetryAfter as e:
+                    # Global flood limit — butun tarqatma to'xtaydi, shu foydalanuvchi qayta
+                    self.limiter.backoff(e.retry_after)
+                    job.retried += 1
+                    continue
+                except TelegramForbiddenError:
+                    await self._gone(job, uid)
+                    return
+                except TelegramBadRequest as e:
+                    if any(s in str(e).lower() for s in GONE):
+                        await self._gone(job, uid)
+                    else:
+                        job.failed += 1
+                        log.warning(f"Broadcast to {uid}: {e}")
+                    return
+                except (TelegramNetworkError, asyncio.TimeoutError):
+                    job.retried += 1
+                except Exception as e:
+                    job.failed += 1
+                    log.warning(f"Broadcast to {uid}: {e}")
+                    return
+            await asyncio.sleep(1)
+        job.failed += 1
+
+    async def _gone(self, job, uid):
+        job.blocked += 1
+        await self.users.deactivate(uid)
+
+    def _save(self, job, release=False):
+        with self._lock, self._db:
+            status = self._db.execute("SELECT status FROM broadcasts WHERE id=?", (job.id,)).fetchone()[0]
+            if status == "cancelled":
+                job.status = status
+            self._db.execute(
+                "UPDATE broadcasts SET status=?, cursor=?, sent=?, failed=?, blocked=?, retried=?, "
+                "finished=?, owner=?, heartbeat=? WHERE id=?",
+                (job.status, job.cursor, job.sent, job.failed, job.blocked, job.retried,
+                 int(time.time()) if job.status != "running" else None,
+                 None if release else self.owner, int(time.time()), job.id))
+        return job.status
+
+    async def _report(self, job, final):
+        if self.report is None:
+            return
+        try:
+            await self.report(job, final)
+        except Exception as e:
+            log.warning(f"Broadcast report: {e}")
+
+    def stats(self):
+        out = {"limiter": self.limiter.stats()}
+        for job, _ in self._jobs.values():
+            out["job"] = job.progress()
+        return out
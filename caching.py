@@ -0,0 +1,141 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+# LRU + TTL kesh; hit/miss hisoblagichlari bilan
+class TTLCache:
+    def __init__(self, maxsize=10000, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is not _MISSING:
+            expires, value = item
+            if expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        item = self._data.get(key, _MISSING)
+        return item is not _MISSING and item[0] > time.monotonic()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+# Bir xil kalit bo'yicha parallel chaqiruvlarni bitta so'rovga birlashtiradi.
+# cancel_orphans=True bo'lsa, barcha kutuvchilar bekor qilinganda so'rov ham to'xtatiladi.
+class SingleFlight:
+    def __init__(self, cancel_orphans=False):
+        self.cancel_orphans = cancel_orphans
+        self._inflight = {}
+        self.calls = 0
+        self.joined = 0
+        self.orphaned = 0
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key, fn):
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.joined += 1
+        task = entry[0]
+        entry[1] += 1
+        orphaned = False
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            orphaned = not task.done()
+            raise
+        finally:
+            entry[1] -= 1
+            if orphaned and self.cancel_orphans and entry[1] <= 0:
+                self.orphaned += 1
+                task.cancel()
+
+    def _done(self, key, task):
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._inflight[key]
+
+
+# Baytlar byudjeti bilan LRU (PNG/MP3 kabi tayyor natijalar uchun)
+class BytesLRU:
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._data[key] = value
+        self.bytes += len(value)
+        while self.bytes > self.max_bytes:
+            _, v = self._data.popitem(last=False)
+            self.bytes -= len(v)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self._data), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(self.hits / total, 3) if total else 0.0}
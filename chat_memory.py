@@ -0,0 +1,158 @@
+import os
+import re
+import math
+import asyncio
+import logging
+from collections import deque
+
+from fsm_store import update_state_data
+
+log = logging.getLogger(__name__)
+
+HISTORY_TOKENS    = int(os.environ.get("HISTORY_TOKENS", "3000"))
+HISTORY_KEEP      = float(os.environ.get("HISTORY_KEEP", "0.6"))
+SUMMARY_TOKENS    = int(os.environ.get("SUMMARY_TOKENS", "300"))
+HISTORY_MAX_TURNS = int(os.environ.get("HISTORY_MAX_TURNS", "60"))
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+TURN_OVERHEAD = 4       # rol va ajratuvchi tokenlar
+
+
+def estimate_tokens(text):
+    # BPE tokenizatorining taxminiy bahosi: lotin so'zida ~4 belgi, kirill va boshqalarda ~2.5 belgi bitta token
+    n = 0
+    for piece in _PIECE.findall(text):
+        n += max(1, math.ceil(len(piece) / (4 if piece.isascii() else 2.5)))
+    return n
+
+
+def turn_tokens(turn):
+    return estimate_tokens(turn["content"]) + TURN_OVERHEAD
+
+
+def split_window(history, budget):
+    # Eng yangi navbatlardan byudjetga sig'adiganlari — oyna; undan eskisi — qoldiq.
+    # Oyna doim foydalanuvchi xabari bilan boshlanadi.
+    total, i = 0, len(history)
+    while i > 0:
+        t = turn_tokens(history[i - 1])
+        if total + t > budget:
+            break
+        total += t
+        i -= 1
+    while i < len(history) and history[i]["role"] != "user":
+        i += 1
+    return history[:i], history[i:]
+
+
+def summary_message(summary):
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+
+def summarize_prompt(summary, turns, limit=SUMMARY_TOKENS):
+    lines = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    return (
+        "Update the running summary of this chat with the new messages below. Keep names, facts, "
+        "user preferences, decisions and open questions; drop greetings and filler. "
+        f"Write in the conversation's language, at most {limit} tokens. Reply with the summary only.\n\n"
+        f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{lines}"
+    )
+
+
+# Suhbat xotirasi: token byudjetidagi oyna + eski navbatlar yig'iladigan qisqa xulosa.
+# Xulosa har navbatda qayta yozilmaydi — faqat oynadan chiqqan navbatlar fonda qo'shiladi.
+class ChatMemory:
+    def __init__(self, summarize, budget=HISTORY_TOKENS, keep=HISTORY_KEEP, max_turns=HISTORY_MAX_TURNS):
+        self.summarize = summarize      # async (prompt, lang) -> str | None
+        self.budget = budget
+        self.keep = keep
+        self.max_turns = max_turns
+        self._tasks = {}                # storage key -> fon vazifa
+        self._sizes = deque(maxlen=500)
+        self.requests = 0
+        self.tokens_total = 0
+        self.tokens_max = 0
+        self.folded = 0
+        self.summaries = 0
+        self.summary_errors = 0
+        self.dropped = 0
+
+    def build(self, data, question, system=""):
+        # So'rov uchun xabarlar: [xulosa] + oyna + yangi savol
+        summary = data.get("chat_summary", "")
+        _, window = split_window(data.get("chat_history", []), self.budget)
+        messages = ([summary_message(summary)] if summary else []) + window + [{"role": "user", "content": question}]
+        size = estimate_tokens(system) + sum(turn_tokens(m) for m in messages)
+        self.requests += 1
+        self.tokens_total += size
+        self.tokens_max = max(self.tokens_max, size)
+        self._sizes.append(size)
+        log.info(f"Prompt: ~{size} tokens (window {len(window)} turns, summary {estimate_tokens(summary)} tokens)")
+        return messages
+
+    async def push(self, state, question, reply, lang):
+        turns = [{"role": "user", "content": question}, {"role": "assistant", "content": reply}]
+
+        def append(d):
+            history = d.get("chat_history", []) + turns
+            if len(history) > self.max_turns:
+                # Xulosa ortda qolgan bo'lsa ham holat cheksiz o'smaydi
+                self.dropped += len(history) - self.max_turns
+                history = history[-self.max_turns:]
+            d["chat_history"] = history
+        data = await update_state_data(state, append)
+        self._schedule(state, data, lang)
+
+    def _schedule(self, state, data, lang):
+        history = data.get("chat_history", [])
+        if sum(turn_tokens(t) for t in history) <= self.budget:
+            return
+        k = state.key
+        if k in self._tasks:
+            return
+        # Gisterezis: oyna byudjetning `keep` qismigacha qisqaradi, shunda xulosa har navbatda emas
+        old, _ = split_window(history, int(self.budget * self.keep))
+        if not old:
+            return
+        task = asyncio.create_task(self._fold(state, data.get("chat_summary", ""), old, lang))
+        self._tasks[k] = task
+        task.add_done_callback(lambda _: self._tasks.pop(k, None))
+
+    async def _fold(self, state, summary, old, lang):
+        try:
+            new = await self.summarize(summarize_prompt(summary, old), lang)
+        except Exception as e:
+            new = None
+            log.warning(f"Summary failed: {e}")
+        if not new:
+            # Keyingi navbatda qayta uriniladi; oyna baribir byudjetda qoladi
+            self.summary_errors += 1
+            return
+        applied = []
+
+        def fold(d):
+            history = d.get("chat_history", [])
+            applied[:] = []
+            # Shu orada tarix tozalangan yoki o'zgargan bo'lsa xulosa tashlanadi
+            if history[:len(old)] != old or d.get("chat_summary", "") != summary:
+                return
+            d["chat_history"] = history[len(old):]
+            d["chat_summary"] = new.strip()
+            applied.append(True)
+        await update_state_data(state, fold)
+        if applied:
+            self.summaries += 1
+            self.folded += len(old)
+
+    def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    def stats(self):
+        sizes = sorted(self._sizes)
+        return {"requests": self.requests,
+                "avg": round(self.tokens_total / self.requests) if self.requests else 0,
+                "p95": sizes[min(len(sizes) - 1, int(0.95 * len(sizes)))] if sizes else 0,
+                "max": self.tokens_max, "budget": self.budget, "summaries": self.summaries,
+                "folded": self.folded, "summary_errors": self.summary_errors,
+                "pending": len(self._tasks), "dropped": self.dropped}
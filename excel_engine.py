@@ -0,0 +1,414 @@
+import io
+import os
+import re
+import csv
+import time
+import codecs
+import asyncio
+import logging
+import zipfile
+import tempfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+from workers import make_executor, run_in, shutdown
+
+log = logging.getLogger(__name__)
+
+EXCEL_WORKERS   = int(os.environ.get("EXCEL_WORKERS", "2"))
+EXCEL_SPOOL     = os.environ.get("EXCEL_SPOOL", os.path.join(tempfile.gettempdir(), "javobchi_excel"))
+EXCEL_MAX_BYTES = int(os.environ.get("EXCEL_MAX_BYTES", str(20 * 1024 * 1024)))
+EXCEL_SAMPLE    = int(os.environ.get("EXCEL_SAMPLE", "200"))
+EXCEL_FORMAT    = os.environ.get("EXCEL_FORMAT", "xlsx")     # xlsx | csv
+
+XLSX_MAX_ROWS = 1048576
+XLSX_MAX_COLS = 16384
+CELL_MAX      = 32767
+FLUSH_ROWS    = 256         # varaq XML i shuncha qatordan keyin zip ga yoziladi
+DELIMITERS    = ",;\t|"
+
+# Uslublar (styles.xml dagi cellXfs tartibi)
+ST_HEADER, ST_DATE, ST_PERCENT = 1, 2, 3
+
+_NUM  = re.compile(r"([+-]?)(\d{1,3}(?:[ \u00a0\u202f]\d{3})+|\d+)(?:[.,](\d+))?(%?)")
+_ISO  = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+_DMY  = re.compile(r"(\d{1,2})[./](\d{1,2})[./](\d{4})")
+_CTRL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EPOCH = date(1899, 12, 30)
+
+
+def parse_cell(s):
+    # (tur, qiymat, uslub): "n" — son, "d" — sana (Excel seriya raqami), "s" — matn
+    m = _NUM.fullmatch(s)
+    if m:
+        sign, whole, frac, pct = m.groups()
+        whole = re.sub(r"\D", "", whole)
+        # Boshidagi nol (telefon, kod) va 15 raqamdan uzun qiymatlar matn bo'lib qoladi
+        if (len(whole) > 1 and whole[0] == "0") or len(whole) + len(frac or "") > 15:
+            return "s", s, 0
+        value = float(f"{sign}{whole}.{frac}") if frac else int(sign + whole)
+        if pct:
+            return "n", value / 100, ST_PERCENT
+        return "n", value, 0
+    m = _ISO.fullmatch(s)
+    if m:
+        y, mo, d = m.groups()
+    else:
+        m = _DMY.fullmatch(s)
+        if m:
+            d, mo, y = m.groups()
+    if m:
+        try:
+            return "d", (date(int(y), int(mo), int(d)) - _EPOCH).days, ST_DATE
+        except ValueError:
+            pass
+    return "s", s, 0
+
+
+def sniff_delimiter(lines):
+    # Har satrda bir xil (nolmas) marta uchraydigan ajratuvchi
+    best, score = ",", 0
+    for d in DELIMITERS:
+        counts = [l.count(d) for l in lines if l.strip()]
+        if counts and min(counts) > 0:
+            s = min(counts) + (1 if len(set(counts)) == 1 else 0)
+            if s > score:
+                best, score = d, s
+    return best
+
+
+def detect_encoding(head):
+    # UTF-8 (BOM bilan/siz), aks holda Excel/Windows eksportlari uchun cp1251
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def col_name(i):
+    name = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        name = chr(65 + r) + name
+    return name
+
+
+def read_rows(lines):
+    # Satrlar oqimidan bo'sh bo'lmagan qatorlar (kataklar tozalangan)
+    lines = iter(lines)
+    head = []
+    for line in lines:
+        head.append(line)
+        if len(head) >= 20:
+            break
+    delimiter = sniff_delimiter(head)
+
+    def chain():
+        yield from head
+        yield from lines
+    for row in csv.reader(chain(), delimiter=delimiter, skipinitialspace=True):
+        row = [c.strip() for c in row]
+        if any(row):
+            yield row
+
+
+class TooLarge(Exception):
+    pass
+
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>{names}
+</workbook>"""
+
+WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="10" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+
+# Oqimli XLSX: varaq XML i to'g'ridan-to'g'ri zip yozuviga yoziladi, matnlar inline
+# (sharedStrings jadvali yo'q) — xotira qatorlar soniga bog'liq emas
+class XlsxWriter:
+    def __init__(self, path, widths, header):
+        self.cols = [col_name(i) for i in range(len(widths))]
+        self.rows = 0
+        self._buf = []
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=5)
+        for name, body in (("[Content_Types].xml", CONTENT_TYPES), ("_rels/.rels", ROOT_RELS),
+                           ("xl/_rels/workbook.xml.rels", WORKBOOK_RELS),
+                           ("xl/styles.xml", STYLES)):
+            self._zip.writestr(name, body)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        head = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">']
+        if header:
+            head.append('<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" '
+                        'activePane="bottomLeft" state="frozen"/></sheetView></sheetViews>')
+        head.append("<cols>" + "".join(f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>'
+                                       for i, w in enumerate(widths, 1)) + "</cols><sheetData>")
+        self._sheet.write("".join(head).encode())
+        self.header = header
+
+    def row(self, cells):
+        self.rows += 1
+        r = self.rows
+        out = [f'<row r="{r}">']
+        for col, (kind, value, style) in zip(self.cols, cells):
+            s = f' s="{style}"' if style else ""
+            if kind == "s":
+                if value:
+                    value = escape(_CTRL.sub("", value[:CELL_MAX]))
+                    out.append(f'<c r="{col}{r}" t="inlineStr"{s}><is><t xml:space="preserve">{value}</t></is></c>')
+            else:
+                out.append(f'<c r="{col}{r}"{s}><v>{value}</v></c>')
+        out.append("</row>")
+        self._buf.append("".join(out))
+        if len(self._buf) >= FLUSH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        self._sheet.write("".join(self._buf).encode())
+        self._buf.clear()
+
+    def close(self):
+        self._flush()
+        tail, names = "</sheetData>", ""
+        if self.header and self.rows > 1:
+            tail += f'<autoFilter ref="A1:{self.cols[-1]}{self.rows}"/>'
+            names = ('<definedNames><definedName name="_xlnm._FilterDatabase" localSheetId="0" hidden="1">'
+                     f"Sheet1!$A$1:${self.cols[-1]}${self.rows}</definedName></definedNames>")
+        self._sheet.write((tail + "</worksheet>").encode())
+        self._sheet.close()
+        # Ishchi kitob oxirida — filtr oralig'i endi ma'lum
+        self._zip.writestr("xl/workbook.xml", WORKBOOK.format(names=names))
+        self._zip.close()
+
+    def abort(self):
+        self._sheet.close()
+        self._zip.close()
+
+
+def column_types(sample):
+    # Namunadagi bo'sh bo'lmagan kataklarning hammasi bir turda bo'lsa ustun shu turda, aks holda matn
+    ncols = max(len(r) for r in sample)
+    kinds = [set() for _ in range(ncols)]
+    for row in sample:
+        for i, c in enumerate(row):
+            if c:
+                kinds[i].add(parse_cell(c)[0])
+    return [k.pop() if len(k) == 1 else "s" for k in kinds]
+
+
+def to_xlsx(rows, path, sample_size=EXCEL_SAMPLE):
+    # Bir o'tish: boshidagi namuna (cheklangan) bo'yicha ustun turlari va kengliklari, qolgani oqim bilan
+    rows = iter(rows)
+    sample = []
+    for row in rows:
+        sample.append(row)
+        if len(sample) > sample_size:
+            break
+    if not sample:
+        raise ValueError("empty table")
+    first, body = sample[0], sample[1:]
+    # Birinchi qator to'liq matndan iborat bo'lsa — sarlavha (qalin, qotirilgan, filtr)
+    header = bool(body) and all(c and parse_cell(c)[0] == "s" for c in first)
+    types = column_types(body or sample)
+    ncols = max(len(first), len(types))
+    if ncols > XLSX_MAX_COLS:
+        raise TooLarge(f"{ncols} columns")
+    types += ["s"] * (ncols - len(types))
+    widths = [6] * ncols
+    for row in sample:
+        for i, c in enumerate(row):
+            widths[i] = max(widths[i], min(60, len(c) + 2))
+    w = XlsxWriter(path, widths, header)
+    try:
+        stats = {"cells": 0}
+
+        def cells(row):
+            out = []
+            for t, c in zip(types, row):
+                if not c:
+                    out.append(("s", "", 0))
+                    continue
+                parsed = parse_cell(c) if t != "s" else ("s", c, 0)
+                # Ustun turiga mos kelmagan katak matn sifatida yoziladi
+                out.append(parsed if parsed[0] == t else ("s", c, 0))
+            stats["cells"] += len(row)
+            return out
+
+        if header:
+            w.row([("s", c, ST_HEADER) for c in first] + [("s", "", 0)] * (ncols - len(first)))
+            stats["cells"] += len(first)
+            body_rows = body
+        else:
+            body_rows = sample
+        for row in body_rows:
+            w.row(cells(row))
+        for row in rows:
+            if w.rows >= XLSX_MAX_ROWS:
+                raise TooLarge(f"more than {XLSX_MAX_ROWS} rows")
+            if len(row) > ncols:
+                # Namunadan keyin kengroq qator — ortiqcha ustunlar matn
+                types += ["s"] * (len(row) - ncols)
+                w.cols += [col_name(i) for i in range(ncols, len(row))]
+                ncols = len(row)
+                if ncols > XLSX_MAX_COLS:
+                    raise TooLarge(f"{ncols} columns")
+            w.row(cells(row))
+        w.close()
+    except BaseException:
+        w.abort()
+        raise
+    return w.rows, ncols, stats["cells"]
+
+
+def to_csv(rows, path):
+    # Zaxira: Excel to'g'ri ochishi uchun UTF-8 BOM va vergul ajratuvchi
+    n = cols = cells = 0
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        for row in rows:
+            writer.writerow(row)
+            n += 1
+            cols = max(cols, len(row))
+            cells += len(row)
+    if not n:
+        raise ValueError("empty table")
+    return n, cols, cells
+
+
+def open_lines(src, is_file):
+    # src — foydalanuvchi matni yoki spool fayl yo'li
+    if not is_file:
+        return io.StringIO(src)
+    with open(src, "rb") as f:
+        enc = detect_encoding(f.read(64 * 1024))
+    return open(src, encoding=enc, errors="replace", newline="")
+
+
+def convert(src, is_file, out_base, fmt=EXCEL_FORMAT):
+    # Worker ichida: -> (yo'l, format, qatorlar, ustunlar, kataklar)
+    if fmt == "xlsx":
+        path = out_base + ".xlsx"
+        with open_lines(src, is_file) as lines:
+            try:
+                return (path, "xlsx") + to_xlsx(read_rows(lines), path)
+            except TooLarge as e:
+                log.info(f"Excel: {e}, falling back to CSV")
+                _remove(path)
+    path = out_base + ".csv"
+    with open_lines(src, is_file) as lines:
+        return (path, "csv") + to_csv(read_rows(lines), path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ExcelEngine:
+    def __init__(self, workers=EXCEL_WORKERS, fmt=EXCEL_FORMAT, spool=EXCEL_SPOOL):
+        self.workers = workers
+        self.fmt = fmt
+        self.spool = spool
+        self._pool = None
+        self._seq = 0
+        self.tables = 0
+        self.rows = 0
+        self.cells = 0
+        self.csv_fallbacks = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = make_executor("thread", self.workers, "excel")
+        return self._pool
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        await shutdown(pool)
+
+    def _base(self, user_id):
+        os.makedirs(self.spool, exist_ok=True)
+        self._seq += 1
+        return os.path.join(self.spool, f"{user_id}_{os.getpid()}_{self._seq}")
+
+    async def from_text(self, user_id, text):
+        self.bytes_in += len(text.encode())
+        return await self._convert(text, False, self._base(user_id))
+
+    async def from_stream(self, user_id, chunks, limit=EXCEL_MAX_BYTES):
+        # Yuklanayotgan fayl diskka bo'laklab yoziladi, keyin undan satrma-satr o'qiladi
+        base = self._base(user_id)
+        src = base + ".src"
+        size = 0
+        try:
+            with open(src, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > limit:
+                        raise TooLarge(f"file larger than {limit} bytes")
+                    await asyncio.to_thread(f.write, chunk)
+            self.bytes_in += size
+            return await self._convert(src, True, base)
+        finally:
+            _remove(src)
+
+    async def _convert(self, src, is_file, base):
+        t = time.perf_counter()
+        path, fmt, rows, cols, cells = await run_in(self.pool, convert, src, is_file, base, self.fmt)
+        self.seconds += time.perf_counter() - t
+        self.tables += 1
+        self.rows += rows
+        self.cells += cells
+        self.bytes_out += os.path.getsize(path)
+        if fmt != self.fmt:
+            self.csv_fallbacks += 1
+        return path, fmt, rows, cols
+
+    def remove(self, path):
+        _remove(path)
+
+    def stats(self):
+        return {"tables": self.tables, "rows": self.rows, "cells": self.cells,
+                "rows_per_sec": round(self.rows / self.seconds) if self.seconds else 0,
+                "csv_fallbacks": self.csv_fallbacks, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
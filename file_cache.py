@@ -0,0 +1,170 @@
+import os
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramBadRequest
+
+log = logging.getLogger(__name__)
+
+FILE_CACHE_DB    = os.environ.get("FILE_CACHE_DB", "file_ids.sqlite3")
+FILE_CACHE_ITEMS = int(os.environ.get("FILE_CACHE_ITEMS", "200000"))
+FILE_CACHE_TOUCH = int(os.environ.get("FILE_CACHE_TOUCH", "64"))     # shuncha topilgan kalit ts i bitta UPDATE da
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_ids (
+    digest  TEXT PRIMARY KEY,
+    kind    TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    size    INTEGER NOT NULL,
+    ts      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS file_ids_ts ON file_ids(ts);
+"""
+
+
+def content_key(kind, data):
+    return f"{kind}:{hashlib.sha256(data).hexdigest()}"
+
+
+def sent_file_id(message):
+    # Yuborilgan xabardan Telegram bergan file_id ni olamiz
+    if message.photo:
+        return message.photo[-1].file_id
+    for attr in ("audio", "document", "voice", "video", "animation"):
+        obj = getattr(message, attr, None)
+        if obj is not None:
+            return obj.file_id
+    return None
+
+
+# Yaratilgan fayllar (QR, TTS, rasmga matn) uchun kontent-xesh -> file_id keshi.
+# Bir xil baytlar qayta yuklanmaydi; SQLite orqali restartdan keyin ham saqlanadi. Topilgan
+# kalitlarning ts i to'plab yangilanadi (restartdan keyin ham LRU tartib), jadval max_items
+# bilan cheklanadi. Har safar boshqacha chiqadigan fayllar (vaqt yozilgan PDF) keshlanmaydi.
+class FileIdCache:
+    def __init__(self, path=FILE_CACHE_DB, max_items=FILE_CACHE_ITEMS):
+        self.path = path
+        self.max_items = max_items
+        self._db = None
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()           # eng eski (kam ishlatilgan) boshida
+        self._touched = set()               # bazada ts i hali yangilanmagan topilgan kalitlar
+        self.hits = 0
+        self.uploads = 0
+        self.stale = 0
+        self.bytes_saved = 0
+        self.bytes_uploaded = 0
+
+    def open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # Eng yangi max_items ta, lekin eskisidan yangisiga tartibda — chiqarish eng eskisidan boshlanadi
+        rows = self._db.execute(
+            "SELECT digest, file_id FROM (SELECT digest, file_id, ts FROM file_ids ORDER BY ts DESC LIMIT ?) "
+            "ORDER BY ts ASC", (self.max_items,))
+        self._ids = OrderedDict(rows.fetchall())
+        self._prune()
+        log.info(f"File id cache: {len(self._ids)} entries ({self.path})")
+
+    def close(self):
+        if self._db is not None:
+            self._touch(self._take_touched())
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def get(self, key):
+        file_id = self._ids.get(key)
+        if file_id is not None:
+            self._ids.move_to_end(key)
+            self._touched.add(key)
+        return file_id
+
+    async def touch(self):
+        # Topilgan kalitlar ts i bazaga (FILE_CACHE_TOUCH ta yig'ilganda)
+        if self._db is not None and len(self._touched) >= FILE_CACHE_TOUCH:
+            await asyncio.to_thread(self._touch, self._take_touched())
+
+    async def put(self, key, kind, file_id, size):
+        self._ids[key] = file_id
+        self._ids.move_to_end(key)
+        self._touched.discard(key)
+        evicted = None
+        if len(self._ids) > self.max_items:
+            evicted, _ = self._ids.popitem(last=False)
+            self._touched.discard(evicted)
+        if self._db is not None:
+            await asyncio.to_thread(self._write, key, kind, file_id, size, evicted)
+
+    async def drop(self, key):
+        self._ids.pop(key, None)
+        self._touched.discard(key)
+        if self._db is not None:
+            await asyncio.to_thread(self._delete, key)
+
+    def _write(self, key, kind, file_id, size, evicted=None):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO file_ids VALUES (?, ?, ?, ?, ?)",
+                             (key, kind, file_id, size, int(time.time())))
+            if evicted is not None:
+                # Xotiradan chiqarilgani bazadan ham — jadval max_items dan o'smaydi
+                self._db.execute("DELETE FROM file_ids WHERE digest = ?", (evicted,))
+
+    def _take_touched(self):
+        keys, self._touched = self._touched, set()
+        return keys
+
+    def _touch(self, keys):
+        if not keys:
+            return
+        now = int(time.time())
+        with self._lock, self._db:
+            self._db.executemany("UPDATE file_ids SET ts = ? WHERE digest = ?", [(now, k) for k in keys])
+
+    def _prune(self):
+        # Ochilishda: eng yangi max_items tadan tashqaridagilar (boshqa jarayonlar yozgani ham) o'chiriladi
+        with self._lock, self._db:
+            n = self._db.execute(
+                "DELETE FROM file_ids WHERE digest IN "
+                "(SELECT digest FROM file_ids ORDER BY ts DESC LIMIT -1 OFFSET ?)", (self.max_items,)).rowcount
+        if n:
+            log.info(f"File id cache: pruned {n} old entries")
+
+    def _delete(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM file_ids WHERE digest = ?", (key,))
+
+    async def send(self, kind, data, make_upload, send):
+        # send(media) — media: file_id (str) yoki yangi BufferedInputFile
+        key = content_key(kind, data)
+        file_id = self.get(key)
+        if file_id is not None:
+            try:
+                msg = await send(file_id)
+                self.hits += 1
+                self.bytes_saved += len(data)
+                await self.touch()
+                return msg
+            except TelegramBadRequest as e:
+                self.stale += 1
+                log.warning(f"File id cache: stale {kind} ({e})")
+                await self.drop(key)
+        msg = await send(make_upload())
+        self.uploads += 1
+        self.bytes_uploaded += len(data)
+        new_id = sent_file_id(msg)
+        if new_id:
+            await self.put(key, kind, new_id, len(data))
+        return msg
+
+    def stats(self):
+        total = self.hits + self.uploads
+        return {"size": len(self._ids), "hits": self.hits, "uploads": self.uploads, "stale": self.stale,
+                "bytes_saved": self.bytes_saved, "bytes_uploaded": self.bytes_uploaded,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
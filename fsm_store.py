@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+log = logging.getLogger(__name__)
+
+FSM_DB          = os.environ.get("FSM_DB", "fsm.sqlite3")
+FSM_IDLE_TTL    = float(os.environ.get("FSM_IDLE_TTL", str(14 * 86400)))
+FSM_CACHE_TTL   = float(os.environ.get("FSM_CACHE_TTL", "600"))
+FSM_FRESH_SEC   = float(os.environ.get("FSM_FRESH_SEC", "1"))      # shu vaqt ichida keshga tekshiruvsiz ishoniladi
+FSM_CACHE_ITEMS = int(os.environ.get("FSM_CACHE_ITEMS", "20000"))
+FSM_SWEEP_SEC   = float(os.environ.get("FSM_SWEEP_SEC", "3600"))
+FSM_CAS_RETRIES = int(os.environ.get("FSM_CAS_RETRIES", "8"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key     TEXT PRIMARY KEY,
+    state   TEXT,
+    data    TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    ts      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fsm_ts ON fsm(ts);
+"""
+
+
+class CASConflict(Exception):
+    pass
+
+
+def key_str(key):
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or 0}:{key.destiny}"
+
+
+class _Entry:
+    __slots__ = ("state", "data", "version", "seen")
+
+    def __init__(self, state, data, version):
+        self.state = state
+        self.data = data            # JSON matn — har o'qishda yangi nusxa
+        self.version = version
+        self.seen = time.monotonic()
+
+
+# SQLite (WAL) ustidagi FSM: yozish darhol bazaga, o'qish jarayon ichidagi keshdan.
+# Har bir kalitda versiya bor — barcha yozuvlar (set_state/set_data ham) update() orqali
+# o'qish-o'zgartirish-yozishni CAS bilan bajaradi, parallel handlerlar bir-birining o'zgarishini
+# yo'qotmaydi. FSM_FRESH_SEC dan eski kesh yozuvi arzon "SELECT version" bilan tekshiriladi —
+# boshqa jarayon yozgani yoki sweep o'chirgani darhol ko'rinadi.
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path=FSM_DB, idle_ttl=FSM_IDLE_TTL, cache_ttl=FSM_CACHE_TTL, cache_items=FSM_CACHE_ITEMS,
+                 fresh=FSM_FRESH_SEC):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.cache_ttl = cache_ttl
+        self.fresh = fresh
+        self.cache_items = cache_items
+        self._db = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._locks = {}          # key -> [Lock, kutayotganlar soni]
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.writes = 0
+        self.conflicts = 0
+        self.expired = 0
+
+    # ─── lifecycle ───────────────────────────────────────────────────────────
+    def open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        n = self._db.execute("SELECT COUNT(*) FROM fsm").fetchone()[0]
+        log.info(f"FSM storage: {n} keys ({self.path})")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweeper())
+
+    async def close(self):
+        # aiogram buni shutdown boshida, handlerlar tugashidan oldin chaqiradi — baza shutdown() da yopiladi
+        pass
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+        self._cache.clear()
+
+    # ─── kesh ────────────────────────────────────────────────────────────────
+    def _remember(self, k, entry):
+        entry.seen = time.monotonic()
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_items:
+            self._cache.popitem(last=False)
+
+    async def _load(self, k):
+        entry = self._cache.get(k)
+        if entry is not None:
+            age = time.monotonic() - entry.seen
+            if age < self.fresh:
+                self.hits += 1
+                self._cache.move_to_end(k)
+                return entry
+            if age < self.cache_ttl:
+                self.revalidated += 1
+                if await asyncio.to_thread(self._version, k) == entry.version:
+                    self.hits += 1
+                    self._remember(k, entry)
+                    return entry
+        self.misses += 1
+        row = await asyncio.to_thread(self._read, k)
+        entry = _Entry(*row) if row else _Entry(None, "{}", 0)
+        self._remember(k, entry)
+        return entry
+
+    def _version(self, k):
+        # Keshdagi yozuv hali joriymi: versiya (muddati o'tgan yoki yo'q kalit uchun 0/None)
+        with self._lock:
+            row = self._db.execute("SELECT version, ts FROM fsm WHERE key=?", (k,)).fetchone()
+        if row is None:
+            return 0
+        return None if row[1] < time.time() - self.idle_ttl else row[0]
+
+    def _read(self, k):
+        with self._lock:
+            row = self._db.execute("SELECT state, data, version, ts FROM fsm WHERE key=?", (k,)).fetchone()
+        if row is None:
+            return None
+        state, data, version, ts = row
+        if ts < time.time() - self.idle_ttl:
+            # Muddati o'tgan, hali o'chirilmagan — bo'sh holat, lekin versiya CAS uchun saqlanadi
+            return None, "{}", version
+        return state, data, version
+
+    # ─── yozish ──────────────────────────────────────────────────────────────
+    def _write(self, k, state, data, expected):
+        # Faqat versiya o'zgarmagan bo'lsa yoziladi (0 — kalit hali yo'q)
+        now = int(time.time())
+        with self._lock, self._db:
+            if expected == 0:
+                row = self._db.execute(
+                    "INSERT INTO fsm (key, state, data, version, ts) VALUES (?, ?, ?, 1, ?) "
+                    "ON CONFLICT(key) DO NOTHING RETURNING version",
+                    (k, state, data, now)).fetchone()
+            else:
+                row = self._db.execute(
+                    "UPDATE fsm SET state=?, data=?, version=version + 1, ts=? "
+                    "WHERE key=? AND version=? RETURNING version",
+                    (state, data, now, k, expected)).fetchone()
+            if row is None:
+                raise CASConflict(k)
+            return row[0]
+
+    async def _store(self, k, state, data, expected):
+        version = await asyncio.to_thread(self._write, k, state, data, expected)
+        self.writes += 1
+        self._remember(k, _Entry(state, data, version))
+
+    async def update(self, key, fn, state=...):
+        # fn(data) -> yangi data (nusxa beriladi, joyida o'zgartirish mumkin).
+        # Versiya o'zgargan bo'lsa bazadan qayta o'qib, fn qayta chaqiriladi.
+        # Jarayon ichida bitta kalit yozuvlari navbatga qo'yiladi; CAS boshqa jarayonlarga qarshi.
+        k = key_str(key)
+        slot = self._locks.get(k)
+        if slot is None:
+            slot = self._locks[k] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                for _ in range(FSM_CAS_RETRIES):
+                    entry = await self._load(k)
+                    data = json.loads(entry.data)
+                    new = fn(data)
+                    if new is None:
+                        new = data
+                    try:
+                        await self._store(k, entry.state if state is ... else _state_name(state),
+                                          json.dumps(new, ensure_ascii=False), entry.version)
+                        return new
+                    except CASConflict:
+                        self.conflicts += 1
+                        self._cache.pop(k, None)
+                raise CASConflict(k)
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._locks[k]
+
+    # ─── BaseStorage ─────────────────────────────────────────────────────────
+    async def set_state(self, key, state=None):
+        name = _state_name(state)
+        await self.update(key, lambda d: d, state=name)
+
+    async def get_state(self, key):
+        return (await self._load(key_str(key))).state
+
+    async def set_data(self, key, data):
+        await self.update(key, lambda d: dict(data))
+
+    async def get_data(self, key):
+        return json.loads((await self._load(key_str(key))).data)
+
+    async def update_data(self, key, data):
+        # Standart get+set o'rniga atomar birlashtirish
+        return await self.update(key, lambda d: {**d, **data})
+
+    # ─── muddati o'tgan holatlar ─────────────────────────────────────────────
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(FSM_SWEEP_SEC)
+            try:
+                await self.sweep()
+            except Exception as e:
+                log.error(f"FSM sweep: {e}")
+
+    async def sweep(self):
+        now = time.monotonic()
+        for k in [k for k, e in self._cache.items() if now - e.seen >= self.cache_ttl]:
+            del self._cache[k]
+        n = await asyncio.to_thread(self._delete_idle)
+        self.expired += n
+        if n:
+            log.info(f"FSM storage: expired {n} idle keys")
+
+    def _delete_idle(self):
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM fsm WHERE ts<?", (int(time.time() - self.idle_ttl),)).rowcount
+
+    def stats(self):
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses, "revalidated": self.revalidated,
+                "writes": self.writes, "conflicts": self.conflicts, "expired": self.expired}
+
+
+def _state_name(state):
+    return state.state if isinstance(state, State) else state
+
+
+async def update_state_data(state, fn):
+    # FSMContext uchun qisqa yo'l: await update_state_data(state, lambda d: ...)
+    return await state.storage.update(state.key, fn)
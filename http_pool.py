@@ -0,0 +1,70 @@
+import os
+import logging
+
+import aiohttp
+
+log = logging.getLogger(__name__)
+
+# Har bir upstream uchun bitta uzoq yashovchi sessiya (keep-alive, DNS kesh)
+UPSTREAMS = {
+    "groq":   os.environ.get("GROQ_BASE_URL", "https://api.groq.com"),
+    "gemini": os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"),
+    "weather": os.environ.get("WEATHER_BASE_URL", "https://api.openweathermap.org"),
+}
+
+HTTP_LIMIT          = int(os.environ.get("HTTP_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE      = float(os.environ.get("HTTP_KEEPALIVE", "60"))
+HTTP_DNS_TTL        = int(os.environ.get("HTTP_DNS_TTL", "300"))
+HTTP_TIMEOUT        = float(os.environ.get("HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+
+_sessions = {}
+
+
+def _make_session(name):
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        use_dns_cache=True,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, sock_connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(base_url=UPSTREAMS[name], connector=connector, timeout=timeout)
+
+
+async def open_sessions():
+    for name in UPSTREAMS:
+        if name not in _sessions or _sessions[name].closed:
+            _sessions[name] = _make_session(name)
+    log.info(f"HTTP pools: {', '.join(UPSTREAMS)}")
+
+
+async def close_sessions():
+    for name, sess in list(_sessions.items()):
+        if not sess.closed:
+            await sess.close()
+    _sessions.clear()
+
+
+def session(name):
+    # main() ochmagan bo'lsa (masalan benchmark) birinchi chaqiruvda yaratiladi
+    sess = _sessions.get(name)
+    if sess is None or sess.closed:
+        sess = _sessions[name] = _make_session(name)
+    return sess
+
+
+def pool_stats():
+    out = {}
+    for name, sess in _sessions.items():
+        conn = sess.connector
+        if conn is None or sess.closed:
+            continue
+        in_use  = len(getattr(conn, "_acquired", ()))
+        idle    = sum(len(v) for v in getattr(conn, "_conns", {}).values())
+        waiting = sum(len(q) for q in getattr(conn, "_waiters", {}).values())
+        out[name] = {"open": in_use + idle, "in_use": in_use, "idle": idle, "waiting": waiting,
+                     "limit": conn.limit, "limit_per_host": conn.limit_per_host}
+    return out
@@ -0,0 +1,76 @@
+import os
+import asyncio
+import logging
+
+from caching import TTLCache, SingleFlight
+
+log = logging.getLogger(__name__)
+
+INLINE_DEBOUNCE   = float(os.environ.get("INLINE_DEBOUNCE", "0.7"))
+INLINE_CACHE_TTL  = float(os.environ.get("INLINE_CACHE_TTL", "900"))
+INLINE_CACHE_SIZE = int(os.environ.get("INLINE_CACHE_SIZE", "5000"))
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+# Inline so'rovlar: har bir harf uchun yangi update keladi. Foydalanuvchining oldingi
+# so'rovi bekor qilinadi, javob debounce oynasidan keyin olinadi, keshlanadi va
+# bir xil savollar bitta upstream so'rovga birlashtiriladi.
+class InlineAnswerer:
+    def __init__(self, fetch, debounce=INLINE_DEBOUNCE, ttl=INLINE_CACHE_TTL, maxsize=INLINE_CACHE_SIZE):
+        self._fetch = fetch
+        self.debounce = debounce
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight = SingleFlight(cancel_orphans=True)
+        self._pending = {}
+        self.queries = 0
+        self.debounced = 0
+
+    async def answer(self, user_id, text):
+        # None — bu so'rov yangirog'i bilan almashtirildi; "" — upstream javob bermadi
+        self.queries += 1
+        prev = self._pending.get(user_id)
+        if prev is not None and not prev.done():
+            prev.cancel()
+        task = asyncio.ensure_future(self._run(text))
+        self._pending[user_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                task.cancel()
+                raise
+            return None
+        finally:
+            if self._pending.get(user_id) is task:
+                del self._pending[user_id]
+
+    async def _run(self, text):
+        key = normalize_query(text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            await asyncio.sleep(self.debounce)
+        except asyncio.CancelledError:
+            self.debounced += 1
+            raise
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        return await self._flight.do(key, lambda: self._load(key, text))
+
+    async def _load(self, key, text):
+        reply = await self._fetch(text)
+        if reply:
+            self._cache.set(key, reply)
+        return reply or ""
+
+    def stats(self):
+        cache = self._cache.stats()
+        saved = self.debounced + cache["hits"] + self._flight.joined
+        return {"queries": self.queries, "upstream": self._flight.calls, "saved": saved,
+                "debounced": self.debounced, "cache_hits": cache["hits"], "coalesced": self._flight.joined,
+                "cancelled_upstream": self._flight.orphaned, "cache_size": cache["size"]}
@@ -0,0 +1,298 @@
+import io
+import os
+import copy
+import shutil
+import asyncio
+import logging
+import unicodedata
+
+from workers import make_executor, run_in, warm_pool, shutdown
+
+log = logging.getLogger(__name__)
+
+PDF_POOL     = os.environ.get("PDF_POOL", "process")
+PDF_WORKERS  = int(os.environ.get("PDF_WORKERS", "2"))
+PDF_PER_USER = int(os.environ.get("PDF_PER_USER", "1"))
+PDF_SPOOL    = os.environ.get("PDF_SPOOL", "pdf_spool")     # FSM_DB yonida: holat restartdan keyin qolsa, qismlar ham qoladi
+
+LINE_H = 7
+
+FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
+]
+FONT_FAMILY = "UniFont"
+
+# Worker jarayonida bir marta yuklanadigan shrift shabloni
+_font = None
+
+
+class FontTemplate:
+    # TTF bir marta parse qilinadi (cmap, kengliklar); har bir hujjatga faqat
+    # subset uchun yangi lazy TTFont biriktiriladi — fpdf uni chiqishda o'zgartiradi.
+    # Bu fpdf2 ning ichki tuzilmasiga (2.7.x: fonts[...] atributlari, SubsetMap) bog'liq — boshqa
+    # versiyada ular bo'lmasa har hujjatga oddiy add_font ishlatiladi.
+    FIELDS = ("i", "ttfont", "missing_glyphs", "subset")
+
+    def __init__(self, path):
+        from fpdf import FPDF
+        self.path = path
+        probe = FPDF()
+        probe.add_font(FONT_FAMILY, "", path)
+        self.proto = probe.fonts[FONT_FAMILY.lower()]
+        try:
+            from fontTools import ttLib
+            from fpdf.fonts import SubsetMap
+        except ImportError:
+            ttLib = SubsetMap = None
+        self._ttLib = ttLib
+        self._SubsetMap = SubsetMap
+        self.fast = SubsetMap is not None and all(hasattr(self.proto, f) for f in self.FIELDS)
+        self.data = None
+        if self.fast:
+            with open(path, "rb") as f:
+                self.data = f.read()
+        else:
+            log.warning("PDF font: unsupported fpdf2 internals, using add_font per document")
+
+    def attach(self, pdf):
+        if self.fast:
+            try:
+                self._attach_copy(pdf)
+                return
+            except (AttributeError, TypeError) as e:
+                log.warning(f"PDF font template: {e}, falling back to add_font")
+                self.fast = False
+        pdf.add_font(FONT_FAMILY, "", self.path)
+
+    def _attach_copy(self, pdf):
+        font = copy.copy(self.proto)
+        font.i = len(pdf.fonts) + 1
+        font.ttfont = self._ttLib.TTFont(io.BytesIO(self.data), recalcTimestamp=False, fontNumber=0, lazy=True)
+        font.hbfont = None
+        font.missing_glyphs = []
+        sbarr = "\x00 \r\n"
+        if pdf.str_alias_nb_pages:
+            sbarr += "0123456789" + pdf.str_alias_nb_pages
+        font.subset = self._SubsetMap(font, [ord(c) for c in sbarr])
+        pdf.fonts[FONT_FAMILY.lower()] = font
+
+
+def load_font():
+    global _font
+    if _font is not None:
+        return _font
+    for p in FONT_PATHS:
+        if os.path.exists(p):
+            try:
+                _font = FontTemplate(p)
+                return _font
+            except Exception as e:
+                log.warning(f"PDF font {p}: {e}")
+    _font = False
+    return _font
+
+
+def setup_font(pdf, size):
+    font = load_font()
+    if font:
+        try:
+            font.attach(pdf)
+            pdf.set_font(FONT_FAMILY, size=size)
+            return True
+        except Exception as e:
+            log.warning(f"PDF font attach: {e}")
+    pdf.set_font("Helvetica", size=size)
+    return False
+
+
+def to_ascii(text):
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def new_document(created):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=20)
+    pdf.add_page()
+    pdf.set_margins(20, 20, 20)
+    uni = setup_font(pdf, 12)
+    pdf.set_font_size(20)
+    pdf.set_text_color(30, 30, 30)
+    pdf.cell(0, 12, "Document", ln=True, align="C")
+    pdf.ln(2)
+    pdf.set_draw_color(80, 80, 80)
+    pdf.set_line_width(0.4)
+    pdf.line(20, pdf.get_y(), 190, pdf.get_y())
+    pdf.ln(4)
+    pdf.set_font_size(9)
+    pdf.set_text_color(130, 130, 130)
+    pdf.cell(0, 6, created, ln=True, align="R")
+    pdf.ln(4)
+    pdf.set_font_size(11)
+    pdf.set_text_color(30, 30, 30)
+    return pdf, uni
+
+
+def finish_document(pdf):
+    pdf.set_y(-15)
+    pdf.set_font_size(9)
+    pdf.set_text_color(160, 160, 160)
+    pdf.cell(0, 10, f"Page {pdf.page_no()}", align="C")
+    buf = io.BytesIO()
+    pdf.output(buf)
+    return buf.getvalue()
+
+
+def render_pdf(text, created):
+    # Worker ichida: to'liq hujjat -> PDF baytlari
+    pdf, uni = new_document(created)
+    if not uni:
+        text = to_ascii(text)
+    for line in text.split("\n"):
+        pdf.multi_cell(0, LINE_H, line if line else " ", new_x="LMARGIN", new_y="NEXT")
+    return finish_document(pdf)
+
+
+# ─── Qismma-qism tayyorlash ──────────────────────────────────────────────────
+# Har bir qism kelganda satrlarga bo'linadi (eng qimmat qism — multi_cell o'lchashlari)
+# va foydalanuvchining spool katalogiga alohida fayl bo'lib yoziladi. Yakunda faqat tayyor satrlar chiqariladi.
+_scratch = None
+
+
+def _layout_doc():
+    global _scratch
+    if _scratch is None:
+        _scratch = new_document("")
+    return _scratch
+
+
+def break_lines(text):
+    pdf, uni = _layout_doc()
+    if not uni:
+        text = to_ascii(text)
+    out = []
+    for line in text.split("\n"):
+        out += pdf.multi_cell(0, LINE_H, line if line else " ", dry_run=True, output="LINES")
+    return out
+
+
+def layout_part(path, text):
+    # Worker ichida: qismni satrlarga bo'lib, o'zining spool fayliga yozadi
+    lines = break_lines(text)
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data), len(lines)
+
+
+def emit_pdf(paths, created):
+    # Worker ichida: qismlarning tayyor satrlarini tartib bilan sahifalarga joylab, PDF chiqaradi
+    pdf, _ = new_document(created)
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        for line in data.decode("utf-8").split("\n")[:-1]:
+            pdf.cell(0, LINE_H, line, new_x="LMARGIN", new_y="NEXT")
+    return finish_document(pdf)
+
+
+class MissingParts(Exception):
+    # FSM da bor, lekin spool faylida yo'q qismlar (masalan disk restartda tozalangan)
+    def __init__(self, parts):
+        super().__init__(f"missing PDF parts: {parts}")
+        self.parts = parts
+
+
+# Har bir qism alohida fayl: qo'shish va bekor qilish bir-birining offsetiga bog'liq emas
+def spool_dir(user_id):
+    return os.path.join(PDF_SPOOL, str(user_id))
+
+
+def spool_path(user_id, part):
+    return os.path.join(spool_dir(user_id), f"{part}.lines")
+
+
+def spool_remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def spool_discard(user_id):
+    shutil.rmtree(spool_dir(user_id), ignore_errors=True)
+
+
+class PDFEngine:
+    def __init__(self, kind=PDF_POOL, workers=PDF_WORKERS, per_user=PDF_PER_USER):
+        self.kind = kind
+        self.workers = workers
+        self.per_user = per_user
+        self._pool = None
+        self._users = {}          # user_id -> [Semaphore, foydalanuvchilar soni]
+        self.rendered = 0
+        self.parts = 0
+        self.waited = 0
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = make_executor(self.kind, self.workers, "pdf", initializer=load_font)
+        return self._pool
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        await shutdown(pool)
+
+    async def warm(self):
+        # Workerlar ko'tarilganda initializer (load_font) shriftni ham tayyorlaydi
+        await warm_pool(self.pool, self.workers, "fpdf")
+
+    async def run(self, user_id, fn, *args):
+        # Bitta foydalanuvchining og'ir ishlari per_user tadan oshmaydi
+        slot = self._users.get(user_id)
+        if slot is None:
+            slot = self._users[user_id] = [asyncio.Semaphore(self.per_user), 0]
+        slot[1] += 1
+        try:
+            if slot[0].locked():
+                self.waited += 1
+            async with slot[0]:
+                return await run_in(self.pool, fn, *args)
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._users[user_id]
+
+    async def render(self, user_id, text, created):
+        pdf = await self.run(user_id, render_pdf, text, created)
+        self.rendered += 1
+        return pdf
+
+    async def add_part(self, user_id, part, text):
+        size, lines = await self.run(user_id, layout_part, spool_path(user_id, part), text)
+        self.parts += 1
+        return size, lines
+
+    async def finalize(self, user_id, parts, created):
+        paths = [spool_path(user_id, p) for p in parts]
+        missing = await asyncio.to_thread(lambda: [p for p, path in zip(parts, paths) if not os.path.exists(path)])
+        if missing:
+            raise MissingParts(missing)
+        pdf = await self.run(user_id, emit_pdf, paths, created)
+        self.rendered += 1
+        return pdf
+
+    async def drop_parts(self, user_id, parts):
+        await asyncio.to_thread(spool_remove, [spool_path(user_id, p) for p in parts])
+
+    async def discard(self, user_id):
+        await asyncio.to_thread(spool_discard, user_id)
+
+    def stats(self):
+        return {"rendered": self.rendered, "parts": self.parts, "waited": self.waited, "active_users": len(self._users),
+                "pool": self.kind, "workers": self.workers}
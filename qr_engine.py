@@ -0,0 +1,108 @@
+import os
+import io
+import zipfile
+import asyncio
+import logging
+
+from caching import BytesLRU, SingleFlight
+from workers import make_executor, run_in, warm_pool, shutdown
+
+log = logging.getLogger(__name__)
+
+QR_POOL        = os.environ.get("QR_POOL", "thread")
+QR_WORKERS     = int(os.environ.get("QR_WORKERS", "2"))
+QR_CACHE_BYTES = int(os.environ.get("QR_CACHE_BYTES", str(16 * 1024 * 1024)))
+QR_BATCH_MAX   = int(os.environ.get("QR_BATCH_MAX", "50"))
+
+def render_qr(payload, ec="M"):
+    # Worker ichida ishlaydi: QR matritsa + PNG kodlash (qrcode birinchi chaqiruvda yuklanadi)
+    import qrcode
+    from qrcode import constants
+    qr = qrcode.QRCode(version=None, error_correction=getattr(constants, f"ERROR_CORRECT_{ec}"), box_size=10, border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_many(payloads, ec="M"):
+    return [render_qr(p, ec) for p in payloads]
+
+
+def zip_pngs(items):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+        for i, png in enumerate(items, 1):
+            z.writestr(f"qr_{i:03d}.png", png)
+    return buf.getvalue()
+
+
+def batch_lines(text):
+    # Har bir qator alohida link bo'lsa yoki xabar "/batch" bilan boshlansa — ko'p QR
+    lines = [l.strip() for l in text.splitlines() if l.strip()]
+    if lines and lines[0].lower() == "/batch":
+        return lines[1:QR_BATCH_MAX + 1]
+    if len(lines) > 1 and all(l.startswith(("http://", "https://")) and " " not in l for l in lines):
+        return lines[:QR_BATCH_MAX]
+    return None
+
+
+class QREngine:
+    def __init__(self, kind=QR_POOL, workers=QR_WORKERS, cache_bytes=QR_CACHE_BYTES):
+        self.kind = kind
+        self.workers = workers
+        self._pool = None
+        self._cache = BytesLRU(cache_bytes)
+        self._flight = SingleFlight()
+        self.rendered = 0
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = make_executor(self.kind, self.workers, "qr")
+        return self._pool
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        await shutdown(pool)
+
+    async def warm(self):
+        await warm_pool(self.pool, self.workers, "qrcode", "PIL.Image", "PIL.PngImagePlugin")
+
+    async def render(self, payload, ec="M"):
+        key = (ec, payload)
+        png = self._cache.get(key)
+        if png is not None:
+            return png
+        return await self._flight.do(key, lambda: self._render(key))
+
+    async def _render(self, key):
+        ec, payload = key
+        png = await run_in(self.pool, render_qr, payload, ec)
+        self.rendered += 1
+        self._cache.set(key, png)
+        return png
+
+    async def render_batch(self, payloads, ec="M"):
+        out = [self._cache.get((ec, p)) for p in payloads]
+        todo = [p for p, png in zip(payloads, out) if png is None]
+        if todo:
+            # Workerlar soniga bo'lib, bir nechta bo'lakda parallel chizamiz
+            n = max(1, min(self.workers, len(todo)))
+            chunks = [todo[i::n] for i in range(n)]
+            results = await asyncio.gather(*(run_in(self.pool, render_many, c, ec) for c in chunks))
+            done = {}
+            for c, pngs in zip(chunks, results):
+                for p, png in zip(c, pngs):
+                    done[p] = png
+                    self._cache.set((ec, p), png)
+            self.rendered += len(done)
+            out = [png if png is not None else done[p] for p, png in zip(payloads, out)]
+        return out
+
+    def stats(self):
+        st = self._cache.stats()
+        st.update(rendered=self.rendered, pool=self.kind, workers=self.workers)
+        return st
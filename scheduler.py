@@ -0,0 +1,167 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+
+from aiogram.dispatcher.flags import get_flag
+
+log = logging.getLogger(__name__)
+
+SCHED_HEAVY       = int(os.environ.get("SCHED_HEAVY", "16"))
+SCHED_HEAVY_QUEUE = int(os.environ.get("SCHED_HEAVY_QUEUE", "64"))
+SCHED_CHAT_QUEUE  = int(os.environ.get("SCHED_CHAT_QUEUE", "100"))
+SCHED_SHED_AT     = int(os.environ.get("SCHED_SHED_AT", "32"))
+SCHED_INLINE      = int(os.environ.get("SCHED_INLINE", "4"))
+
+# Shu turdagi yangilanishlar chat bo'yicha navbatga qo'yiladi (FSM ni o'zgartiradiganlar)
+ORDERED = ("message", "edited_message", "callback_query")
+# Ortiqcha yuklamada birinchi bo'lib tashlanadi
+SHEDDABLE = ("inline_query", "chosen_inline_result")
+
+# Joriy yangilanishning chat navbatini bo'shatish (handler ichidan, Scheduler.release_chat)
+_release = contextvars.ContextVar("sched_release", default=None)
+
+
+# Yangilanishlar rejalashtiruvchisi:
+#  - bitta chatning yangilanishlari kelish tartibida ketma-ket, turli chatlar parallel (outer middleware);
+#  - og'ir handlerlar (flags={"heavy": True}: AI, PDF, TTS) umumiy chegaradan o'tadi (inner middleware);
+#  - og'ir navbatda shed_at dan ko'p kutayotgan bo'lsa inline so'rovlar faqat ajratilgan `inline` ta
+#    joy doirasida ishlanadi, ortig'i tashlanadi; og'ir navbat to'lsa og'ir handler o'rniga "band" javobi.
+class Scheduler:
+    def __init__(self, heavy=SCHED_HEAVY, heavy_queue=SCHED_HEAVY_QUEUE, chat_queue=SCHED_CHAT_QUEUE,
+                 shed_at=SCHED_SHED_AT, inline=SCHED_INLINE, on_busy=None):
+        self.heavy = heavy
+        self.heavy_queue = heavy_queue
+        self.chat_queue = chat_queue
+        self.shed_at = shed_at
+        self.inline = inline
+        self.inline_running = 0
+        self.released = 0
+        self.on_busy = on_busy              # async (event, data) — og'ir yoki chat navbati to'lganda
+        self._chats = {}                    # chat_id -> [Lock, navbatdagilar soni (ishlayotgani bilan), ogohlantirildi]
+        self._heavy = asyncio.Semaphore(heavy)
+        self.heavy_running = 0
+        self.heavy_waiting = 0
+        self.ordered = 0
+        self.chat_dropped = 0
+        self.shed = 0
+        self.busy = 0
+        self.heavy_done = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def overloaded(self):
+        return self.heavy_waiting >= self.shed_at
+
+    # ─── outer (update): chat bo'yicha tartib ───────────────────────────────
+    async def __call__(self, handler, event, data):
+        kind = event.event_type
+        if kind in SHEDDABLE:
+            if self.overloaded and self.inline_running >= self.inline:
+                self.shed += 1
+                return None
+            self.inline_running += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.inline_running -= 1
+        chat = data.get("event_chat")
+        if kind not in ORDERED or chat is None:
+            return await handler(event, data)
+        slot = self._chats.get(chat.id)
+        if slot is None:
+            slot = self._chats[chat.id] = [asyncio.Lock(), 0, False]
+        if slot[1] > self.chat_queue:
+            # Bitta chatdan flood: navbat cheksiz o'smaydi. Foydalanuvchiga bir marta (navbat
+            # bo'shaguncha) "band" javobi — qismlar jimgina yo'qolmaydi
+            self.chat_dropped += 1
+            log.warning(f"Chat {chat.id}: queue full ({slot[1]}), dropping {kind}")
+            if not slot[2] and self.on_busy:
+                slot[2] = True
+                await self.on_busy(event.event, data)
+            return None
+        slot[1] += 1
+        self.ordered += 1
+        held, queued = False, True
+
+        def release():
+            # Bir marta: handler ichidan erta (release_chat) yoki oxirida
+            nonlocal held, queued
+            if held:
+                held = False
+                slot[0].release()
+            if queued:
+                queued = False
+                slot[1] -= 1
+                if slot[1] == 0 and self._chats.get(chat.id) is slot:
+                    del self._chats[chat.id]
+
+        try:
+            await slot[0].acquire()
+            held = True
+            token = _release.set(release)
+            try:
+                return await handler(event, data)
+            finally:
+                _release.reset(token)
+        finally:
+            release()
+
+    def release_chat(self):
+        # Handler FSM/tarixga boshqa yozmaydigan uzoq qismga o'tdi (masalan TTS sintezi): chatning
+        # keyingi yangilanishlari (masalan "Orqaga") uning tugashini kutmaydi. Keyin holatga yozadigan
+        # handlerlar (AI suhbat — memory.push) buni chaqirmaydi
+        release = _release.get()
+        if release is not None:
+            self.released += 1
+            _release.set(None)
+            release()
+
+    # ─── inner (message / callback_query): og'ir handlerlar chegarasi ───────
+    async def heavy_gate(self, handler, event, data):
+        if not get_flag(data, "heavy"):
+            return await handler(event, data)
+        if self._heavy.locked() and self.heavy_waiting >= self.heavy_queue:
+            self.busy += 1
+            if self.on_busy:
+                await self.on_busy(event, data)
+            return None
+        started = time.monotonic()
+        self.heavy_waiting += 1
+        try:
+            await self._heavy.acquire()
+        finally:
+            self.heavy_waiting -= 1
+        waited = time.monotonic() - started
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self.heavy_running += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.heavy_running -= 1
+            self.heavy_done += 1
+            self._heavy.release()
+
+    def setup(self, dp):
+        dp.update.outer_middleware(self)
+        dp.message.middleware(self.heavy_gate)
+        dp.callback_query.middleware(self.heavy_gate)
+
+    def queue_len(self, chat_id):
+        slot = self._chats.get(chat_id)
+        return slot[1] if slot else 0
+
+    def stats(self, top=5):
+        lens = sorted(((n, c) for c, (_, n, _) in self._chats.items()), reverse=True)
+        return {"chats": len(lens), "queued": sum(n - 1 for n, _ in lens if n > 1),
+                "max_chat_queue": lens[0][0] if lens else 0,
+                "top": [(c, n) for n, c in lens[:top] if n > 1],
+                "ordered": self.ordered, "chat_dropped": self.chat_dropped,
+                "heavy_running": self.heavy_running, "heavy_limit": self.heavy,
+                "heavy_waiting": self.heavy_waiting, "heavy_done": self.heavy_done,
+                "wait_avg": round(self.wait_total / self.heavy_done, 3) if self.heavy_done else 0.0,
+                "wait_max": round(self.wait_max, 3), "busy": self.busy, "shed": self.shed,
+                "inline_running": self.inline_running, "released": self.released}
@@ -0,0 +1,67 @@
+import os
+import logging
+
+from caching import TTLCache, SingleFlight
+
+log = logging.getLogger(__name__)
+
+SUB_POS_TTL = float(os.environ.get("SUB_POS_TTL", "600"))
+SUB_NEG_TTL = float(os.environ.get("SUB_NEG_TTL", "30"))
+SUB_CACHE_SIZE = int(os.environ.get("SUB_CACHE_SIZE", "100000"))
+
+LEFT_STATUSES = ("left", "kicked", "banned")
+
+
+def is_member_status(status):
+    return str(getattr(status, "value", status)) not in LEFT_STATUSES
+
+
+# Kanal obunasi keshi: obunachilar uzoqroq, obuna bo'lmaganlar qisqa muddat saqlanadi.
+# fetch(user_id) -> bool; xatolikda fail-open (True), natija keshlanmaydi.
+class SubscriptionCache:
+    def __init__(self, fetch, pos_ttl=SUB_POS_TTL, neg_ttl=SUB_NEG_TTL, maxsize=SUB_CACHE_SIZE):
+        self._fetch = fetch
+        self.pos_ttl = pos_ttl
+        self.neg_ttl = neg_ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=pos_ttl)
+        self._flight = SingleFlight()
+        self._stale = {}          # so'rov davomida kelgan invalidatsiyalar
+        self.errors = 0
+        self.invalidations = 0
+
+    async def check(self, user_id):
+        ok = self._cache.get(user_id)
+        if ok is not None:
+            return ok
+        return await self._flight.do(user_id, lambda: self._load(user_id))
+
+    async def _load(self, user_id):
+        self._stale[user_id] = False
+        try:
+            ok = await self._fetch(user_id)
+        except Exception as e:
+            self.errors += 1
+            log.warning(f"Subscription check {user_id}: {e}")
+            return True
+        finally:
+            stale = self._stale.pop(user_id, False)
+        if not stale:
+            self._cache.set(user_id, ok, self.pos_ttl if ok else self.neg_ttl)
+        return ok
+
+    def invalidate(self, user_id):
+        self.invalidations += 1
+        self._cache.pop(user_id)
+        if user_id in self._stale:
+            self._stale[user_id] = True
+
+    def update(self, user_id, status):
+        # chat_member yangilanishi — eng yangi holat, shuning uchun to'g'ridan-to'g'ri yoziladi
+        self.invalidate(user_id)
+        ok = is_member_status(status)
+        self._cache.set(user_id, ok, self.pos_ttl if ok else self.neg_ttl)
+
+    def stats(self):
+        st = self._cache.stats()
+        st.update(coalesced=self._flight.joined, errors=self.errors, invalidations=self.invalidations)
+        return st
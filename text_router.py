@@ -0,0 +1,278 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from upstream_limits import Overloaded
+
+log = logging.getLogger(__name__)
+
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.9"))
+HEDGE_DEFAULT    = float(os.environ.get("HEDGE_DEFAULT", "3"))
+HEDGE_MIN        = float(os.environ.get("HEDGE_MIN", "1.5"))
+HEDGE_MAX        = float(os.environ.get("HEDGE_MAX", "5"))
+BREAKER_FAILS    = int(os.environ.get("BREAKER_FAILS", "5"))
+BREAKER_RESET    = float(os.environ.get("BREAKER_RESET", "30"))
+
+
+class UpstreamError(Exception):
+    pass
+
+
+# Oxirgi javoblar kechikishi. Hedge yutqazib bekor qilingan so'rov o'tgan vaqti bilan yoziladi
+# (haqiqiy kechikish undan katta) — aks holda sekinlashgan provayder persentili pastga siljiydi
+class LatencyTracker:
+    def __init__(self, size=100, min_samples=20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, p):
+        if len(self._samples) < self.min_samples:
+            return None
+        data = sorted(self._samples)
+        return data[min(len(data) - 1, int(p * len(data)))]
+
+
+# closed -> (ketma-ket xatolar) -> open -> (reset vaqti) -> half-open -> bitta sinov
+class CircuitBreaker:
+    def __init__(self, fails=BREAKER_FAILS, reset=BREAKER_RESET):
+        self.fails = fails
+        self.reset = reset
+        self.state = "closed"
+        self._count = 0
+        self._opened = 0.0
+        self._probe = False
+        self.trips = 0
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened >= self.reset:
+            self.state = "half-open"
+            self._probe = False
+        if self.state == "half-open" and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def cancelled(self):
+        # Sinov so'rovi bekor qilindi (hedge yutqazdi) — keyingisiga ruxsat
+        if self.state == "half-open":
+            self._probe = False
+
+    def success(self):
+        self.state = "closed"
+        self._count = 0
+        self._probe = False
+
+    def failure(self):
+        self._count += 1
+        if self.state == "half-open" or self._count >= self.fails:
+            if self.state != "open":
+                self.trips += 1
+                log.warning(f"Circuit breaker open after {self._count} failures")
+            self.state = "open"
+            self._opened = time.monotonic()
+            self._probe = False
+
+
+class Provider:
+    def __init__(self, name, call, stream=None):
+        self.name = name
+        self.call = call            # async (messages, lang, priority) -> str; xatoda UpstreamError
+        self.stream = stream        # ixtiyoriy async generator (messages, lang, priority) -> matn bo'laklari
+        self.latency = LatencyTracker()
+        self.first_token = LatencyTracker()
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+
+    async def run(self, messages, lang, priority):
+        self.calls += 1
+        t0 = time.monotonic()
+        try:
+            reply = await self.call(messages, lang, priority)
+        except asyncio.CancelledError:
+            self.latency.add(time.monotonic() - t0)
+            self.breaker.cancelled()
+            raise
+        except Overloaded:
+            # Mahalliy navbat to'lgan — provayder xatosi emas
+            raise
+        except Exception:
+            self.errors += 1
+            self.breaker.failure()
+            raise
+        if not reply:
+            self.errors += 1
+            self.breaker.failure()
+            raise UpstreamError(f"{self.name}: empty reply")
+        self.latency.add(time.monotonic() - t0)
+        self.breaker.success()
+        return reply
+
+    async def pump(self, messages, lang, priority, out):
+        # Oqim bo'laklari navbatga; oxirida None yoki xato obyekti
+        self.calls += 1
+        t0 = time.monotonic()
+        got = False
+        try:
+            async for delta in self.stream(messages, lang, priority):
+                if not delta:
+                    continue
+                if not got:
+                    # Birinchi bo'lak keldi — provayder ishlayapti
+                    got = True
+                    self.first_token.add(time.monotonic() - t0)
+                    self.breaker.success()
+                out.put_nowait(delta)
+            if not got:
+                raise UpstreamError(f"{self.name}: empty stream")
+        except asyncio.CancelledError:
+            if not got:
+                self.first_token.add(time.monotonic() - t0)
+            self.breaker.cancelled()
+            raise
+        except Overloaded as e:
+            out.put_nowait(e)
+            return
+        except Exception as e:
+            self.errors += 1
+            self.breaker.failure()
+            out.put_nowait(e)
+            return
+        out.put_nowait(None)
+
+
+# Asosiy provayder o'rganilgan persentildan sekin bo'lsa, zaxiraga "hedge" so'rov yuboriladi;
+# birinchi kelgan javob olinadi, ikkinchisi bekor qilinadi. Kechikish HEDGE_MAX bilan cheklanadi.
+class TextRouter:
+    def __init__(self, primary, secondary, percentile=HEDGE_PERCENTILE):
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def hedge_delay(self, latency=None):
+        p = (latency or self.primary.latency).percentile(self.percentile)
+        if p is None:
+            return HEDGE_DEFAULT
+        return min(HEDGE_MAX, max(HEDGE_MIN, p))
+
+    async def complete(self, messages, lang, priority=0):
+        primary, secondary = self.primary, self.secondary
+        if not primary.breaker.allow():
+            if not secondary.breaker.allow():
+                raise UpstreamError("all providers open")
+            self.failovers += 1
+            reply = await secondary.run(messages, lang, priority)
+            secondary.wins += 1
+            return reply
+        first = asyncio.ensure_future(primary.run(messages, lang, priority))
+        tasks = {first: primary}
+        errors = []
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if done:
+                if first.exception() is None:
+                    primary.wins += 1
+                    return first.result()
+                errors.append(first.exception())
+                tasks.clear()
+            # Zaxira faqat kerak bo'lganda so'raladi (half-open sinovini behuda sarflamaslik uchun)
+            if secondary.breaker.allow():
+                if done:
+                    self.failovers += 1
+                else:
+                    hedged = True
+                    self.hedges += 1
+                tasks[asyncio.ensure_future(secondary.run(messages, lang, priority))] = secondary
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    prov = tasks.pop(t)
+                    if t.exception() is None:
+                        prov.wins += 1
+                        if hedged and prov is secondary:
+                            self.hedge_wins += 1
+                        return t.result()
+                    errors.append(t.exception())
+            if all(isinstance(e, Overloaded) for e in errors):
+                raise errors[0]
+            raise UpstreamError("; ".join(str(e) for e in errors))
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def stream(self, messages, lang, priority=0):
+        # Oqimli javob: asosiy provayderning birinchi bo'lagi hedge_delay ichida kelmasa zaxiraga
+        # oddiy so'rov ketadi, birinchi kelgani yutadi (zaxira javobi bitta bo'lak bo'lib keladi).
+        # Birinchi bo'lakgacha xato — zaxiraga failover; oqim boshlangandan keyingi xato chaqiruvchiga.
+        primary, secondary = self.primary, self.secondary
+        if primary.stream is None or not primary.breaker.allow():
+            yield await self.complete(messages, lang, priority)
+            return
+        out = asyncio.Queue()
+        pump = asyncio.ensure_future(primary.pump(messages, lang, priority, out))
+        first = asyncio.ensure_future(out.get())
+        backup = None
+        hedged = False
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_delay(primary.first_token))
+            if not done and secondary.breaker.allow():
+                hedged = True
+                self.hedges += 1
+                backup = asyncio.ensure_future(secondary.run(messages, lang, priority))
+                await asyncio.wait({first, backup}, return_when=asyncio.FIRST_COMPLETED)
+                if backup.done() and backup.exception() is None:
+                    secondary.wins += 1
+                    self.hedge_wins += 1
+                    yield backup.result()
+                    return
+            item = await first
+            if isinstance(item, Exception):
+                if backup is None:
+                    if not secondary.breaker.allow():
+                        raise item
+                    self.failovers += 1
+                    backup = asyncio.ensure_future(secondary.run(messages, lang, priority))
+                try:
+                    reply = await backup
+                except Exception as e:
+                    if isinstance(item, Overloaded) and isinstance(e, Overloaded):
+                        raise item
+                    raise UpstreamError(f"{item}; {e}") from e
+                secondary.wins += 1
+                if hedged:
+                    self.hedge_wins += 1
+                yield reply
+                return
+            if backup is not None:
+                backup.cancel()
+            primary.wins += 1
+            while item is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                item = await out.get()
+        finally:
+            for t in (first, pump, backup):
+                if t is not None:
+                    t.cancel()
+
+    def stats(self):
+        out = {"hedges": self.hedges, "hedge_wins": self.hedge_wins, "failovers": self.failovers,
+               "hedge_delay": round(self.hedge_delay(), 2)}
+        for p in (self.primary, self.secondary):
+            out[p.name] = {"calls": p.calls, "errors": p.errors, "wins": p.wins, "breaker": p.breaker.state,
+                           "p95": round(p.latency.percentile(0.95) or 0.0, 2),
+                           "first_token": round(p.first_token.percentile(self.percentile) or 0.0, 2)}
+        return out
@@ -0,0 +1,144 @@
+import io
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+
+from caching import BytesLRU
+from workers import make_executor, run_in, warm_pool, shutdown
+
+log = logging.getLogger(__name__)
+
+TTS_BACKEND     = os.environ.get("TTS_BACKEND", "gtts")
+TTS_SEGMENT     = int(os.environ.get("TTS_SEGMENT", "300"))
+TTS_FANOUT      = int(os.environ.get("TTS_FANOUT", "4"))
+TTS_WORKERS     = int(os.environ.get("TTS_WORKERS", "8"))
+TTS_CACHE_BYTES = int(os.environ.get("TTS_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+LANG_MAP = {"uz": "tr", "ru": "ru", "en": "en"}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…;:])\s+|\n+")
+_CLAUSE_RE   = re.compile(r"(?<=[,–—])\s+")
+
+
+def normalize_segment(text):
+    return " ".join(text.split())
+
+
+def _pack(pieces, limit, sep=" "):
+    out, cur = [], ""
+    for p in pieces:
+        if not cur:
+            cur = p
+        elif len(cur) + len(sep) + len(p) <= limit:
+            cur += sep + p
+        else:
+            out.append(cur)
+            cur = p
+    if cur:
+        out.append(cur)
+    return out
+
+
+def split_segments(text, limit=TTS_SEGMENT):
+    # Gap chegarasida bo'lamiz; juda uzun gap vergul, so'ng bo'sh joy bo'yicha bo'linadi
+    pieces = []
+    for sent in _SENTENCE_RE.split(text):
+        sent = normalize_segment(sent)
+        if not sent:
+            continue
+        if len(sent) <= limit:
+            pieces.append(sent)
+            continue
+        for clause in _CLAUSE_RE.split(sent):
+            if len(clause) <= limit:
+                pieces.append(clause)
+            else:
+                words = [w[i:i + limit] for w in clause.split(" ") for i in range(0, len(w), limit)]
+                pieces.extend(_pack(words, limit))
+    return _pack(pieces, limit)
+
+
+def strip_id3(mp3):
+    # Segmentlarni ulashda ID3v2 sarlavha va ID3v1 dumini olib tashlaymiz
+    if mp3[:3] == b"ID3" and len(mp3) > 10:
+        size = (mp3[6] << 21) | (mp3[7] << 14) | (mp3[8] << 7) | mp3[9]
+        mp3 = mp3[10 + size:]
+    if len(mp3) >= 128 and mp3[-128:-125] == b"TAG":
+        mp3 = mp3[:-128]
+    return mp3
+
+
+class GTTSBackend:
+    name = "gtts"
+    modules = ("gtts",)
+
+    def synth(self, text, lang):
+        from gtts import gTTS
+        b = io.BytesIO()
+        gTTS(text=text, lang=LANG_MAP.get(lang, "en")).write_to_fp(b)
+        return b.getvalue()
+
+
+class StubBackend:
+    # Oflayn test/benchmark uchun: gTTS kabi har ~100 belgiga bitta "so'rov" kechikishi
+    name = "stub"
+    modules = ()
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def synth(self, text, lang):
+        if self.latency:
+            time.sleep(self.latency * (len(text) // 100 + 1))
+        frame = b"\xff\xfb\x90\x64" + hashlib.sha1(f"{lang}:{text}".encode()).digest()
+        return frame * (len(text) // 20 + 1)
+
+
+BACKENDS = {"gtts": GTTSBackend, "stub": StubBackend}
+
+
+class TTSEngine:
+    def __init__(self, backend=None, fanout=TTS_FANOUT, workers=TTS_WORKERS,
+                 segment=TTS_SEGMENT, cache_bytes=TTS_CACHE_BYTES):
+        self.backend = backend or BACKENDS[TTS_BACKEND]()
+        self.fanout = fanout
+        self.segment = segment
+        self.workers = workers
+        self._pool = make_executor("thread", workers, "tts")
+        self._cache = BytesLRU(cache_bytes)
+        self.segments = 0
+        self.synthesized = 0
+
+    async def close(self):
+        await shutdown(self._pool)
+
+    async def warm(self):
+        await warm_pool(self._pool, 1, *self.backend.modules)
+
+    async def synthesize(self, text, lang):
+        segs = split_segments(text, self.segment)
+        if not segs:
+            raise ValueError("empty text")
+        sem = asyncio.Semaphore(self.fanout)
+        parts = await asyncio.gather(*(self._segment(seg, lang, sem) for seg in segs))
+        self.segments += len(segs)
+        return parts[0] + b"".join(strip_id3(p) for p in parts[1:])
+
+    async def _segment(self, seg, lang, sem):
+        key = (lang, seg)
+        mp3 = self._cache.get(key)
+        if mp3 is not None:
+            return mp3
+        async with sem:
+            mp3 = await run_in(self._pool, self.backend.synth, seg, lang)
+        self.synthesized += 1
+        self._cache.set(key, mp3)
+        return mp3
+
+    def stats(self):
+        st = self._cache.stats()
+        st.update(backend=self.backend.name, segments=self.segments, synthesized=self.synthesized)
+        return st
@@ -0,0 +1,162 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from contextlib import asynccontextmanager
+
+log = logging.getLogger(__name__)
+
+# Navbat ustuvorligi: kichik son — oldinroq
+INTERACTIVE = 0
+INLINE      = 1
+BACKGROUND  = 2
+
+MAX_RETRY_WAIT = float(os.environ.get("UPSTREAM_MAX_RETRY_WAIT", "15"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+def _cfg(name, key, default):
+    return type(default)(os.environ.get(f"{name.upper()}_{key}", default))
+
+
+def retry_after_seconds(headers, default=1.0):
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+# Bitta upstream uchun: bir vaqtdagi so'rovlar chegarasi + token bucket + ustuvor navbat
+class Limiter:
+    def __init__(self, name, concurrency=8, rate=2.0, burst=10, max_queue=100):
+        self.name = name
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._inflight = 0
+        self._heap = []
+        self._seq = 0
+        self._timer = None
+        self.granted = 0
+        self.shed = 0
+        self.throttled_429 = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, name, concurrency, rate, burst, max_queue):
+        return cls(name, _cfg(name, "CONCURRENCY", concurrency), _cfg(name, "RPS", rate),
+                   _cfg(name, "BURST", burst), _cfg(name, "QUEUE", max_queue))
+
+    @property
+    def depth(self):
+        return sum(1 for item in self._heap if not item[2].done())
+
+    def _refill(self, now):
+        if self.rate <= 0:
+            self._tokens = float(self.burst)
+            return
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def _can_grant(self, now):
+        self._refill(now)
+        return self._inflight < self.concurrency and now >= self._paused_until and self._tokens >= 1
+
+    def _grant(self):
+        self._tokens -= 1
+        self._inflight += 1
+        self.granted += 1
+
+    async def acquire(self, priority=INTERACTIVE):
+        now = time.monotonic()
+        if not self._heap and self._can_grant(now):
+            self._grant()
+            return
+        if self.depth >= self.max_queue:
+            self.shed += 1
+            raise Overloaded(self.name)
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._heap, (priority, self._seq, fut))
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+        waited = time.monotonic() - now
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def release(self):
+        self._inflight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._heap and self._heap[0][2].done():
+            heapq.heappop(self._heap)
+        while self._heap and self._can_grant(now):
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.done():
+                continue
+            self._grant()
+            fut.set_result(None)
+        if self._heap and self._inflight < self.concurrency and self._timer is None:
+            delay = max(self._paused_until - now, (1 - self._tokens) / self.rate if self.rate else 1.0, 0.01)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority=INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def backoff(self, seconds):
+        self.throttled_429 += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        log.warning(f"{self.name}: 429, pausing {seconds:.1f}s")
+
+    def throttled(self, headers):
+        # 429 dan keyin: Retry-After bo'yicha to'xtaymiz; qisqa bo'lsa qayta urinish mumkin
+        wait = retry_after_seconds(headers)
+        self.backoff(wait)
+        return wait <= MAX_RETRY_WAIT
+
+    def stats(self):
+        return {"inflight": self._inflight, "depth": self.depth, "granted": self.granted,
+                "shed": self.shed, "429": self.throttled_429,
+                "wait_avg": round(self.wait_total / self.granted, 3) if self.granted else 0.0,
+                "wait_max": round(self.wait_max, 3)}
+
+
+limits = {
+    "groq_chat":    Limiter.from_env("groq_chat", 8, 2.0, 10, 100),
+    "groq_whisper": Limiter.from_env("groq_whisper", 4, 0.5, 5, 50),
+    "gemini":       Limiter.from_env("gemini", 4, 0.5, 5, 50),
+    "weather":      Limiter.from_env("weather", 4, 1.0, 20, 200),
+}
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import sqlite3
+import bisect
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+USERS_DB        = os.environ.get("USERS_DB", "users.sqlite3")
+USERS_FLUSH_SEC = float(os.environ.get("USERS_FLUSH_SEC", "2"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid      INTEGER PRIMARY KEY,
+    reg      INTEGER NOT NULL,
+    name     TEXT NOT NULL,
+    username TEXT NOT NULL,
+    lang     TEXT NOT NULL,
+    ts       INTEGER NOT NULL,
+    count    INTEGER NOT NULL,
+    active   INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS users_lang ON users(lang);
+CREATE INDEX IF NOT EXISTS users_reg  ON users(reg);
+"""
+
+NO_LANG = "—"
+
+# reg bazada beriladi (bir nechta jarayon bir xil raqam bermasligi uchun); til tanlanmagan ("—")
+# yozuv boshqa jarayon saqlagan tilni o'chirmaydi
+UPSERT = f"""
+INSERT INTO users (uid, reg, name, username, lang, ts, count, active)
+VALUES (?, (SELECT COALESCE(MAX(reg), -1) + 1 FROM users), ?, ?, ?, ?, ?, ?)
+ON CONFLICT(uid) DO UPDATE SET
+    name=excluded.name, username=excluded.username,
+    lang=CASE WHEN excluded.lang='{NO_LANG}' THEN users.lang ELSE excluded.lang END,
+    ts=excluded.ts, count=users.count + excluded.count, active=excluded.active
+"""
+COLUMNS = "uid, reg, name, username, lang, ts, count, active"
+
+
+class User:
+    # dict o'rniga __slots__ — har bir foydalanuvchi uchun kam xotira
+    __slots__ = ("uid", "reg", "name", "username", "lang", "ts", "count", "active")
+
+    def __init__(self, uid, reg, name, username, lang, ts, count, active=1):
+        self.uid = uid
+        self.reg = reg
+        self.name = name
+        self.username = username
+        self.lang = lang
+        self.ts = ts
+        self.count = count
+        self.active = active
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.ts).strftime("%d.%m.%Y %H:%M")
+
+    def row(self):
+        return (self.uid, self.reg, self.name, self.username, self.lang, self.ts, self.count, self.active)
+
+
+# SQLite (WAL) ustidagi foydalanuvchilar bazasi: xotirada indeks, diskka write-behind.
+# Bazani o'qish event loop dan tashqarida (to_thread); /stats raqamlari SQL da — barcha jarayonlar bo'yicha
+class UserStore:
+    def __init__(self, path=USERS_DB, flush_interval=USERS_FLUSH_SEC):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._db = None
+        self._lock = threading.Lock()
+        self._users = {}
+        self._order = []          # ro'yxatdan o'tish tartibi (reg bo'yicha)
+        self._dirty = {}          # uid -> yozilmagan count o'sishi
+        self._new = set()         # shu jarayonda yaratilgan, reg i hali bazadan olinmagan
+        self._task = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    # ─── lifecycle ───────────────────────────────────────────────────────────
+    def open(self, json_path=None):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        cols = {r[1] for r in self._db.execute("PRAGMA table_info(users)")}
+        if "active" not in cols:
+            self._db.execute("ALTER TABLE users ADD COLUMN active INTEGER NOT NULL DEFAULT 1")
+        if json_path and self._is_empty():
+            self._migrate_json(json_path)
+        for row in self._db.execute(f"SELECT {COLUMNS} FROM users ORDER BY reg"):
+            self._index(User(*row))
+        log.info(f"User store: {len(self._users)} users ({self.path})")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flusher())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+        await self.flush()
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    def _is_empty(self):
+        return self._db.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def _migrate_json(self, json_path):
+        # Bir martalik ko'chirish: users_db.json -> SQLite, so'ng fayl nomi o'zgartiriladi
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            log.error(f"User store migration: {e}")
+            return
+        rows = []
+        for uid, u in data.items():
+            try:
+                ts = int(datetime.strptime(u.get("date", ""), "%d.%m.%Y %H:%M").timestamp())
+            except ValueError:
+                ts = int(time.time())
+            rows.append((int(uid), u.get("name", ""), u.get("username", NO_LANG),
+                         u.get("lang", NO_LANG), ts, int(u.get("count", 0)), 1))
+        with self._db:
+            self._db.executemany(UPSERT, rows)
+        os.replace(json_path, json_path + ".migrated")
+        log.info(f"User store: migrated {len(rows)} users from {json_path}")
+
+    # ─── xotiradagi indekslar ────────────────────────────────────────────────
+    def _index(self, u, insort=False):
+        self._users[u.uid] = u
+        if insort:
+            bisect.insort(self._order, u.uid, key=lambda uid: self._users[uid].reg)
+        else:
+            self._order.append(u.uid)
+
+    def get(self, uid):
+        return self._users.get(int(uid))
+
+    async def touch(self, uid, name, username):
+        uid = int(uid)
+        u = self._users.get(uid)
+        if u is None and self._db is not None:
+            # Boshqa jarayon (webhook worker) ro'yxatdan o'tkazgan bo'lishi mumkin — avval bazadan
+            row = await asyncio.to_thread(self._read, uid)
+            # Kutish paytida shu jarayonda qo'shilgan bo'lishi mumkin
+            u = self._users.get(uid)
+            if u is None and row is not None:
+                u = User(*row)
+                self._index(u, insort=True)
+        now = int(time.time())
+        if u is None:
+            # reg vaqtincha; haqiqiy qiymat flush da bazadan olinadi
+            reg = self._users[self._order[-1]].reg + 1 if self._order else 0
+            u = User(uid, reg, name, username, NO_LANG, now, 0)
+            self._new.add(uid)
+            self._index(u)
+        u.name, u.username, u.ts = name, username, now
+        u.active = 1
+        u.count += 1
+        self._dirty[uid] = self._dirty.get(uid, 0) + 1
+        return u
+
+    def _read(self, uid):
+        with self._lock:
+            return self._db.execute(f"SELECT {COLUMNS} FROM users WHERE uid=?", (uid,)).fetchone()
+
+    def set_lang(self, uid, lang):
+        u = self._users.get(int(uid))
+        if u is None or u.lang == lang:
+            return
+        u.lang = lang
+        self._dirty.setdefault(u.uid, 0)
+
+    async def deactivate(self, uid):
+        # Botni bloklagan foydalanuvchi — nofaol; qayta yozsa touch() faollashtiradi.
+        # Bazada to'g'ridan-to'g'ri: foydalanuvchi shu jarayon xotirasida bo'lmasa ham
+        uid = int(uid)
+        u = self._users.get(uid)
+        if u is not None:
+            u.active = 0
+        if self._db is not None:
+            await asyncio.to_thread(self._deactivate, uid)
+
+    def _deactivate(self, uid):
+        with self._lock, self._db:
+            self._db.execute("UPDATE users SET active=0 WHERE uid=?", (uid,))
+
+    def active_count(self):
+        return sum(1 for u in self._users.values() if u.active)
+
+    def recipients(self, after=0, limit=1000):
+        # Bazadan uid bo'yicha sahifalab o'qiladi (keyset) — tarqatish uchun, boshqa jarayonlar yozganlari ham
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uid FROM users WHERE active=1 AND uid>? ORDER BY uid LIMIT ?", (after, limit)).fetchall()
+        return [r[0] for r in rows]
+
+    def recipient_count(self, after=0):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM users WHERE active=1 AND uid>?", (after,)).fetchone()[0]
+
+    def __len__(self):
+        # Faqat shu jarayon xotirasidagilar; umumiy son — summary()
+        return len(self._users)
+
+    def __iter__(self):
+        return (self._users[uid] for uid in self._order)
+
+    async def summary(self, last=10):
+        # /stats: jami, tillar va oxirgi ro'yxatdan o'tganlar — bazadan (barcha jarayonlar)
+        await self.flush()
+        return await asyncio.to_thread(self._summary, last)
+
+    def _summary(self, last):
+        with self._lock:
+            total = self._db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            langs = dict(self._db.execute("SELECT lang, COUNT(*) FROM users GROUP BY lang").fetchall())
+            rows = self._db.execute(f"SELECT {COLUMNS} FROM users ORDER BY reg DESC LIMIT ?", (last,)).fetchall()
+        return total, langs, [User(*r) for r in rows]
+
+    # ─── write-behind ────────────────────────────────────────────────────────
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f"User store flush: {e}")
+
+    async def flush(self):
+        if not self._dirty or self._db is None:
+            return
+        # count o'rniga o'sish yoziladi — bir nechta jarayon bitta bazani bo'lishsa ham to'g'ri
+        dirty, self._dirty = self._dirty, {}
+        new, self._new = self._new, set()
+        rows = []
+        for uid, delta in dirty.items():
+            u = self._users[uid]
+            rows.append((u.uid, u.name, u.username, u.lang, u.ts, delta, u.active))
+        try:
+            regs = await asyncio.to_thread(self._write, rows, new)
+        except Exception:
+            for uid, delta in dirty.items():
+                self._dirty[uid] = self._dirty.get(uid, 0) + delta
+            self._new |= new
+            raise
+        for uid, reg in regs:
+            self._users[uid].reg = reg
+
+    def _write(self, rows, new=()):
+        with self._lock, self._db:
+            self._db.executemany(UPSERT, rows)
+            regs = [self._db.execute("SELECT uid, reg FROM users WHERE uid=?", (uid,)).fetchone() for uid in new]
+        self.flushes += 1
+        self.rows_written += len(rows)
+        return [r for r in regs if r]
+
+    def stats(self):
+        return {"users": len(self._users), "active": self.active_count(), "dirty": len(self._dirty),
+                "flushes": self.flushes, "rows_written": self.rows_written}
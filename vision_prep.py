@@ -0,0 +1,67 @@
+import io
+import os
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+VISION_TARGET  = int(os.environ.get("VISION_TARGET", "1024"))
+VISION_QUALITY = int(os.environ.get("VISION_QUALITY", "85"))
+# Manba JPEG uzun tomoni target * SLACK gacha bo'lsa qayta kodlanmaydi
+VISION_SLACK   = float(os.environ.get("VISION_SLACK", "1.5"))
+
+
+def pick_photo_size(sizes, target=VISION_TARGET):
+    # Telegram PhotoSize ro'yxatidan target ga yetadigan eng kichigini tanlaymiz
+    ok = [p for p in sizes if max(p.width, p.height) >= target]
+    if ok:
+        return min(ok, key=lambda p: p.width * p.height)
+    return max(sizes, key=lambda p: p.width * p.height)
+
+
+def prepare_image(data, target=VISION_TARGET, quality=VISION_QUALITY, slack=VISION_SLACK):
+    # Worker ichida: kerak bo'lsa kichraytirib JPEG ga o'giradi; mos JPEG bo'lsa o'zgarishsiz
+    from PIL import Image
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG" and img.mode in ("RGB", "L") and max(img.size) <= target * slack:
+        return data, False
+    if img.format == "JPEG":
+        # DCT darajasida 1/2, 1/4, 1/8 ga kichraytirib dekodlash — to'liq o'lchamni yechmaydi
+        img.draft("RGB", (target, target))
+    img = img.convert("RGB")
+    if max(img.size) > target:
+        img.thumbnail((target, target), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), True
+
+
+class VisionPrep:
+    def __init__(self, target=VISION_TARGET):
+        self.target = target
+        self.requests = 0
+        self.reencoded = 0
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self.bytes_largest = 0      # eng katta o'lcham yuklanganda ketadigan baytlar
+
+    def pick(self, sizes):
+        return pick_photo_size(sizes, self.target)
+
+    async def prepare(self, data):
+        out, reencoded = await asyncio.to_thread(prepare_image, data, self.target)
+        if reencoded:
+            self.reencoded += 1
+        return out
+
+    def record(self, downloaded, uploaded, largest):
+        self.requests += 1
+        self.bytes_downloaded += downloaded
+        self.bytes_uploaded += uploaded
+        self.bytes_largest += largest or downloaded
+        log.info(f"Vision: downloaded={downloaded} B uploaded={uploaded} B (largest size {largest} B)")
+
+    def stats(self):
+        return {"requests": self.requests, "reencoded": self.reencoded,
+                "downloaded": self.bytes_downloaded, "uploaded": self.bytes_uploaded,
+                "saved": max(0, self.bytes_largest - self.bytes_downloaded)}
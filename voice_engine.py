@@ -0,0 +1,234 @@
+import os
+import zlib
+import struct
+import asyncio
+import logging
+
+from caching import TTLCache, SingleFlight
+from upstream_limits import INTERACTIVE
+
+log = logging.getLogger(__name__)
+
+VOICE_SPLIT_SEC     = float(os.environ.get("VOICE_SPLIT_SEC", "60"))
+VOICE_SEGMENT_SEC   = float(os.environ.get("VOICE_SEGMENT_SEC", "30"))
+VOICE_SILENCE_MS    = int(os.environ.get("VOICE_SILENCE_MS", "300"))
+VOICE_SILENCE_BYTES = int(os.environ.get("VOICE_SILENCE_BYTES", "12"))
+VOICE_FANOUT        = int(os.environ.get("VOICE_FANOUT", "4"))
+VOICE_CHUNK         = int(os.environ.get("VOICE_CHUNK", str(64 * 1024)))
+VOICE_CACHE_TTL     = float(os.environ.get("VOICE_CACHE_TTL", str(7 * 86400)))
+VOICE_CACHE_ITEMS   = int(os.environ.get("VOICE_CACHE_ITEMS", "20000"))
+
+RATE = 48000                # Ogg Opus granule — doim 48 kHz namunalar
+PAGE_PACKETS = 50           # yozishda bitta sahifadagi paketlar (~1 s)
+
+# Ogg CRC (polinom 0x04C11DB7, aks ettirilmagan) — zlib.crc32 orqali: baytlar va natija teskari bitlarda
+_REV8 = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+def ogg_crc(data):
+    crc = zlib.crc32(bytes(data).translate(_REV8), 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return int(f"{crc:032b}"[::-1], 2)
+
+
+def opus_samples(packet):
+    # TOC baytidan paket davomiyligi (48 kHz namunalarda), dekodlamasdan
+    if not packet:
+        return 0
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config & 3]
+    elif config < 16:
+        frame = (480, 960)[config & 1]
+    else:
+        frame = (120, 240, 480, 960)[config & 3]
+    code = toc & 3
+    if code == 0:
+        frames = 1
+    elif code < 3:
+        frames = 2
+    else:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 1
+    return frames * frame
+
+
+# Oqimdan Ogg sahifalarini o'qib, to'liq paketlarni qaytaradi (butun faylni yig'masdan)
+class OggReader:
+    def __init__(self):
+        self._buf = bytearray()
+        self._partial = bytearray()
+
+    def feed(self, chunk):
+        self._buf += chunk
+        out = []
+        while True:
+            if len(self._buf) < 27:
+                break
+            if self._buf[:4] != b"OggS":
+                raise ValueError("not an Ogg stream")
+            nsegs = self._buf[26]
+            if len(self._buf) < 27 + nsegs:
+                break
+            lacing = self._buf[27:27 + nsegs]
+            end = 27 + nsegs + sum(lacing)
+            if len(self._buf) < end:
+                break
+            pos = 27 + nsegs
+            for lace in lacing:
+                self._partial += self._buf[pos:pos + lace]
+                pos += lace
+                if lace < 255:
+                    out.append(bytes(self._partial))
+                    self._partial.clear()
+            del self._buf[:end]
+        return out
+
+
+def ogg_page(serial, seq, granule, packets, flags=0):
+    lacing = bytearray()
+    for p in packets:
+        n = len(p)
+        lacing += b"\xff" * (n // 255) + bytes([n % 255])
+    header = struct.pack("<4sBBqIIIB", b"OggS", 0, flags, granule, serial, seq, 0, len(lacing)) + lacing
+    page = bytearray(header + b"".join(packets))
+    page[22:26] = struct.pack("<I", ogg_crc(page))
+    return bytes(page)
+
+
+def ogg_stream(head, tags, packets, serial=1):
+    # Bo'lak mustaqil Ogg Opus fayl: sarlavhalar + paketlar, granule bo'lak boshidan
+    preskip = struct.unpack_from("<H", head, 10)[0] if len(head) >= 12 else 0
+    pages = [ogg_page(serial, 0, 0, [head], flags=0x02), ogg_page(serial, 1, 0, [tags])]
+    granule, seq = preskip, 2
+    for i in range(0, len(packets), PAGE_PACKETS):
+        group = packets[i:i + PAGE_PACKETS]
+        granule += sum(opus_samples(p) for p in group)
+        last = i + PAGE_PACKETS >= len(packets)
+        pages.append(ogg_page(serial, seq, granule, group, flags=0x04 if last else 0))
+        seq += 1
+    return b"".join(pages)
+
+
+async def split_at_silence(chunks, segment=VOICE_SEGMENT_SEC, duration=None, silence_ms=VOICE_SILENCE_MS,
+                           silence_bytes=VOICE_SILENCE_BYTES):
+    # Oqimdagi paketlarni bo'laklarga yig'adi: bo'lak `segment` s dan oshgach birinchi
+    # jimlikda (kichik Opus paketlar ketma-ketligi) kesiladi, 1.5 x segment da majburan.
+    # Oxirida yarim bo'lakdan kam qolsa kesilmaydi. Xotirada faqat joriy bo'lak turadi.
+    reader = OggReader()
+    head = tags = None
+    cur, cur_samples, quiet, done = [], 0, 0, 0
+    tail = int((duration - segment / 2) * RATE) if duration else None
+    target, hard, min_quiet = int(segment * RATE), int(segment * 1.5 * RATE), silence_ms * RATE // 1000
+    async for chunk in chunks:
+        for packet in reader.feed(chunk):
+            if head is None:
+                if not packet.startswith(b"OpusHead"):
+                    raise ValueError("not an Opus stream")
+                head = packet
+                continue
+            if tags is None:
+                tags = packet
+                continue
+            n = opus_samples(packet)
+            cur.append(packet)
+            cur_samples += n
+            quiet = quiet + n if len(packet) <= silence_bytes else 0
+            if tail is not None and done + cur_samples >= tail:
+                continue
+            if (cur_samples >= target and quiet >= min_quiet) or cur_samples >= hard:
+                yield ogg_stream(head, tags, cur), cur_samples / RATE
+                done += cur_samples
+                cur, cur_samples, quiet = [], 0, 0
+    if head is None or tags is None:
+        raise ValueError("truncated Ogg stream")
+    if cur:
+        yield ogg_stream(head, tags, cur), cur_samples / RATE
+
+
+# Ovozli xabarlarni matnga o'girish:
+#  - qisqa xabar Telegramdan yuklanayotgan oqim bilan to'g'ridan-to'g'ri Whisper ga uzatiladi;
+#  - uzun xabar oqimdan jimlik chegaralarida bo'laklanib, bo'laklar parallel yuboriladi;
+#  - natija file_unique_id bo'yicha keshlanadi (forward qilingan xabar qayta o'girilmaydi).
+class VoiceEngine:
+    def __init__(self, transcribe, split_sec=VOICE_SPLIT_SEC, segment=VOICE_SEGMENT_SEC, fanout=VOICE_FANOUT,
+                 cache_ttl=VOICE_CACHE_TTL, cache_items=VOICE_CACHE_ITEMS):
+        self.transcribe = transcribe    # async (open_stream, priority) -> str | None
+        self.split_sec = split_sec
+        self.segment = segment
+        self.fanout = fanout
+        self.cache = TTLCache(cache_items, cache_ttl)
+        self.flight = SingleFlight()
+        self.streamed = 0
+        self.split = 0
+        self.segments = 0
+        self.seconds = 0.0
+        self.fallbacks = 0
+
+    async def text(self, key, duration, open_stream, priority=INTERACTIVE):
+        # open_stream() — har chaqiruvda yangi async iterator (qayta urinish uchun)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        text = await self.flight.do(key, lambda: self._run(duration, open_stream, priority))
+        if text:
+            self.cache.set(key, text)
+        return text
+
+    async def _run(self, duration, open_stream, priority):
+        self.seconds += duration
+        if duration <= self.split_sec:
+            self.streamed += 1
+            return await self.transcribe(open_stream, priority)
+        try:
+            return await self._split(open_stream, duration, priority)
+        except ValueError as e:
+            # Ogg Opus emas — butunlay oqim bilan
+            log.warning(f"Voice split failed ({e}), streaming whole file")
+            self.fallbacks += 1
+            return await self.transcribe(open_stream, priority)
+
+    async def _split(self, open_stream, duration, priority):
+        self.split += 1
+        gate = asyncio.Semaphore(self.fanout)
+        tasks = []
+
+        async def one(body):
+            try:
+                return await self.transcribe(lambda: _once(body), priority)
+            finally:
+                gate.release()
+
+        try:
+            async for body, _ in split_at_silence(open_stream(), self.segment, duration):
+                # Parallel bo'laklar to'lgan bo'lsa yuklash ham kutadi — xotira chegaralangan
+                await gate.acquire()
+                tasks.append(asyncio.create_task(one(body)))
+                self.segments += 1
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            raise
+        if any(p is None for p in parts):
+            return None
+        return " ".join(p.strip() for p in parts if p and p.strip())
+
+    def stats(self):
+        st = self.cache.stats()
+        return {"cached": st["size"], "hits": st["hits"], "misses": st["misses"], "hit_rate": st["hit_rate"],
+                "coalesced": self.flight.joined, "streamed": self.streamed, "split": self.split,
+                "segments": self.segments, "seconds": round(self.seconds), "fallbacks": self.fallbacks}
+
+
+async def _once(body):
+    yield body
+
+
+async def file_chunks(path, chunk=VOICE_CHUNK):
+    # Lokal Bot API serveri fayl yo'lini beradi — diskdan bo'laklab o'qiymiz
+    with open(path, "rb") as f:
+        while True:
+            data = await asyncio.to_thread(f.read, chunk)
+            if not data:
+                break
+            yield data
@@ -0,0 +1,196 @@
+import io
+import os
+import logging
+from functools import lru_cache
+
+from caching import BytesLRU, SingleFlight
+from workers import make_executor, run_in, warm_pool, shutdown
+
+log = logging.getLogger(__name__)
+
+WM_POOL        = os.environ.get("WM_POOL", "thread")
+WM_WORKERS     = int(os.environ.get("WM_WORKERS", "2"))
+WM_QUALITY     = int(os.environ.get("WM_QUALITY", "88"))
+WM_MAX_SIDE    = int(os.environ.get("WM_MAX_SIDE", "2560"))
+WM_CACHE_BYTES = int(os.environ.get("WM_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSansBold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+REF_SIZE  = 100         # o'lchovlar shu o'lchamda olinib, chiziqli masshtablanadi
+SIZE_STEP = 4           # shrift o'lchamlari shu qadamga yaxlitlanadi — kesh chegaralangan
+MIN_SIZE  = 12
+MAX_WIDTH  = 0.9        # matn bloki: rasm kengligining ulushi
+MAX_HEIGHT = 0.35       # va balandligining ulushi
+
+
+@lru_cache(maxsize=None)
+def font_path():
+    for p in FONT_PATHS:
+        if os.path.exists(p):
+            return p
+    return None
+
+
+@lru_cache(maxsize=64)
+def get_font(size):
+    # TTF diskdan har o'lcham uchun bir marta o'qiladi (har worker/jarayonda o'z keshi)
+    from PIL import ImageFont
+    path = font_path()
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+
+def wrap(paragraphs, space, limit):
+    # Foydalanuvchi qo'ygan satr ko'chirishlari saqlanadi
+    lines = []
+    for words, widths in paragraphs:
+        cur, cur_w = [], 0.0
+        for word, w in zip(words, widths):
+            add = w if not cur else cur_w + space + w
+            if cur and add > limit:
+                lines.append(cur)
+                cur, add = [], w
+            cur.append(word)
+            cur_w = add
+        lines.append(cur)
+    return lines
+
+
+def split_long(words, widths, font, limit):
+    # Qatorga sig'magan so'z harflar bo'yicha bo'laklanadi (prefiks uzunligi ikkilik qidiruv bilan)
+    out, out_w = [], []
+    for word, w in zip(words, widths):
+        while w > limit and len(word) > 1:
+            lo, hi = 1, len(word) - 1
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if font.getlength(word[:mid]) <= limit:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            out.append(word[:lo])
+            out_w.append(font.getlength(word[:lo]))
+            word = word[lo:]
+            w = font.getlength(word)
+        out.append(word)
+        out_w.append(w)
+    return out, out_w
+
+
+def layout(text, width, height):
+    # Bir marta REF_SIZE da o'lchab, o'lcham hisoblanadi: kenglik chiziqli, balandlik satrlar soniga
+    # qarab kvadrat ildiz bo'yicha masshtablanadi. Sinab-kichraytirish sikli yo'q.
+    ref = get_font(REF_SIZE)
+    paragraphs = [(p.split(), [ref.getlength(w) for w in p.split()]) for p in text.splitlines() if p.strip()]
+    widths = [w for _, ws in paragraphs for w in ws]
+    space = ref.getlength(" ")
+    ascent, descent = ref.getmetrics()
+    line_h = (ascent + descent) * 1.15
+    max_w, max_h = width * MAX_WIDTH, height * MAX_HEIGHT
+
+    size = max(MIN_SIZE, width / 16)
+    k = size / REF_SIZE
+    if widths and max(widths) * k > max_w:
+        k = max_w / max(widths)
+    lines = wrap(paragraphs, space, max_w / k)
+    if len(lines) * line_h * k > max_h:
+        k *= (max_h / (len(lines) * line_h * k)) ** 0.5
+        lines = wrap(paragraphs, space, max_w / k)
+        if len(lines) * line_h * k > max_h:
+            k = max_h / (len(lines) * line_h)
+    size = max(MIN_SIZE, int(REF_SIZE * k) // SIZE_STEP * SIZE_STEP)
+    if size > REF_SIZE * k:
+        # MIN_SIZE dan kichraytirib bo'lmaydi: shu o'lchamda qaytadan, uzun so'zlar bo'linib joylanadi
+        limit = max_w * REF_SIZE / size
+        lines = wrap([split_long(words, ws, ref, limit) for words, ws in paragraphs], space, limit)
+    return size, [" ".join(l) for l in lines]
+
+
+def render_text(data, text, quality=WM_QUALITY, max_side=WM_MAX_SIDE):
+    # Worker ichida: dekodlash -> pastki qismga yarim shaffof fon va matn -> bitta JPEG kodlash
+    from PIL import Image, ImageDraw
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG" and max(img.size) > max_side:
+        img.draft("RGB", (max_side, max_side))
+    img = img.convert("RGB")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    w, h = img.size
+    size, lines = layout(text, w, h)
+    font = get_font(size)
+    ascent, descent = font.getmetrics()
+    line_h = int((ascent + descent) * 1.15)
+    pad = max(6, size // 3)
+    block = line_h * len(lines) + 2 * pad
+    top = max(0, h - block)
+    # Fon faqat matn ostidagi bo'lakda aralashtiriladi (butun rasm RGBA ga o'tkazilmaydi)
+    band = img.crop((0, top, w, h))
+    img.paste(Image.blend(band, Image.new("RGB", band.size, (0, 0, 0)), 0.45), (0, top))
+    draw = ImageDraw.Draw(img)
+    stroke = max(1, size // 18)
+    y = top + pad
+    for line in lines:
+        draw.text((w / 2, y), line, font=font, fill=(255, 255, 255), anchor="ma",
+                  stroke_width=stroke, stroke_fill=(0, 0, 0))
+        y += line_h
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+# "Rasmga matn": renderlash pulda, tayyor JPEG lar (rasm, matn) bo'yicha keshda
+class WatermarkEngine:
+    def __init__(self, kind=WM_POOL, workers=WM_WORKERS, quality=WM_QUALITY, cache_bytes=WM_CACHE_BYTES):
+        self.kind = kind
+        self.workers = workers
+        self.quality = quality
+        self._pool = None
+        self._cache = BytesLRU(cache_bytes)
+        self._flight = SingleFlight()
+        self.rendered = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = make_executor(self.kind, self.workers, "wm")
+        return self._pool
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        await shutdown(pool)
+
+    async def warm(self):
+        await warm_pool(self.pool, self.workers, "PIL.Image", "PIL.ImageDraw", "PIL.ImageFont", "PIL.JpegImagePlugin")
+
+    async def render(self, key, text, fetch):
+        # key — manba rasmning barqaror identifikatori (file_unique_id); fetch() faqat keshda yo'q bo'lsa
+        key = (key, text)
+        jpeg = self._cache.get(key)
+        if jpeg is not None:
+            return jpeg
+        return await self._flight.do(key, lambda: self._render(key, text, fetch))
+
+    async def _render(self, key, text, fetch):
+        data = await fetch()
+        jpeg = await run_in(self.pool, render_text, data, text, self.quality)
+        self.rendered += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(jpeg)
+        self._cache.set(key, jpeg)
+        return jpeg
+
+    def stats(self):
+        st = self._cache.stats()
+        st.update(rendered=self.rendered, bytes_in=self.bytes_in, bytes_out=self.bytes_out,
+                  pool=self.kind, workers=self.workers)
+        return st
@@ -0,0 +1,235 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from difflib import get_close_matches
+from functools import lru_cache
+
+from caching import TTLCache, SingleFlight
+
+log = logging.getLogger(__name__)
+
+WEATHER_TTL         = float(os.environ.get("WEATHER_TTL", "600"))
+WEATHER_STALE       = float(os.environ.get("WEATHER_STALE", "10800"))
+WEATHER_GRID        = float(os.environ.get("WEATHER_GRID", "0.1"))
+WEATHER_CACHE_ITEMS = int(os.environ.get("WEATHER_CACHE_ITEMS", "20000"))
+WEATHER_CITIES      = os.environ.get("WEATHER_CITIES", "")        # GeoNames citiesNNN.txt (ixtiyoriy)
+WEATHER_GEO_TTL     = float(os.environ.get("WEATHER_GEO_TTL", str(7 * 86400)))
+
+# Ichki indeks: nom, kenglik, uzunlik, vergul bilan boshqa yozilishlar (lotin/kirill/ingliz)
+CITIES = [
+    ("Toshkent", 41.311, 69.279, "tashkent, ташкент, тошкент, toshkent shahri"),
+    ("Samarqand", 39.654, 66.960, "samarkand, самарканд, самарқанд"),
+    ("Buxoro", 39.768, 64.456, "bukhara, bukhoro, бухара, бухоро"),
+    ("Andijon", 40.783, 72.344, "andijan, андижан, андижон"),
+    ("Namangan", 40.998, 71.673, "наманган"),
+    ("Farg'ona", 40.384, 71.784, "fergana, ferghana, fargona, фергана, фарғона"),
+    ("Qo'qon", 40.529, 70.943, "kokand, qoqon, коканд, қўқон"),
+    ("Marg'ilon", 40.471, 71.725, "margilan, margilon, маргилан, марғилон"),
+    ("Qarshi", 38.861, 65.789, "karshi, карши, қарши"),
+    ("Termiz", 37.224, 67.278, "termez, термез, термиз"),
+    ("Navoiy", 40.084, 65.379, "navoi, навои, навоий"),
+    ("Jizzax", 40.116, 67.842, "jizzakh, djizak, джизак, жиззах"),
+    ("Guliston", 40.490, 68.784, "gulistan, гулистан, гулистон"),
+    ("Urganch", 41.550, 60.631, "urgench, ургенч, урганч"),
+    ("Xiva", 41.378, 60.364, "khiva, хива"),
+    ("Nukus", 42.460, 59.610, "нукус"),
+    ("Chirchiq", 41.469, 69.582, "chirchik, чирчик, чирчиқ"),
+    ("Olmaliq", 40.845, 69.598, "almalyk, алмалык, олмалиқ"),
+    ("Angren", 41.017, 70.144, "ангрен"),
+    ("Bekobod", 40.221, 69.270, "bekabad, бекабад, бекобод"),
+    ("Nurafshon", 41.030, 69.357, "нурафшон"),
+    ("Denov", 38.267, 67.899, "denau, денау, денов"),
+    ("Shahrisabz", 39.058, 66.834, "shakhrisabz, шахрисабз, шаҳрисабз"),
+    ("Kattaqo'rg'on", 39.899, 66.256, "kattakurgan, каттакурган, каттақўрғон"),
+    ("Zarafshon", 41.573, 64.200, "zarafshan, зарафшан, зарафшон"),
+    ("Chimboy", 42.933, 59.775, "chimbay, чимбай, чимбой"),
+    ("Moskva", 55.756, 37.617, "moscow, москва"),
+    ("Sankt-Peterburg", 59.939, 30.316, "saint petersburg, st petersburg, санкт-петербург, петербург, питер"),
+    ("Olmaota", 43.238, 76.946, "almaty, алматы, олмаота"),
+    ("Astana", 51.169, 71.449, "астана"),
+    ("Bishkek", 42.875, 74.604, "бишкек"),
+    ("Dushanbe", 38.560, 68.774, "душанбе"),
+    ("Ashxobod", 37.960, 58.326, "ashgabat, ашхабад, ашхобод"),
+    ("Istanbul", 41.008, 28.978, "istanbul, стамбул, истанбул"),
+    ("Dubay", 25.205, 55.271, "dubai, дубай"),
+    ("Seul", 37.566, 126.978, "seoul, сеул"),
+    ("London", 51.507, -0.128, "лондон"),
+    ("Nyu-York", 40.713, -74.006, "new york, nyu york, нью-йорк"),
+]
+
+_CYR = dict(zip("абвгдеёжзийклмнопрстуфхцчшщъыьэюяўқғҳ",
+                ["a", "b", "v", "g", "d", "e", "yo", "j", "z", "i", "y", "k", "l", "m", "n", "o", "p", "r", "s",
+                 "t", "u", "f", "x", "ts", "ch", "sh", "sh", "", "i", "", "e", "yu", "ya", "o", "q", "g", "h"]))
+_APOS = re.compile(r"[ʻʼ‘’`´']")
+_DROP = re.compile(r"[^a-z0-9 ]+")
+_NOISE = {"shahri", "sh", "city", "gorod", "g", "shahar"}
+
+
+def normalize(name):
+    # Kirill -> lotin, apostrof/tire/tinish belgilar olib tashlanadi: "Farg'ona" == "Фарғона" == "fargona"
+    s = "".join(_CYR.get(ch, ch) for ch in _APOS.sub("", name.casefold()))
+    words = _DROP.sub(" ", s.replace("-", " ")).split()
+    return " ".join(w for w in words if w not in _NOISE)
+
+
+def bucket(lat, lon, grid=WEATHER_GRID):
+    # Koordinata katakchasi (~11 km 0.1 gradusda) — qo'shni foydalanuvchilar bitta kalitga tushadi
+    return round(lat / grid), round(lon / grid)
+
+
+# Shahar nomi -> koordinata, tarmoqsiz: ichki ro'yxat + ixtiyoriy GeoNames fayli
+class CityIndex:
+    def __init__(self, path=WEATHER_CITIES):
+        self.path = path
+        self._names = None
+        self._by_letter = {}
+        self._find = lru_cache(maxsize=4096)(self._lookup)
+
+    @property
+    def loaded(self):
+        return self._names is not None
+
+    def load(self):
+        # Katta fayl bo'lsa thread da chaqiriladi; indeks tayyor bo'lgach bir martada almashtiriladi
+        names = {}
+        for name, lat, lon, aliases in CITIES:
+            city = (name, lat, lon)
+            for alias in [name] + aliases.split(","):
+                _add(names, normalize(alias), city, 10 ** 9)
+        if self.path:
+            _load_geonames(names, self.path)
+        by_letter = {}
+        for key in names:
+            by_letter.setdefault(key[0], []).append(key)
+        self._by_letter, self._names = by_letter, names
+        log.info(f"Weather city index: {len(names)} names")
+
+    def __len__(self):
+        if not self.loaded:
+            self.load()
+        return len(self._names)
+
+    def find(self, name):
+        if not self.loaded:
+            self.load()
+        return self._find(normalize(name))
+
+    def _lookup(self, key):
+        # Aniq moslik, bo'lmasa xato yozilishga chidamli (birinchi harf bir xil) yaqin moslik
+        if not key:
+            return None
+        hit = self._names.get(key)
+        if hit is None:
+            near = get_close_matches(key, self._by_letter.get(key[0], ()), n=1, cutoff=0.8)
+            hit = self._names[near[0]] if near else None
+        return hit[0] if hit else None
+
+
+def _add(names, key, city, pop):
+    if not key:
+        return
+    cur = names.get(key)
+    # Bir xil nomli shaharlardan aholisi ko'prog'i
+    if cur is None or cur[1] < pop:
+        names[key] = (city, pop)
+
+
+def _load_geonames(names, path):
+    # geoname_id, name, asciiname, alternatenames, lat, lon, ..., population (14-ustun)
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                p = line.rstrip("\n").split("\t")
+                if len(p) < 15:
+                    continue
+                city = (p[1], float(p[4]), float(p[5]))
+                pop = int(p[14] or 0)
+                for alias in [p[1], p[2]] + p[3].split(","):
+                    _add(names, normalize(alias), city, pop)
+    except OSError as e:
+        log.warning(f"Weather cities file {path}: {e}")
+
+
+class WeatherError(Exception):
+    pass
+
+
+# Ob-havo: natija (katakcha, til) bo'yicha keshlanadi, bir vaqtdagi bir xil so'rovlar bitta upstream
+# chaqiruvga birlashtiriladi. Upstream xato bersa eskirgan (WEATHER_STALE ichidagi) natija qaytariladi.
+class WeatherService:
+    def __init__(self, fetch, geocode=None, index=None, ttl=WEATHER_TTL, stale=WEATHER_STALE, grid=WEATHER_GRID,
+                 cache_items=WEATHER_CACHE_ITEMS):
+        self.fetch = fetch          # async (lat, lon, lang) -> dict
+        self.geocode = geocode      # async (name) -> (name, lat, lon) | None; indeksda yo'q nomlar uchun
+        self.index = index or CityIndex()
+        self.ttl = ttl
+        self.grid = grid
+        self.cache = TTLCache(cache_items, stale)
+        self.geo_cache = TTLCache(cache_items, WEATHER_GEO_TTL)
+        self.flight = SingleFlight()
+        self.lookups = 0
+        self.upstream = 0
+        self.stale_served = 0
+        self.geocoded = 0
+        self.not_found = 0
+
+    async def warm(self):
+        if not self.index.loaded:
+            await asyncio.to_thread(self.index.load)
+
+    async def by_location(self, lat, lon, lang):
+        self.lookups += 1
+        return await self._get(bucket(lat, lon, self.grid), lang)
+
+    async def by_city(self, name, lang):
+        # -> (shahar nomi, ma'lumot) yoki None (topilmadi)
+        self.lookups += 1
+        await self.warm()
+        city = self.index.find(name)
+        if city is None and self.geocode:
+            city = await self._geocode(name)
+        if city is None:
+            self.not_found += 1
+            return None
+        name, lat, lon = city
+        return name, await self._get(bucket(lat, lon, self.grid), lang)
+
+    async def _geocode(self, name):
+        key = normalize(name)
+        if not key:
+            return None
+        if key in self.geo_cache:
+            return self.geo_cache.get(key)
+        city = await self.flight.do(("geo", key), lambda: self.geocode(name))
+        self.geocoded += 1
+        self.geo_cache.set(key, city)
+        return city
+
+    async def _get(self, cell, lang):
+        key = (cell, lang)
+        cached = self.cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        try:
+            return await self.flight.do(key, lambda: self._refresh(key))
+        except WeatherError:
+            if cached is None:
+                raise
+            self.stale_served += 1
+            return cached[1]
+
+    async def _refresh(self, key):
+        (y, x), lang = key
+        # Upstream katakcha markazi bilan so'raladi — katakchadagi hamma uchun bir xil javob
+        self.upstream += 1
+        data = await self.fetch(round(y * self.grid, 4), round(x * self.grid, 4), lang)
+        self.cache.set(key, (time.monotonic(), data))
+        return data
+
+    def stats(self):
+        st = self.cache.stats()
+        return {"lookups": self.lookups, "upstream": self.upstream, "cached": st["size"], "hits": st["hits"],
+                "coalesced": self.flight.joined, "stale": self.stale_served, "geocoded": self.geocoded,
+                "not_found": self.not_found}
@@ -0,0 +1,241 @@
+import os
+import json
+import signal
+import asyncio
+import logging
+import secrets
+import multiprocessing
+
+import aiohttp
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+BOT_MODE       = os.environ.get("BOT_MODE", "polling")         # polling | webhook
+WEBHOOK_URL    = os.environ.get("WEBHOOK_URL", "")              # https://example.com
+WEBHOOK_PATH   = os.environ.get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_HOST   = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT   = int(os.environ.get("WEBHOOK_PORT", os.environ.get("PORT", "8080")))
+WEB_WORKERS    = int(os.environ.get("WEB_WORKERS", "1"))
+WORKER_PORT    = int(os.environ.get("WEB_WORKER_PORT", "8100"))   # ichki portlar: WORKER_PORT + i
+DRAIN_TIMEOUT  = float(os.environ.get("DRAIN_TIMEOUT", "25"))
+MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# Ishlayotgan handlerlar soni (outer middleware) — to'xtashda shular tugashi kutiladi
+class Inflight:
+    def __init__(self):
+        self.count = 0
+        self.handled = 0
+        self.peak = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self, handler, event, data):
+        self.count += 1
+        self.peak = max(self.peak, self.count)
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            self.handled += 1
+            if self.count == 0:
+                self._idle.set()
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        if self.count:
+            log.info(f"Draining {self.count} in-flight updates (up to {timeout:.0f}s)")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            log.warning(f"Drain timeout: {self.count} updates still running")
+            return False
+
+    def stats(self):
+        return {"inflight": self.count, "peak": self.peak, "handled": self.handled}
+
+
+def update_owner(update):
+    # Bitta foydalanuvchining barcha yangilanishlari bitta workerga tushadi (FSM, keshlar)
+    for kind, body in update.items():
+        if not isinstance(body, dict):
+            continue
+        if kind in ("chat_member", "my_chat_member"):
+            return body.get("new_chat_member", {}).get("user", {}).get("id", 0)
+        owner = body.get("from") or body.get("user") or body.get("chat") or {}
+        if "id" in owner:
+            return owner["id"]
+    return update.get("update_id", 0)
+
+
+def check_secret(request):
+    # Secret har doim talab qilinadi (run() uni o'rnatmasdan server ishga tushmaydi)
+    if not WEBHOOK_SECRET:
+        return False
+    # Baytlar: str bilan ASCII bo'lmagan sarlavha TypeError (500) beradi
+    got = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+    return secrets.compare_digest(got, WEBHOOK_SECRET.encode())
+
+
+def ensure_secret():
+    # WEBHOOK_SECRET berilmagan bo'lsa har ishga tushishda yangisi yaratiladi va set_webhook bilan
+    # Telegramga beriladi; spawn qilingan workerlar uni muhit o'zgaruvchisidan oladi
+    global WEBHOOK_SECRET
+    if not WEBHOOK_SECRET:
+        WEBHOOK_SECRET = secrets.token_urlsafe(32)
+        os.environ["WEBHOOK_SECRET"] = WEBHOOK_SECRET
+        log.info("WEBHOOK_SECRET is not set, generated a random one for this run")
+
+
+def _stop_on_signals(stop):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+
+async def set_webhook(bot, allowed_updates):
+    # drop_pending_updates=False: deploy paytida to'plangan yangilanishlar yo'qolmaydi
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+        max_connections=MAX_CONNECTIONS,
+        drop_pending_updates=False,
+    )
+    log.info(f"Webhook set: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH} ({WEB_WORKERS} workers)")
+
+
+# ─── Worker: yangilanishni qabul qilib, fon vazifada dispatcher ga beradi ─────
+async def serve_worker(dp, bot, inflight, host, port, on_startup, on_shutdown, on_listening=None):
+    tasks = set()
+
+    async def handle(request):
+        if not check_secret(request):
+            return web.Response(status=401, text="Unauthorized")
+        if stop.is_set():
+            # To'xtayapmiz — Telegram keyinroq qayta yuboradi
+            return web.Response(status=503)
+        update = await request.json()
+        task = asyncio.create_task(dp.feed_raw_update(bot, update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return web.json_response({})
+
+    stop = asyncio.Event()
+    _stop_on_signals(stop)
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await on_startup()
+    try:
+        await site.start()
+        log.info(f"Webhook worker listening on {host}:{port}")
+        if on_listening:
+            await on_listening()
+        await stop.wait()
+    finally:
+        # Avval yangi so'rovlarni to'xtatamiz, keyin boshlanganlar tugashini kutamiz
+        await site.stop()
+        await inflight.drain()
+        await runner.cleanup()
+        await on_shutdown()
+        await bot.session.close()
+
+
+# ─── Front: secret tekshiradi va foydalanuvchi bo'yicha workerga uzatadi ─────
+async def serve_front(bot, allowed_updates, worker_target):
+    ctx = multiprocessing.get_context("spawn")
+    procs = [None] * WEB_WORKERS
+    stop = asyncio.Event()
+    pending = 0
+
+    def spawn(i):
+        p = ctx.Process(target=worker_target, args=(WORKER_PORT + i,), name=f"bot-worker-{i}", daemon=False)
+        p.start()
+        procs[i] = p
+        log.info(f"Worker {i} started (pid {p.pid}, port {WORKER_PORT + i})")
+
+    async def handle(request):
+        nonlocal pending
+        if not check_secret(request):
+            return web.Response(status=401, text="Unauthorized")
+        if stop.is_set():
+            return web.Response(status=503)
+        body = await request.read()
+        try:
+            i = update_owner(json.loads(body)) % WEB_WORKERS
+        except ValueError:
+            return web.Response(status=400)
+        pending += 1
+        try:
+            async with client.post(f"http://127.0.0.1:{WORKER_PORT + i}{WEBHOOK_PATH}", data=body,
+                                   headers={SECRET_HEADER: WEBHOOK_SECRET, "Content-Type": "application/json"}) as r:
+                return web.Response(status=r.status)
+        except aiohttp.ClientError:
+            # Worker ishga tushmoqda yoki qayta tug'ilmoqda — Telegram qayta yuboradi
+            return web.Response(status=503)
+        finally:
+            pending -= 1
+
+    async def supervise():
+        while not stop.is_set():
+            for i, p in enumerate(procs):
+                if not p.is_alive():
+                    log.error(f"Worker {i} exited with {p.exitcode}, restarting")
+                    spawn(i)
+            await asyncio.sleep(1)
+
+    for i in range(WEB_WORKERS):
+        spawn(i)
+    _stop_on_signals(stop)
+    client = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    log.info(f"Webhook front listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+    await set_webhook(bot, allowed_updates)
+    await bot.session.close()
+    watcher = asyncio.create_task(supervise())
+    try:
+        await stop.wait()
+    finally:
+        watcher.cancel()
+        await site.stop()
+        while pending:
+            await asyncio.sleep(0.05)
+        await runner.cleanup()
+        await client.close()
+        # Workerlar SIGTERM da o'z handlerlarini tugatib chiqadi
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            await asyncio.to_thread(p.join, DRAIN_TIMEOUT + 5)
+            if p.is_alive():
+                log.warning(f"{p.name} did not drain in time, killing")
+                p.kill()
+
+
+async def run(dp, bot, inflight, on_startup, on_shutdown, worker_target):
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL")
+    ensure_secret()
+    allowed = dp.resolve_used_update_types()
+    if WEB_WORKERS <= 1:
+        await serve_worker(dp, bot, inflight, WEBHOOK_HOST, WEBHOOK_PORT, on_startup, on_shutdown,
+                           on_listening=lambda: set_webhook(bot, allowed))
+    else:
+        await serve_front(bot, allowed, worker_target)
@@ -0,0 +1,33 @@
+import asyncio
+import importlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+# CPU og'ir ishlar uchun pul: "thread" yoki "process"
+def make_executor(kind, workers, name, initializer=None, initargs=()):
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name,
+                              initializer=initializer, initargs=initargs)
+
+
+async def shutdown(executor):
+    # Pul to'liq to'xtaguncha kutiladi (thread da — loop bloklanmaydi). wait=False bilan chiqishda
+    # ProcessPoolExecutor quvurlari yopilib ulgurmay "Bad file descriptor" beradi
+    if executor is not None:
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+async def run_in(executor, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def preload(*modules):
+    for name in modules:
+        importlib.import_module(name)
+
+
+async def warm_pool(executor, workers, *modules):
+    # Fonda: har bir worker ko'tariladi (initializer ham ishlaydi) va kutubxonalarni yuklab qo'yadi.
+    # Jarayon pulida import workerlarda bo'ladi — asosiy jarayonga og'ir kutubxona kirmaydi.
+    await asyncio.gather(*(run_in(executor, preload, *modules) for _ in range(workers)))